@@ -17,7 +17,9 @@ import errno
 import os
 import sys
 import fnmatch
+import traceback
 from datetime import datetime, timedelta
+from multiprocessing import Manager, Pool
 
 import constants
 from spacewalk.common.rhnConfig import CFG, initCFG, PRODUCT_NAME
@@ -34,12 +36,34 @@ from spacewalk.satellite_tools import reposync
 from spacewalk.satellite_tools import contentRemove
 from spacewalk.satellite_tools.download import ThreadedDownloader, ProgressBarLogger
 from spacewalk.satellite_tools.satCerts import get_certificate_info, verify_certificate_dates
-from spacewalk.satellite_tools.syncLib import log, log2disk, log2, initEMAIL_LOG, log2email, log2background
+from spacewalk.satellite_tools.syncLib import log, log2disk, log2, initEMAIL_LOG, log2email, log2background, \
+    dumpEMAIL_LOG
 from spacewalk.satellite_tools.repo_plugins import yum_src
 
 from common import CustomChannelSyncError, CountingPackagesError, verify_mappings, human_readable_size
 from repository import CdnRepositoryManager, CdnRepositoryNotFoundError
 
+# CdnSync instance syncing channels in pool worker processes (inherited by fork)
+_worker_cdnsync = None
+
+
+def _init_worker():
+    # parent closed its connection before forking, get own one
+    rhnSQL.initDB()
+
+
+def _sync_channel_worker(channel):
+    if _worker_cdnsync.email:
+        initEMAIL_LOG(reinit=1)
+    # pylint: disable=W0703
+    try:
+        cur_time, failed_packages = _worker_cdnsync._sync_channel(channel)
+    except Exception:
+        log2(0, 0, "ERROR: %s" % traceback.format_exc(), stream=sys.stderr)
+        rhnSQL.rollback()
+        cur_time, failed_packages = timedelta(), -1
+    return channel, cur_time, failed_packages, dumpEMAIL_LOG()
+
 
 class CdnSync(object):
     """Main class of CDN sync run."""
@@ -48,7 +72,7 @@ class CdnSync(object):
 
     def __init__(self, no_packages=False, no_errata=False, no_rpms=False, no_kickstarts=False,
                  log_level=None, mount_point=None, consider_full=False, force_kickstarts=False,
-                 force_all_errata=False, email=False, import_batch_size=None):
+                 force_all_errata=False, email=False, import_batch_size=None, workers=None):
 
         if log_level is None:
             log_level = 0
@@ -162,6 +186,10 @@ class CdnSync(object):
         families = h.fetchall_dict() or []
         self.entitled_families = [f['label'] for f in families]
         self.import_batch_size = import_batch_size
+        self.download_registry = None
+        if workers is None:
+            workers = CFG.CDNSYNC_WORKERS or 1
+        self.workers = int(workers)
 
     def _tree_available_channels(self):
         # collect all channel from available families
@@ -399,8 +427,37 @@ class CdnSync(object):
             # Assuming all trees have same install type
             sync.set_ks_install_type(kickstart_trees[0]['ks_install_type'])
         sync.set_urls_prefix(self.mount_point)
+        if self.download_registry is not None:
+            sync.set_download_registry(self.download_registry)
         return sync.sync()
 
+    def _sync_channels_concurrently(self, channels):
+        """Sync channels in self.workers processes sharing downloads of the same
+           packages. Yields (channel, time, failed_packages) as the syncs finish."""
+        global _worker_cdnsync
+        # Forked processes must not share the database connection
+        rhnSQL.closeDB()
+        manager = Manager()
+        pool = None
+        try:
+            self.download_registry = reposync.DownloadRegistry(manager)
+            _worker_cdnsync = self
+            pool = Pool(min(self.workers, len(channels)), initializer=_init_worker)
+            for (channel, cur_time, failed_packages, email_log) in \
+                    pool.imap_unordered(_sync_channel_worker, channels):
+                if email_log:
+                    log2email(0, email_log.rstrip('\n'), cleanYN=1)
+                yield channel, cur_time, failed_packages
+            pool.close()
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+            manager.shutdown()
+            _worker_cdnsync = None
+            self.download_registry = None
+            rhnSQL.initDB()
+
     def sync(self, channels=None):
         # If no channels specified, sync already synced channels
         if not channels:
@@ -456,8 +513,14 @@ class CdnSync(object):
 
         # Finally, sync channel content
         total_time = timedelta()
-        for channel in channels:
-            cur_time, failed_packages = self._sync_channel(channel)
+        if self.workers > 1 and len(channels) > 1:
+            log(0, "Syncing %d channels in %d processes." % (len(channels), min(self.workers, len(channels))))
+            start_time = datetime.now()
+            results = self._sync_channels_concurrently(sorted(channels))
+        else:
+            start_time = None
+            results = ((channel, ) + tuple(self._sync_channel(channel)) for channel in channels)
+        for (channel, cur_time, failed_packages) in results:
             if failed_packages < 0:
                 error_messages.append("Problems occurred during syncing channel %s. Please check "
                                       "/var/log/rhn/cdnsync/%s.log for the details\n" % (channel, channel))
@@ -468,8 +531,11 @@ class CdnSync(object):
             total_time += cur_time
             # Switch back to cdnsync log
             rhnLog.initLOG(self.log_path, self.log_level)
-            log2disk(0, "Sync of channel completed.")
+            log2disk(0, "Sync of channel %s completed." % channel)
 
+        if start_time is not None:
+            # channels were synced at the same time, sum of their times is not interesting
+            total_time = datetime.now() - start_time
         log(0, "Total time: %s" % str(total_time).split('.')[0])
 
         return error_messages
@@ -14,6 +14,7 @@
 #
 
 import os
+import threading
 
 try:
     import hashlib
@@ -92,3 +93,109 @@ def getStringChecksum(hashtype, s):
     h = getHashlibInstance(hashtype, False)
     h.update(s)
     return h.hexdigest()
+
+
+CHECKSUM_INDEX = "/var/cache/rhn/checksum_index.sqlite"
+
+
+class ChecksumIndex:
+
+    """Persistent index of file checksums, shared by the tools verifying
+    packages on disk. An entry is valid as long as the size, mtime and inode
+    of the file stay the same; otherwise the checksum gets computed again.
+    Any number of checksum types can be indexed per file.
+
+    sqlite connections may only be used by the thread which opened them, so
+    every thread gets a connection of its own.
+    """
+
+    def __init__(self, filename=CHECKSUM_INDEX):
+        self.filename = filename
+        self._local = threading.local()
+        self._failed = False
+
+    def _connect(self):
+        db = getattr(self._local, 'db', None)
+        if db is None and not self._failed:
+            try:
+                import sqlite3
+                dirname = os.path.dirname(self.filename)
+                if dirname and not os.path.isdir(dirname):
+                    os.makedirs(dirname)
+                db = sqlite3.connect(self.filename, timeout=60)
+                db.execute("pragma journal_mode = wal")
+                db.execute("pragma synchronous = normal")
+                db.execute("""
+                    create table if not exists checksums (
+                        path text not null,
+                        checksum_type text not null,
+                        size integer not null,
+                        mtime real not null,
+                        inode integer not null,
+                        checksum text not null,
+                        primary key (path, checksum_type))""")
+                db.commit()
+                self._local.db = db
+            except Exception:  # pylint: disable=W0703
+                # index is only an optimization, work without it
+                db = None
+                self._failed = True
+        return db
+
+    def _query(self, sql, *args):
+        db = self._connect()
+        if db is None:
+            return []
+        try:
+            ret = db.execute(sql, args).fetchall()
+            db.commit()
+            return ret
+        except Exception:  # pylint: disable=W0703
+            db.rollback()
+            return []
+
+    def get(self, hashtype, filename):
+        """ Checksum of filename, computed only if not indexed for its current
+            size, mtime and inode. Raises OSError if the file does not exist.
+        """
+        if hashtype == 'sha':
+            hashtype = 'sha1'
+        st = os.stat(filename)
+        path = os.path.abspath(filename)
+        rows = self._query("""select checksum from checksums
+                               where path = ? and checksum_type = ?
+                                 and size = ? and mtime = ? and inode = ?""",
+                           path, hashtype, st.st_size, st.st_mtime, st.st_ino)
+        if rows:
+            return str(rows[0][0])
+        checksum = getFileChecksum(hashtype, filename=filename)
+        self._set(path, hashtype, checksum, st)
+        return checksum
+
+    def set(self, filename, hashtype, checksum):
+        """ Index checksum known for filename (e.g. just verified when downloading) """
+        if hashtype == 'sha':
+            hashtype = 'sha1'
+        self._set(os.path.abspath(filename), hashtype, checksum, os.stat(filename))
+
+    def _set(self, path, hashtype, checksum, st):
+        # entries for the other checksum types are stale if the file changed
+        self._query("""delete from checksums
+                        where path = ?
+                          and (size != ? or mtime != ? or inode != ?)""",
+                    path, st.st_size, st.st_mtime, st.st_ino)
+        self._query("""insert or replace into checksums
+                       (path, checksum_type, size, mtime, inode, checksum)
+                       values (?, ?, ?, ?, ?, ?)""",
+                    path, hashtype, st.st_size, st.st_mtime, st.st_ino, checksum)
+
+    def remove(self, filename):
+        """ Forget all checksums of filename """
+        self._query("delete from checksums where path = ?", os.path.abspath(filename))
+
+    def close(self):
+        """ Closes the connection of the calling thread """
+        db = getattr(self._local, 'db', None)
+        if db is not None:
+            db.close()
+            self._local.db = None
@@ -27,7 +27,7 @@ from rhn.UserDictCase import UserDictCase
 # Now local module imports
 from spacewalk.common import rhnFlags
 from spacewalk.common import apache
-from spacewalk.common.rhnLog import log_debug, log_error, log_setreq
+from spacewalk.common.rhnLog import log_debug, log_error, log_setreq, log_flush
 from spacewalk.common.rhnTranslate import cat
 
 
@@ -204,7 +204,9 @@ class rhnApache:
         # clear the global flags
         rhnFlags.reset()
         timer(self.start_time)
-        return self._cleanup_request_processor()
+        ret = self._cleanup_request_processor()
+        log_flush()
+        return ret
 
     @staticmethod
     def logHandler(_req):
@@ -26,18 +26,36 @@ except ImportError:
     import pickle as cPickle
 import fcntl
 import sys
-from stat import ST_MTIME
-from errno import EEXIST
+import mmap
+import struct
+import threading
+import time
+import hashlib
+from stat import ST_MTIME, ST_INO, ST_SIZE, ST_UID, ST_GID, ST_MODE, S_IMODE
+from errno import EEXIST, ENOENT
 
 from spacewalk.common.rhnLib import timestamp
 
-from spacewalk.common.usix import raise_with_tb
+from spacewalk.common.usix import raise_with_tb, UnicodeType
 from spacewalk.common.fileutils import makedirs, setPermsPath
 
+try:
+    #  python 2
+    from cStringIO import StringIO as BytesIO
+except ImportError:
+    #  python3
+    from io import BytesIO
+
 # this is a constant I'm not too happy about but one way or another we have
 # to reserve our own shared memory space.
 CACHEDIR = "/var/cache/rhn"
 
+# Default storage for the module level functions and get_backend():
+# "files" keeps every entry in a file of its own, "packed" keeps all the
+# entries of a directory in a single pack file (see PackedCache).
+# Callers pass the cache_backend configuration option to override it.
+BACKEND = "files"
+
 
 def cleanupPath(path):
     """take ~taw/../some/path/$MOUNT_POINT/blah and make it sensible."""
@@ -67,8 +85,20 @@ def _unlock(fd):
 # The following functions expose this module as a dictionary
 
 
-def get(name, modified=None, raw=None, compressed=None, missing_is_null=1):
-    cache = __get_cache(raw, compressed)
+def get_backend(backend=None):
+    """ Return the raw cache object for the backend (defaults to BACKEND). """
+    if backend is None:
+        backend = BACKEND
+    if backend == "packed":
+        return PackedCache()
+    if backend != "files":
+        raise ValueError("Unknown cache backend %s" % backend)
+    return Cache()
+
+
+def get(name, modified=None, raw=None, compressed=None, missing_is_null=1,
+        backend=None):
+    cache = __get_cache(raw, compressed, backend)
 
     if missing_is_null:
         cache = NullCache(cache)
@@ -77,25 +107,25 @@ def get(name, modified=None, raw=None, compressed=None, missing_is_null=1):
 
 
 def set(name, value, modified=None, raw=None, compressed=None,
-        user='root', group='root', mode=int('0755', 8)):
+        user='root', group='root', mode=int('0755', 8), backend=None):
     # pylint: disable=W0622
-    cache = __get_cache(raw, compressed)
+    cache = __get_cache(raw, compressed, backend)
 
     cache.set(name, value, modified, user, group, mode)
 
 
-def has_key(name, modified=None):
-    cache = Cache()
+def has_key(name, modified=None, backend=None):
+    cache = get_backend(backend)
     return cache.has_key(name, modified)
 
 
-def delete(name):
-    cache = Cache()
+def delete(name, backend=None):
+    cache = get_backend(backend)
     cache.delete(name)
 
 
-def __get_cache(raw, compressed):
-    cache = Cache()
+def __get_cache(raw, compressed, backend=None):
+    cache = get_backend(backend)
     if compressed:
         cache = CompressedCache(cache)
     if not raw:
@@ -423,3 +453,630 @@ class NullCache:
     def set_file(self, name, modified=None, user='root', group='root',
                  mode=int('0755', 8)):
         return self.cache.set_file(name, modified, user, group, mode)
+
+
+#
+# Packed cache backend
+#
+# All the entries sharing the same directory part of their keys (a
+# namespace) are kept in three files of that directory instead of one file
+# per entry:
+#   __packed__.pack  - append-only data file: a header, followed by records
+#                      of (key, value, modified); a record without a value
+#                      marks a deleted key
+#   __packed__.idx   - memory-mapped open addressing hash table mapping the
+#                      key hashes to the offset of their latest record
+#   __packed__.lock  - serializes writers (exclusive) and readers (shared)
+#
+# The pack file is rewritten without the superseded records by compact(),
+# automatically once they take more space than the live ones.
+#
+
+_PACK_MAGIC = b'RHNP'
+# magic, generation
+_PACK_HEADER = struct.Struct('>4sQ')
+_RECORD_MAGIC = b'RHNR'
+# magic, key length, value length, modified
+_RECORD_HEADER = struct.Struct('>4sIIq')
+_DELETED = 0xffffffff
+_INDEX_MAGIC = b'RHNI'
+# magic, slots, used slots, pack generation, indexed pack size, live size
+_INDEX_HEADER = struct.Struct('>4sIIQQQ')
+# key hash, record offset + 1 (0 marks an empty slot)
+_INDEX_SLOT = struct.Struct('>QQ')
+_INDEX_MIN_SLOTS = 1024
+_COMPACT_MIN_SIZE = 1048576
+_PACK_NAME = "__packed__"
+
+# Open packs of this process, keyed by path
+_packs = {}
+_packs_lock = threading.Lock()
+
+
+def _key_hash(key):
+    return struct.unpack('>Q', hashlib.sha1(key).digest()[:8])[0]
+
+
+def _new_generation():
+    return struct.unpack('>Q', os.urandom(8))[0]
+
+
+class _Pack(object):
+
+    """
+    The pack and index files of a single PackedCache namespace.
+
+    The files are opened read-only until the pack is locked exclusively for
+    the first time, so that lookups work with read access only.
+    """
+
+    def __init__(self, path):
+        self.pack_fname = path + ".pack"
+        self.index_fname = path + ".idx"
+        self.lock_fname = path + ".lock"
+        # (user, group, mode) of the files created while locked, None to
+        # keep the ones of the existing pack
+        self.perms = None
+        self.writable = False
+
+        self.pack = None
+        self.index = None
+        self._index_ino = None
+        self.slots = 0
+        self.thread_lock = threading.RLock()
+        self.lock_fd = None
+
+    def _open_lock_file(self, writable):
+        """ Open the lock file, creating it if writable is set; returns
+            False if it is missing or not writable """
+        if self.lock_fd is not None:
+            if not writable or self.writable:
+                return True
+            os.close(self.lock_fd)
+            self.lock_fd = None
+        if not writable:
+            try:
+                self.lock_fd = os.open(self.lock_fname, os.O_RDONLY)
+            except OSError:
+                e = sys.exc_info()[1]
+                if e.errno != ENOENT:
+                    raise
+                return False
+            return True
+
+        dirname = os.path.dirname(self.lock_fname)
+        if not os.path.isdir(dirname):
+            user, group, mode = self.perms or ('root', 'root', int('0755', 8))
+            makedirs(dirname, mode, user, group)
+        try:
+            fd = os.open(self.lock_fname, os.O_RDWR | os.O_CREAT | os.O_EXCL,
+                         int('0644', 8))
+        except OSError:
+            e = sys.exc_info()[1]
+            if e.errno != EEXIST:
+                raise
+            fd = os.open(self.lock_fname, os.O_RDWR)
+        else:
+            self._set_perms(self.lock_fname)
+        self.lock_fd = fd
+        # reopen the pack and index for writing too
+        self._close()
+        self.writable = True
+        return True
+
+    # Locking
+
+    def acquire(self, exclusive=False, perms=None):
+        """
+        Lock the pack and make sure the open files are the current ones.
+        perms is the (user, group, mode) of files created by a writer.
+
+        Returns False if there is no pack file yet (for shared locks only).
+        """
+        self.thread_lock.acquire()
+        self.perms = perms
+        if exclusive:
+            try:
+                self._open_lock_file(True)
+            except:
+                self.thread_lock.release()
+                raise
+            fcntl.lockf(self.lock_fd, fcntl.LOCK_EX)
+            self._refresh(True)
+            return True
+
+        if not self._open_lock_file(False):
+            return False
+        fcntl.lockf(self.lock_fd, fcntl.LOCK_SH)
+        ret = self._refresh(False)
+        if ret is None:
+            # The index has to be repaired first; drop the shared lock
+            # rather than upgrading it, two upgrading readers would deadlock
+            _unlock(self.lock_fd)
+            if not os.access(self.lock_fname, os.W_OK):
+                # can't repair it, so there is nothing to read
+                return False
+            self._open_lock_file(True)
+            fcntl.lockf(self.lock_fd, fcntl.LOCK_EX)
+            self._refresh(True)
+            ret = True
+        return ret
+
+    def release(self):
+        if self.lock_fd is not None:
+            _unlock(self.lock_fd)
+        self.perms = None
+        self.thread_lock.release()
+
+    def _set_perms(self, fname):
+        """ Apply the writer's ownership and mode to the new file fname, or
+            the ones of the pack file it replaces """
+        if self.perms is not None:
+            setPermsPath(fname, *self.perms)
+            return
+        try:
+            pack_stat = os.stat(self.pack_fname)
+        except OSError:
+            e = sys.exc_info()[1]
+            if e.errno != ENOENT:
+                raise
+            setPermsPath(fname, 'root', 'root', int('0755', 8))
+            return
+        if os.getuid() == 0:
+            os.chown(fname, pack_stat[ST_UID], pack_stat[ST_GID])
+        os.chmod(fname, S_IMODE(pack_stat[ST_MODE]))
+
+    def _refresh(self, exclusive):
+        """
+        Reopen the pack and index files if they were replaced by another
+        process. Returns None if a writer has to rebuild the index.
+        """
+        try:
+            pack_stat = os.stat(self.pack_fname)
+        except OSError:
+            e = sys.exc_info()[1]
+            if e.errno != ENOENT:
+                raise
+            self._close()
+            if not exclusive:
+                return False
+            self._create()
+            return True
+
+        if self.pack is None or \
+                os.fstat(self.pack.fileno())[ST_INO] != pack_stat[ST_INO]:
+            self._close()
+            self.pack = open(self.pack_fname, self._pack_mode(), 0)
+
+        if not self._map_index():
+            if not exclusive:
+                return None
+            self._rebuild_index()
+
+        if self._header()[4] < pack_stat[ST_SIZE]:
+            # Records appended by a writer which did not get to update
+            # the index
+            if not exclusive:
+                return None
+            self._scan(self._header()[4])
+        return True
+
+    def _pack_mode(self):
+        if self.writable:
+            return 'r+b'
+        return 'rb'
+
+    def _close(self):
+        if self.index is not None:
+            self.index.close()
+            self.index = None
+        if self.pack is not None:
+            self.pack.close()
+            self.pack = None
+
+    # Index
+
+    def _map_index(self):
+        """ Map the index file; returns False if it is missing or stale. """
+        if self.writable:
+            flags, access = os.O_RDWR, mmap.ACCESS_WRITE
+        else:
+            flags, access = os.O_RDONLY, mmap.ACCESS_READ
+        try:
+            fd = os.open(self.index_fname, flags)
+        except OSError:
+            e = sys.exc_info()[1]
+            if e.errno != ENOENT:
+                raise
+            return False
+        try:
+            if self.index is not None:
+                if os.fstat(fd)[ST_INO] == self._index_ino:
+                    return True
+                self.index.close()
+                self.index = None
+            size = os.fstat(fd)[ST_SIZE]
+            if size < _INDEX_HEADER.size:
+                return False
+            index = mmap.mmap(fd, size, access=access)
+            header = _INDEX_HEADER.unpack_from(index, 0)
+            if header[0] != _INDEX_MAGIC or \
+                    size != _INDEX_HEADER.size + header[1] * _INDEX_SLOT.size or \
+                    header[3] != self._generation():
+                index.close()
+                return False
+            self.index = index
+            self.slots = header[1]
+            self._index_ino = os.fstat(fd)[ST_INO]
+            return True
+        finally:
+            os.close(fd)
+
+    def _header(self):
+        return _INDEX_HEADER.unpack_from(self.index, 0)
+
+    def _set_header(self, used=None, indexed=None, live=None):
+        header = list(self._header())
+        if used is not None:
+            header[2] = used
+        if indexed is not None:
+            header[4] = indexed
+        if live is not None:
+            header[5] = live
+        _INDEX_HEADER.pack_into(self.index, 0, *header)
+
+    def _write_index(self, fname, slots, generation, entries, indexed, live):
+        """ Write a new index file from a list of (hash, offset) entries. """
+        table = bytearray(_INDEX_HEADER.size + slots * _INDEX_SLOT.size)
+        _INDEX_HEADER.pack_into(table, 0, _INDEX_MAGIC, slots, len(entries),
+                                generation, indexed, live)
+        for key_hash, offset in entries:
+            slot = key_hash % slots
+            while _INDEX_SLOT.unpack_from(table, _INDEX_HEADER.size +
+                                          slot * _INDEX_SLOT.size)[1]:
+                slot = (slot + 1) % slots
+            _INDEX_SLOT.pack_into(table, _INDEX_HEADER.size +
+                                  slot * _INDEX_SLOT.size, key_hash, offset + 1)
+        tmp_fname = "%s.%s" % (fname, os.getpid())
+        f = open(tmp_fname, 'wb')
+        f.write(table)
+        f.close()
+        self._set_perms(tmp_fname)
+        os.rename(tmp_fname, fname)
+
+    def _entries(self):
+        """ Return the (hash, offset) pairs stored in the index. """
+        entries = []
+        for slot in range(self.slots):
+            key_hash, offset = _INDEX_SLOT.unpack_from(
+                self.index, _INDEX_HEADER.size + slot * _INDEX_SLOT.size)
+            if offset:
+                entries.append((key_hash, offset - 1))
+        return entries
+
+    def _grow_index(self):
+        header = self._header()
+        self._write_index(self.index_fname, self.slots * 2, header[3],
+                          self._entries(), header[4], header[5])
+        self.index.close()
+        self.index = None
+        self._map_index()
+
+    def _rebuild_index(self):
+        if self.index is not None:
+            self.index.close()
+            self.index = None
+        if self._generation() is None:
+            # Not a pack file; start over
+            self._close()
+            self._create()
+            return
+        self._write_index(self.index_fname, _INDEX_MIN_SLOTS,
+                          self._generation(), [], _PACK_HEADER.size, 0)
+        self._map_index()
+        self._scan(_PACK_HEADER.size)
+
+    def _scan(self, offset):
+        """ Index the records of the pack file starting at offset. """
+        while 1:
+            record = self._read_record(offset)
+            if record is None:
+                break
+            key, value_len, _modified, value_offset = record
+            if value_len == _DELETED:
+                end = value_offset
+            else:
+                end = value_offset + value_len
+            self._index_record(key, offset, end - offset, value_len == _DELETED)
+            offset = end
+        # Drop whatever is left of a partially written record
+        self.pack.truncate(offset)
+        self._set_header(indexed=offset)
+
+    def _find(self, key):
+        """ Return (slot, offset) of the latest record for key. """
+        key_hash = _key_hash(key)
+        slot = key_hash % self.slots
+        while 1:
+            slot_hash, offset = _INDEX_SLOT.unpack_from(
+                self.index, _INDEX_HEADER.size + slot * _INDEX_SLOT.size)
+            if not offset:
+                return slot, None
+            if slot_hash == key_hash and self._read_record(offset - 1)[0] == key:
+                return slot, offset - 1
+            slot = (slot + 1) % self.slots
+
+    def _index_record(self, key, offset, size, deleted):
+        """ Point the index entry for key to the record at offset. """
+        header = self._header()
+        used, live = header[2], header[5]
+        slot, old_offset = self._find(key)
+        if old_offset is None:
+            used = used + 1
+        else:
+            old_key, old_len, _modified, old_value_offset = \
+                self._read_record(old_offset)
+            if old_len != _DELETED:
+                live = live - (old_value_offset + old_len - old_offset)
+        if not deleted:
+            live = live + size
+        _INDEX_SLOT.pack_into(self.index, _INDEX_HEADER.size +
+                              slot * _INDEX_SLOT.size, _key_hash(key), offset + 1)
+        self._set_header(used=used, live=live)
+        if used * 2 > self.slots:
+            self._grow_index()
+
+    # Pack file
+
+    def _create(self):
+        generation = _new_generation()
+        tmp_fname = "%s.%s" % (self.pack_fname, os.getpid())
+        f = open(tmp_fname, 'wb')
+        f.write(_PACK_HEADER.pack(_PACK_MAGIC, generation))
+        f.close()
+        self._set_perms(tmp_fname)
+        self._write_index(self.index_fname, _INDEX_MIN_SLOTS, generation, [],
+                          _PACK_HEADER.size, 0)
+        os.rename(tmp_fname, self.pack_fname)
+        self.pack = open(self.pack_fname, 'r+b', 0)
+        self._map_index()
+
+    def _generation(self):
+        self.pack.seek(0)
+        header = self.pack.read(_PACK_HEADER.size)
+        if len(header) != _PACK_HEADER.size:
+            return None
+        magic, generation = _PACK_HEADER.unpack(header)
+        if magic != _PACK_MAGIC:
+            return None
+        return generation
+
+    def _read_record(self, offset):
+        """ Return (key, value length, modified, value offset) or None. """
+        self.pack.seek(offset)
+        header = self.pack.read(_RECORD_HEADER.size)
+        if len(header) != _RECORD_HEADER.size:
+            return None
+        magic, key_len, value_len, modified = _RECORD_HEADER.unpack(header)
+        if magic != _RECORD_MAGIC:
+            return None
+        key = self.pack.read(key_len)
+        if len(key) != key_len:
+            return None
+        value_offset = offset + _RECORD_HEADER.size + key_len
+        if value_len != _DELETED and \
+                os.fstat(self.pack.fileno())[ST_SIZE] < value_offset + value_len:
+            return None
+        return key, value_len, modified, value_offset
+
+    def _append(self, key, value, modified):
+        self.pack.seek(0, 2)
+        offset = self.pack.tell()
+        if value is None:
+            data = _RECORD_HEADER.pack(_RECORD_MAGIC, len(key), _DELETED,
+                                       modified) + key
+        else:
+            data = _RECORD_HEADER.pack(_RECORD_MAGIC, len(key), len(value),
+                                       modified) + key + value
+        self.pack.write(data)
+        self._index_record(key, offset, len(data), value is None)
+        self._set_header(indexed=offset + len(data))
+
+    # Entry points; the caller holds the lock
+
+    def lookup(self, key):
+        """ Return (modified, value offset, value length) or None. """
+        _slot, offset = self._find(key)
+        if offset is None:
+            return None
+        _key, value_len, modified, value_offset = self._read_record(offset)
+        if value_len == _DELETED:
+            return None
+        return modified, value_offset, value_len
+
+    def read(self, offset, length):
+        self.pack.seek(offset)
+        return self.pack.read(length)
+
+    def store(self, key, value, modified):
+        self._append(key, value, modified)
+        header = self._header()
+        size = header[4] - _PACK_HEADER.size
+        if size > _COMPACT_MIN_SIZE and size > 2 * header[5]:
+            self.compact()
+
+    def remove(self, key):
+        self._append(key, None, 0)
+
+    def compact(self):
+        """ Rewrite the pack file with only the live records. """
+        generation = _new_generation()
+        tmp_fname = "%s.%s" % (self.pack_fname, os.getpid())
+        new_pack = open(tmp_fname, 'wb')
+        new_pack.write(_PACK_HEADER.pack(_PACK_MAGIC, generation))
+        offset = _PACK_HEADER.size
+        entries = []
+        for key_hash, old_offset in self._entries():
+            key, value_len, modified, value_offset = \
+                self._read_record(old_offset)
+            if value_len == _DELETED:
+                continue
+            data = _RECORD_HEADER.pack(_RECORD_MAGIC, len(key), value_len,
+                                       modified) + key + \
+                self.read(value_offset, value_len)
+            new_pack.write(data)
+            entries.append((key_hash, offset))
+            offset = offset + len(data)
+        new_pack.close()
+        self._set_perms(tmp_fname)
+
+        slots = _INDEX_MIN_SLOTS
+        while len(entries) * 2 > slots:
+            slots = slots * 2
+        self._write_index(self.index_fname, slots, generation, entries,
+                          offset, offset - _PACK_HEADER.size)
+        os.rename(tmp_fname, self.pack_fname)
+        self._close()
+        self.pack = open(self.pack_fname, 'r+b', 0)
+        self._map_index()
+
+
+def _get_pack(path):
+    _packs_lock.acquire()
+    try:
+        if path not in _packs:
+            _packs[path] = _Pack(path)
+        return _packs[path]
+    finally:
+        _packs_lock.release()
+
+
+def _split_key(name):
+    """ Return the pack path and the key of the entry within the pack. """
+    dirname, key = os.path.split(_fname(name))
+    if isinstance(key, UnicodeType):
+        key = key.encode('utf-8')
+    return os.path.join(dirname, _PACK_NAME), key
+
+
+class PackedCache:
+
+    """
+    Cache storing the entries of a namespace in a single pack file.
+
+    Drop-in replacement for Cache: the entries can be wrapped with
+    CompressedCache, ObjectCache and NullCache the same way.
+    """
+
+    def __init__(self):
+        pass
+
+    def get(self, name, modified=None):
+        path, key = _split_key(name)
+        if modified is not None:
+            modified = int(timestamp(modified))
+        pack = _get_pack(path)
+        if not pack.acquire():
+            pack.release()
+            raise KeyError(name)
+        try:
+            entry = pack.lookup(key)
+            if entry is None or (modified is not None and entry[0] != modified):
+                raise KeyError(name)
+            return pack.read(entry[1], entry[2])
+        finally:
+            pack.release()
+
+    def set(self, name, value, modified=None, user='root', group='root',
+            mode=int('0755', 8)):
+        path, key = _split_key(name)
+        if modified:
+            modified = int(timestamp(modified))
+        else:
+            modified = int(time.time())
+        if isinstance(value, UnicodeType):
+            value = value.encode('utf-8')
+        pack = _get_pack(path)
+        pack.acquire(exclusive=True, perms=(user, group, mode))
+        try:
+            pack.store(key, value, modified)
+        finally:
+            pack.release()
+
+    @staticmethod
+    def has_key(name, modified=None):
+        path, key = _split_key(name)
+        if modified is not None:
+            modified = int(timestamp(modified))
+        if not os.access(path + ".pack", os.R_OK):
+            return False
+        pack = _get_pack(path)
+        if not pack.acquire():
+            pack.release()
+            return False
+        try:
+            entry = pack.lookup(key)
+        finally:
+            pack.release()
+        if entry is None:
+            return False
+        if modified is not None and entry[0] != modified:
+            return False
+        return True
+
+    @staticmethod
+    def delete(name):
+        path, key = _split_key(name)
+        if not os.access(path + ".pack", os.R_OK):
+            raise KeyError("Invalid cache key for delete: %s" % name)
+        pack = _get_pack(path)
+        pack.acquire(exclusive=True)
+        try:
+            if pack.lookup(key) is None:
+                raise KeyError("Invalid cache key for delete: %s" % name)
+            pack.remove(key)
+        finally:
+            pack.release()
+
+    def get_file(self, name, modified=None):
+        return BytesIO(self.get(name, modified))
+
+    def set_file(self, name, modified=None, user='root', group='root',
+                 mode=int('0755', 8)):
+        return PackedFile(self, name, modified, user, group, mode)
+
+    @staticmethod
+    def compact(name):
+        """ Compact the pack holding the entry name. """
+        path = _split_key(name)[0]
+        pack = _get_pack(path)
+        pack.acquire(exclusive=True)
+        try:
+            pack.compact()
+        finally:
+            pack.release()
+
+
+class PackedFile(object):
+
+    """ Write-only file object storing its contents in a PackedCache. """
+
+    def __init__(self, cache, name, modified, user, group, mode):
+        self.cache = cache
+        self.key = name
+        self.modified = modified
+        self.perms = (user, group, mode)
+        self.buffer = BytesIO()
+        self.closed = False
+
+    def write(self, data):
+        self.buffer.write(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if not self.closed:
+            self.cache.set(self.key, self.buffer.getvalue(), self.modified,
+                           *self.perms)
+            self.closed = True
@@ -16,6 +16,7 @@
 import os
 import re
 import time
+import threading
 from datetime import tzinfo, timedelta
 try:
     #  python 2
@@ -224,6 +225,98 @@ def isSUSE():
     return False
 
 
+class LRUCache:
+
+    """
+    Dictionary-like cache of a bounded size, evicting the least recently
+    used entries first.
+
+    on_evict, if set, is called with the key and the value of every entry
+    dropped to make room for a new one.
+    """
+
+    def __init__(self, size, on_evict=None):
+        self.size = size
+        self.on_evict = on_evict
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        # key -> [prev, next, key, value] links of a circular list, with
+        # the most recently used entry right after the root
+        self._map = {}
+        self._root = root = []
+        root[:] = [root, root, None, None]
+
+    def get(self, key, default=None):
+        self._lock.acquire()
+        try:
+            link = self._map.get(key)
+            if link is None:
+                return default
+            self._unlink(link)
+            self._link(link)
+            return link[3]
+        finally:
+            self._lock.release()
+
+    def set(self, key, value):
+        evicted = []
+        self._lock.acquire()
+        try:
+            link = self._map.get(key)
+            if link is not None:
+                self._unlink(link)
+                link[3] = value
+            else:
+                link = self._map[key] = [None, None, key, value]
+                while len(self._map) > self.size:
+                    oldest = self._root[0]
+                    self._unlink(oldest)
+                    del self._map[oldest[2]]
+                    evicted.append((oldest[2], oldest[3]))
+            self._link(link)
+        finally:
+            self._lock.release()
+        if self.on_evict is not None:
+            for old_key, old_value in evicted:
+                self.on_evict(old_key, old_value)
+
+    def delete(self, key):
+        self._lock.acquire()
+        try:
+            link = self._map.pop(key, None)
+            if link is not None:
+                self._unlink(link)
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._clear()
+        finally:
+            self._lock.release()
+
+    def __contains__(self, key):
+        return key in self._map
+
+    def __len__(self):
+        return len(self._map)
+
+    def _link(self, link):
+        root = self._root
+        link[0] = root
+        link[1] = root[1]
+        root[1][0] = link
+        root[1] = link
+
+    @staticmethod
+    def _unlink(link):
+        link[0][1] = link[1]
+        link[1][0] = link[0]
+
+
 class UTC(tzinfo):
     """Used for creating offset-aware datetime objects in Python 2."""
     # pylint: disable=W0613
@@ -32,19 +32,38 @@
 # system module imports
 import os
 import sys
-import traceback
 import time
 import fcntl
 import atexit
+try:
+    import json
+except ImportError:
+    import simplejson as json
+from rhn.i18n import bstr
 from spacewalk.common.fileutils import getUidGid
 from spacewalk.common.rhnLib import isSUSE
 
 LOG = None
 
+# bytes of buffered messages written out before the request is over
+BUFFER_SIZE = 32768
+
 # helper function to format the current time in the log format
 
 
+_log_time = (None, None)
+
+
 def log_time():
+    global _log_time
+    now = int(time.time())
+    if _log_time[0] == now:
+        return _log_time[1]
+    _log_time = (now, _format_log_time(now))
+    return _log_time[1]
+
+
+def _format_log_time(now):
     if time.daylight:
         # altzone provides the DST-corrected time
         tz_offset = time.altzone
@@ -61,7 +80,7 @@ def log_time():
     mins = secs / 60
 
     tz_offset_string = " %s%02d:%02d" % (sign, hours, mins)
-    t = time.strftime("%Y/%m/%d %H:%M:%S", time.localtime(time.time()))
+    t = time.strftime("%Y/%m/%d %H:%M:%S", time.localtime(now))
     return t + tz_offset_string
 
 # function for setting the close-on-exec flag
@@ -76,7 +95,7 @@ def set_close_on_exec(fd):
 # Init the log
 
 
-def initLOG(log_file="stderr", level=0):
+def initLOG(log_file="stderr", level=0, log_format=None):
     global LOG
 
     # check if it already setup
@@ -85,6 +104,7 @@ def initLOG(log_file="stderr", level=0):
         if log_file is None or LOG.file == log_file:
             # Keep the same logging object, change only the log level
             LOG.level = level
+            LOG.json = (log_format == "json")
             return
         # We need a different type, so destroy the old one
         LOG = None
@@ -118,6 +138,7 @@ def initLOG(log_file="stderr", level=0):
     # At this point, LOG is None and log_file is not None
     # Get a new LOG
     LOG = rhnLog(log_file, level)
+    LOG.json = (log_format == "json")
     return 0
 
 # Convenient macro-type debugging function
@@ -146,6 +167,7 @@ def log_error(*args):
         return
     if LOG:
         LOG.logMessage("ERROR", *args)
+        LOG.flush()
     # log to stderr too
     log_stderr(str(args))
 
@@ -164,6 +186,31 @@ def log_setreq(req):
     if LOG:
         LOG.set_req(req)
 
+# write out the messages of the request
+
+
+def log_flush():
+    if LOG:
+        LOG.flush()
+
+# "dir/module" names of the files of the functions logging, by code object
+_caller_names = {}
+
+
+def _caller_name(code):
+    name = _caller_names.get(code)
+    if name is None:
+        arr = code.co_filename.split('/')
+        if len(arr) > 1:
+            lastDir = arr[-2] + "/"
+        else:
+            lastDir = ""
+        filename = arr[-1]
+        if '.' in filename:
+            filename = filename[:filename.rindex('.')]
+        name = _caller_names[code] = lastDir + filename
+    return name
+
 # The base log class
 
 
@@ -175,6 +222,14 @@ class rhnLog:
         self.file = log_file
         self.pid = os.getpid()
         self.real = 0
+        # one JSON object per message instead of plain text
+        self.json = 0
+        # messages are flushed together at the end of a request
+        self.buffered = 0
+        # complete lines not written out yet, and their size
+        self.pending = []
+        self.pending_size = 0
+        self.remote_addr = '0.0.0.0'
         if self.file in ["stderr", "stdout"]:
             self.fd = getattr(sys, self.file)
             self.log_info = ""
@@ -186,8 +241,10 @@ class rhnLog:
 
         # else, open it as a real file, with locking and stuff
         try:
-            # try to open it in line buffered mode
-            self.fd = open(self.file, "a", 1)
+            # opened for appending; the lines are written out with a single
+            # os.write() so that the lines of other processes logging to the
+            # same file do not end up in the middle of them
+            self.fd = open(self.file, "a")
             set_close_on_exec(self.fd)
             if newfileYN:
                 if isSUSE():
@@ -209,28 +266,42 @@ class rhnLog:
 
     # Main logging method.
     def logMessage(self, *args):
-        tbStack = traceback.extract_stack()
-        callid = len(tbStack) - 3
-        module = ''
-        try:    # So one can debug from the commandline.
-            module = tbStack[callid][0]
-            arr = module.split('/')
-            if len(arr) > 1:
-                lastDir = arr[-2] + "/"
-            else:
-                lastDir = ""
-            filename = arr[-1]
-            filename = filename[:filename.rindex('.')]
-            module = lastDir + filename
-            del lastDir
-        except:
-            module = ''
+        # the function calling log_debug() or log_error()
+        try:
+            code = sys._getframe(2).f_code
+        except ValueError:
+            code = None
+        if code is None:
+            module = function = ''
+        else:
+            module = _caller_name(code)
+            function = code.co_name
 
-        msg = "%s%s.%s" % (self.log_info, module, tbStack[callid][2])
+        if self.json:
+            self.writeJSON(module, function, args)
+            return
+        msg = "%s%s.%s" % (self.log_info, module, function)
         if args:
             msg = "%s%s" % (msg, repr(args))
         self.writeMessage(msg)
 
+    # send a message to the log file as a JSON object
+    def writeJSON(self, module, function, args):
+        record = {
+            'time': log_time(),
+            'pid': self.pid,
+            'remote_addr': self.remote_addr,
+            'module': module,
+            'function': function,
+            'args': args,
+        }
+        try:
+            msg = json.dumps(record, default=repr)
+        except (TypeError, ValueError, UnicodeError):
+            record['args'] = repr(args)
+            msg = json.dumps(record)
+        self.writeToLog(msg)
+
     # send a message to the log file w/some extra data (time stamp, etc).
     def writeMessage(self, msg):
         if self.real:
@@ -243,7 +314,34 @@ class rhnLog:
     def writeToLog(self, msg):
         # this is for debugging in case of errors
         # fd = self.fd # no-op, but useful for dumping the current data
-        self.fd.write("%s\n" % msg)
+        if not self.real:
+            self.fd.write("%s\n" % msg)
+            self.fd.flush()
+            return
+        line = bstr("%s\n" % msg)
+        self.pending.append(line)
+        self.pending_size = self.pending_size + len(line)
+        if not self.buffered or self.pending_size >= BUFFER_SIZE:
+            self.writePending()
+
+    # write out the complete lines held back
+    def writePending(self):
+        if not self.pending:
+            return
+        data = bstr('').join(self.pending)
+        self.pending = []
+        self.pending_size = 0
+        try:
+            os.write(self.fd.fileno(), data)
+        except OSError:
+            e = sys.exc_info()[1]
+            log_stderr("ERROR LOG FILE: Couldn't write to log file %s" % self.file, e)
+
+    # write out the buffered messages
+    def flush(self):
+        self.buffered = 0
+        if self.real:
+            self.writePending()
 
     # Reinitialize req info if req has changed.
     def set_req(self, req=None):
@@ -254,10 +352,14 @@ class rhnLog:
             else:
                 remoteAddr = req.connection.remote_ip
         self.log_info = "%s: " % (remoteAddr, )
+        self.remote_addr = remoteAddr
+        # hold the messages back until log_flush()
+        self.buffered = self.real and req is not None
 
     # shutdown the log
     def __del__(self):
         if self.real:
+            self.writePending()
             self.fd.close()
         self.level = self.log_info = None
         self.pid = self.file = self.real = self.fd = None
@@ -0,0 +1,93 @@
+#
+# Copyright (c) 2016 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+#
+#
+# Sort keys for package versions.
+#
+# evr_key() turns an (epoch, version, release) into a key that sorts the way
+# rpm.labelCompare() orders them: two versions rpm considers identical (1.01
+# and 1.1, 1.0 and 1_0) get the very same key. Keys can therefore be sorted,
+# hashed and compared without calling into rpm for every pair of packages.
+#
+# The rules are the ones of rpmvercmp: versions are split in numeric and
+# alphabetic segments, everything else separates them; numeric segments
+# compare as numbers and are newer than alphabetic ones, a longer version is
+# newer, and a segment after a tilde is older than anything, even the end of
+# the version. A missing epoch is the same as epoch 0.
+#
+
+import re
+
+# segment types, in the order they sort
+_TILDE = 0
+_END = 1
+_ALPHA = 2
+_NUMERIC = 3
+
+# the keys of the strings seen lately
+CACHE_SIZE = 100000
+_keys = {}
+
+_segments = re.compile('~|[0-9]+|[a-zA-Z]+')
+
+
+def vercmp_key(s):
+    """ Sort key of a version (or release, or epoch) string. None sorts
+        before every string.
+    """
+    if s is None:
+        return ()
+    try:
+        return _keys[s]
+    except KeyError:
+        pass
+    key = []
+    for seg in _segments.findall(s):
+        if seg == '~':
+            key.append((_TILDE, ))
+        elif seg.isdigit():
+            key.append((_NUMERIC, int(seg)))
+        else:
+            key.append((_ALPHA, seg))
+    key.append((_END, ))
+    key = tuple(key)
+    if len(_keys) >= CACHE_SIZE:
+        _keys.clear()
+    _keys[s] = key
+    return key
+
+
+def evr_key(epoch, version, release):
+    """ Sort key of a package version; the epoch may be None or '' """
+    if epoch is None or epoch == '':
+        epoch = '0'
+    return (vercmp_key(str(epoch)), vercmp_key(version), vercmp_key(release))
+
+
+def evr_compare(evr1, evr2):
+    """ Compares two (epoch, version, release) tuples like
+        rpm.labelCompare(); returns -1, 0 or 1
+    """
+    key1 = evr_key(*evr1)
+    key2 = evr_key(*evr2)
+    if key1 < key2:
+        return -1
+    if key1 > key2:
+        return 1
+    return 0
+
+
+def nvre_key(t):
+    """ Sort key of a package version given as (n, v, r, e) """
+    return evr_key(t[3], t[1], t[2])
@@ -15,6 +15,7 @@
 #
 #
 
+import os
 import sys
 import unittest
 from spacewalk.common import rhnCache
@@ -87,5 +88,51 @@ class Tests(unittest.TestCase):
 
         self.failIf(rhnCache.has_key(key))
 
+
+class PackedTests(Tests):
+    # pylint: disable=R0904
+
+    def setUp(self):
+        rhnCache.BACKEND = "packed"
+
+    def tearDown(self):
+        rhnCache.BACKEND = "files"
+
+    def test_packed_1(self):
+        "Tests overwriting and reopening entries of a pack"
+        rhnCache.CACHEDIR = '/tmp/rhn'
+        for i in range(3000):
+            rhnCache.set("unit-test/packed/%s" % i, self.content, raw=1)
+        rhnCache.set("unit-test/packed/1", "overwritten", raw=1)
+        rhnCache.delete("unit-test/packed/2")
+
+        # Forget the open files, as a new process would
+        rhnCache._packs.clear()
+        self.assertEqual("overwritten", rhnCache.get("unit-test/packed/1", raw=1))
+        self.assertEqual(self.content, rhnCache.get("unit-test/packed/2999", raw=1))
+        self.failIf(rhnCache.has_key("unit-test/packed/2"))
+
+        for i in range(3000):
+            if i != 2:
+                rhnCache.delete("unit-test/packed/%s" % i)
+
+    def test_packed_2(self):
+        "Tests compaction of a pack"
+        rhnCache.CACHEDIR = '/tmp/rhn'
+        key = "unit-test/packed/compacted"
+        rhnCache.set(key, self.content, raw=1, modified='20041110001122')
+        for i in range(100):
+            rhnCache.set("unit-test/packed/other", self.content * 100, raw=1)
+        rhnCache.PackedCache.compact(key)
+
+        rhnCache._packs.clear()
+        self.assertEqual(self.content,
+                         rhnCache.get(key, raw=1, modified='20041110001122'))
+        self.assertEqual(None, rhnCache.get(key, raw=1, modified='20001122112233'))
+        pack_size = os.stat('/tmp/rhn/unit-test/packed/__packed__.pack')[6]
+        self.failUnless(pack_size < len(self.content) * 102)
+        rhnCache.delete(key)
+        rhnCache.delete("unit-test/packed/other")
+
 if __name__ == '__main__':
     sys.exit(unittest.main() or 0)
@@ -76,5 +76,23 @@ class Tests(unittest.TestCase):
         self.assertEquals(('https', 'somehostname:123', '/ABCDE', '', '', ''),
                           rhnLib.parseUrl('https://somehostname:123/ABCDE'))
 
+    def testLRUCache(self):
+        evicted = []
+        cache = rhnLib.LRUCache(2, lambda k, v: evicted.append((k, v)))
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEquals(1, cache.get('a'))
+        cache.set('c', 3)
+        self.assertEquals([('b', 2)], evicted)
+        self.assertEquals(None, cache.get('b'))
+        self.assertEquals(3, cache.get('c'))
+        cache.set('a', 4)
+        cache.set('d', 5)
+        self.assertEquals([('b', 2), ('c', 3)], evicted)
+        self.assertEquals(4, cache.get('a'))
+        cache.delete('a')
+        self.failIf('a' in cache)
+        self.assertEquals(1, len(cache))
+
 if __name__ == '__main__':
     sys.exit(unittest.main() or 0)
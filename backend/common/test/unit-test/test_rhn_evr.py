@@ -0,0 +1,77 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2016 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+#
+
+import unittest
+from spacewalk.common import rhn_evr
+
+# (a, b, rpmvercmp(a, b)) from rpm's own test suite
+VERCMP = [
+    ("1.0", "1.0", 0), ("1.0", "2.0", -1), ("2.0", "1.0", 1),
+    ("2.0.1", "2.0.1", 0), ("2.0", "2.0.1", -1), ("2.0.1", "2.0", 1),
+    ("2.0.1a", "2.0.1a", 0), ("2.0.1a", "2.0.1", 1), ("2.0.1", "2.0.1a", -1),
+    ("5.5p1", "5.5p1", 0), ("5.5p1", "5.5p2", -1), ("5.5p2", "5.5p1", 1),
+    ("5.5p10", "5.5p10", 0), ("5.5p1", "5.5p10", -1), ("5.5p10", "5.5p1", 1),
+    ("10xyz", "10.1xyz", -1), ("10.1xyz", "10xyz", 1),
+    ("xyz10", "xyz10", 0), ("xyz10", "xyz10.1", -1), ("xyz10.1", "xyz10", 1),
+    ("xyz.4", "xyz.4", 0), ("xyz.4", "8", -1), ("8", "xyz.4", 1),
+    ("xyz.4", "2", -1), ("2", "xyz.4", 1),
+    ("5.5p2", "5.6p1", -1), ("5.6p1", "5.5p2", 1),
+    ("5.6p1", "6.5p1", -1), ("6.5p1", "5.6p1", 1),
+    ("6.0.rc1", "6.0", 1), ("6.0", "6.0.rc1", -1),
+    ("10b2", "10a1", 1), ("10a2", "10b2", -1),
+    ("1.0aa", "1.0aa", 0), ("1.0a", "1.0aa", -1), ("1.0aa", "1.0a", 1),
+    ("10.0001", "10.0001", 0), ("10.0001", "10.1", 0), ("10.1", "10.0001", 0),
+    ("10.0001", "10.0039", -1), ("10.0039", "10.0001", 1),
+    ("4.999.9", "5.0", -1), ("5.0", "4.999.9", 1),
+    ("20101121", "20101121", 0), ("20101121", "20101122", -1),
+    ("20101122", "20101121", 1),
+    ("2_0", "2_0", 0), ("2.0", "2_0", 0), ("2_0", "2.0", 0),
+    ("a", "a", 0), ("a+", "a+", 0), ("a+", "a_", 0), ("a_", "a+", 0),
+    ("+a", "+a", 0), ("+a", "_a", 0), ("_a", "+a", 0),
+    ("+_", "+_", 0), ("_+", "+_", 0), ("_+", "_+", 0),
+    ("+", "_", 0), ("_", "+", 0),
+    ("1.0~rc1", "1.0~rc1", 0), ("1.0~rc1", "1.0", -1), ("1.0", "1.0~rc1", 1),
+    ("1.0~rc1", "1.0~rc2", -1), ("1.0~rc2", "1.0~rc1", 1),
+    ("1.0~rc1~git123", "1.0~rc1~git123", 0),
+    ("1.0~rc1~git123", "1.0~rc1", -1), ("1.0~rc1", "1.0~rc1~git123", 1),
+]
+
+
+class Tests(unittest.TestCase):
+    # pylint: disable=R0904
+
+    def test_vercmp_key(self):
+        "vercmp_key: Keys sort like rpmvercmp."
+        for a, b, expected in VERCMP:
+            key_a = rhn_evr.vercmp_key(a)
+            key_b = rhn_evr.vercmp_key(b)
+            result = (key_a > key_b) - (key_a < key_b)
+            self.assertEqual(result, expected, "%s vs %s: %s" % (a, b, result))
+
+    def test_evr_compare_epoch(self):
+        "evr_compare: The epoch comes first, a missing one is 0."
+        self.assertEqual(rhn_evr.evr_compare(('1', '1.0', '1'), (None, '2.0', '1')), 1)
+        self.assertEqual(rhn_evr.evr_compare((None, '1.0', '1'), ('0', '1.0', '1')), 0)
+        self.assertEqual(rhn_evr.evr_compare(('', '1.0', '1'), (0, '1.0', '1')), 0)
+        self.assertEqual(rhn_evr.evr_compare((None, '1.0', '1'), (None, '1.0', '2')), -1)
+
+    def test_nvre_key(self):
+        "nvre_key: Identical versions get the same key."
+        self.assertEqual(rhn_evr.nvre_key(('perl', '1.1', '1', '')),
+                         rhn_evr.nvre_key(('perl', '1.01', '1', None)))
+
+if __name__ == '__main__':
+    unittest.main()
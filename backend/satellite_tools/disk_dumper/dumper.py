@@ -670,7 +670,8 @@ class CachedDumper(exportLib.BaseDumper):
         log_debug(4, params)
         key = self._get_key(params)
         last_modified = self._get_last_modified(params)
-        return rhnCache.get(key, modified=last_modified, raw=1)
+        return rhnCache.get(key, modified=last_modified, raw=1,
+                            backend=CFG.CACHE_BACKEND)
 
     def cache_set(self, params, value):
         log_debug(4, params)
@@ -682,7 +683,8 @@ class CachedDumper(exportLib.BaseDumper):
             user = 'wwwrun'
             group = 'www'
         return rhnCache.set(key, value, modified=last_modified,
-                            raw=1, user=user, group=group, mode=int('0755', 8))
+                            raw=1, user=user, group=group, mode=int('0755', 8),
+                            backend=CFG.CACHE_BACKEND)
 
     def dump_subelement(self, data):
         log_debug(2)
@@ -244,6 +244,9 @@ class DownloadThread(Thread):
             if self.parent.log_obj:
                 # log_obj must be thread-safe
                 self.parent.log_obj.log(success, os.path.basename(params['relative_path']))
+            if self.parent.callback:
+                # callback must be thread-safe too
+                self.parent.callback(success, params)
             self.queue.task_done()
         self.curl.close()
 
@@ -260,6 +263,7 @@ class ThreadedDownloader:
             raise ValueError("Invalid number of threads: %d" % self.threads)
         self.retries = retries
         self.log_obj = log_obj
+        self.callback = None
         self.force = force
         self.lock = Lock()
         self.exception = None
@@ -270,6 +274,10 @@ class ThreadedDownloader:
     def set_log_obj(self, log_obj):
         self.log_obj = log_obj
 
+    def set_callback(self, callback):
+        """ Call callback(success, params) from the download thread as soon as a file is done """
+        self.callback = callback
+
     def set_force(self, force):
         self.force = force
 
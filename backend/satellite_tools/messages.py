@@ -80,6 +80,7 @@ package_fetch_summary = _("   RPM fetch summary: %s")
 package_fetch_summary_success = _("       success: %d")
 package_fetch_summary_failed = _("       failed:  %d")
 package_fetch_summary_extinct = _("       extinct: %d")
+package_fetch_summary_throughput = _("       downloaded %s in %s (%s/s)")
 
 package_parsing = _("   Retrieving / parsing *relevant* package metadata: %s (%s)")
 erratum_parsing = _("   Retrieving / parsing errata data: %s (%s)")
@@ -14,6 +14,7 @@
 #
 
 import re
+import sys
 import rpm
 from spacewalk.common import rhn_pkg
 from spacewalk.common.rhnException import rhnFault
@@ -22,6 +23,24 @@ from spacewalk.server import rhnPackageUpload
 CACHE_DIR = '/var/cache/rhn/reposync/'
 
 
+def package_checksum(path):
+    """ Read header and compute checksum of the package file, returns
+        (checksum_type, checksum, payload_size). Runs in worker processes,
+        so neither the package object nor arbitrary exceptions (which may
+        not survive pickling) are passed back. """
+    # pylint: disable=W0703
+    try:
+        a_pkg = rhn_pkg.package_from_filename(path)
+        try:
+            a_pkg.read_header()
+            a_pkg.payload_checksum()
+        finally:
+            a_pkg.input_stream.close()
+    except Exception:
+        raise Exception("Unable to load package %s: %s" % (path, sys.exc_info()[1]))
+    return a_pkg.checksum_type, a_pkg.checksum, a_pkg.payload_size
+
+
 class ContentPackage:
 
     def __init__(self):
@@ -86,6 +105,19 @@ class ContentPackage:
         self.a_pkg.payload_checksum()
         self.a_pkg.input_stream.close()
 
+    def load_header(self, checksum_type, checksum, payload_size):
+        """ Like load_checksum_from_header(), with checksum already computed
+            (by package_checksum() in a worker process) """
+        if self.path is None:
+            raise rhnFault(50, "Unable to load package", explain=0)
+        self.a_pkg = rhn_pkg.package_from_filename(self.path)
+        self.a_pkg.read_header()
+        self.a_pkg.checksum_type = checksum_type
+        self.a_pkg.checksum = checksum
+        self.a_pkg.payload_size = payload_size
+        self.a_pkg.payload_stream = self.a_pkg.input_stream
+        self.a_pkg.input_stream.close()
+
     def upload_package(self, org_id, metadata_only=False):
         if not metadata_only:
             rel_package_path = rhnPackageUpload.relative_path_from_header(
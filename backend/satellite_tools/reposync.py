@@ -17,20 +17,25 @@ import os
 import re
 import shutil
 import sys
+import time
 from datetime import datetime
 from xml.dom import minidom
 import gzip
 import ConfigParser
 import gettext
 import errno
+from multiprocessing import Pool, cpu_count, current_process
+from multiprocessing.pool import ThreadPool
+from threading import Thread
+from Queue import Queue, Empty
 
 from rhn.connections import idn_puny_to_unicode
 
 from spacewalk.server import rhnPackage, rhnSQL, rhnChannel
 from spacewalk.common.usix import raise_with_tb
-from spacewalk.common import fileutils, rhnLog, rhnCache, rhnMail
+from spacewalk.common import fileutils, rhnLog, rhnMail
 from spacewalk.common.rhnLib import isSUSE
-from spacewalk.common.checksum import getFileChecksum
+from spacewalk.common.checksum import getFileChecksum, ChecksumIndex
 from spacewalk.common.rhnConfig import CFG, initCFG
 from spacewalk.common.rhnException import rhnFault
 from spacewalk.server.importlib import importLib, mpmSource, packageImport, errataCache
@@ -38,7 +43,7 @@ from spacewalk.server.importlib.packageImport import ChannelPackageSubscription
 from spacewalk.server.importlib.backendOracle import SQLBackend
 from spacewalk.server.importlib.errataImport import ErrataImport
 from spacewalk.satellite_tools.download import ThreadedDownloader, ProgressBarLogger, TextLogger
-from spacewalk.satellite_tools.repo_plugins import CACHE_DIR
+from spacewalk.satellite_tools.repo_plugins import CACHE_DIR, package_checksum
 from spacewalk.server import taskomatic, rhnPackageUpload
 from spacewalk.satellite_tools.satCerts import verify_certificate_dates
 
@@ -49,7 +54,6 @@ _ = translation.ugettext
 
 default_log_location = '/var/log/rhn/'
 relative_comps_dir = 'rhn/comps'
-checksum_cache_filename = 'reposync/checksum_cache'
 default_import_batch_size = 10
 
 
@@ -297,6 +301,78 @@ def get_single_ssl_set(keys, check_dates=False):
     return None
 
 
+class DownloadRegistry(object):
+
+    """Packages downloaded within a run of several concurrent RepoSync
+    processes, keyed by (checksum_type, checksum) from repository metadata.
+    The first sync claiming a package downloads and imports it, the others
+    wait for it and only link it to their channel.
+    Create it in the parent with a multiprocessing.Manager() and pass it
+    to the processes.
+    """
+
+    PENDING = 'pending'
+
+    def __init__(self, manager):
+        self.packages = manager.dict()
+        # pid of the process each pending package is claimed by
+        self.owners = manager.dict()
+        self.lock = manager.Lock()
+        # claims of this process not resolved yet
+        self.claimed = set()
+
+    def claim(self, key):
+        """ Return True if the caller should download package key itself """
+        self.lock.acquire()
+        try:
+            if key in self.packages:
+                return False
+            self.owners[key] = os.getpid()
+            self.packages[key] = self.PENDING
+        finally:
+            self.lock.release()
+        self.claimed.add(key)
+        return True
+
+    def done(self, key, checksum_type, checksum, epoch):
+        """ Package key is imported and committed as (checksum_type, checksum) """
+        self.packages[key] = (checksum_type, checksum, epoch)
+        self.claimed.discard(key)
+
+    def failed(self, key):
+        self.packages[key] = None
+        self.claimed.discard(key)
+
+    def release(self):
+        """ Give up all unresolved claims of this process """
+        for key in list(self.claimed):
+            self.failed(key)
+
+    def wait(self, key):
+        """ Wait for package key claimed by another process, return its
+            (checksum_type, checksum, epoch) or None if the import failed
+            or the process died without resolving its claim """
+        while True:
+            value = self.packages.get(key)
+            if value != self.PENDING:
+                return value
+            if not _process_alive(self.owners.get(key)):
+                return None
+            time.sleep(1)
+
+
+def _process_alive(pid):
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        e = sys.exc_info()[1]
+        # the process exists, but runs as another user
+        return e.errno == errno.EPERM
+    return True
+
+
 class RepoSync(object):
 
     def __init__(self, channel_label, repo_type=None, url=None, fail=False,
@@ -382,11 +458,10 @@ class RepoSync(object):
         self.strict = strict
         self.all_packages = set()
         self.check_ssl_dates = check_ssl_dates
-        # Init cache for computed checksums to not compute it on each reposync run again
-        self.checksum_cache = rhnCache.get(checksum_cache_filename)
-        if self.checksum_cache is None:
-            self.checksum_cache = {}
+        # Index of computed checksums to not compute it on each reposync run again
+        self.checksum_index = ChecksumIndex()
         self.import_batch_size = default_import_batch_size
+        self.download_registry = None
 
     def set_import_batch_size(self, batch_size):
         self.import_batch_size = int(batch_size)
@@ -400,6 +475,10 @@ class RepoSync(object):
             url = tuple(url)
             self.urls[index] = url
 
+    def set_download_registry(self, registry):
+        """Share downloads with concurrent syncs of other channels, see DownloadRegistry"""
+        self.download_registry = registry
+
     def sync(self, update_repodata=True):
         """Trigger a reposync"""
         failed_packages = 0
@@ -478,6 +557,10 @@ class RepoSync(object):
                 log2disk(0, "ERROR: %s" % e)
                 # pylint: disable=W0104
                 sync_error = -1
+            finally:
+                # don't let other syncs wait for packages we won't import
+                if self.download_registry is not None:
+                    self.download_registry.release()
 
         # In strict mode unlink all packages from channel which are not synced from current repositories
         if self.strict and sync_error == 0:
@@ -497,8 +580,7 @@ class RepoSync(object):
                     self.disassociate_package(package['checksum_type'], package['checksum'])
                     self.regen = True
 
-        # Update cache with package checksums
-        rhnCache.set(checksum_cache_filename, self.checksum_cache)
+        self.checksum_index.close()
         if self.regen:
             taskomatic.add_to_repodata_queue_for_channel_package_subscription(
                 [self.channel_label], [], "server.app.yumreposync")
@@ -793,11 +875,11 @@ class RepoSync(object):
             log(0, "Packages passed filter rules: %5d" % num_passed)
         channel_id = int(self.channel['id'])
 
-        for pack in packages:
-            db_pack = rhnPackage.get_info_for_package(
-                [pack.name, pack.version, pack.release, pack.epoch, pack.arch],
-                channel_id, self.org_id)
+        db_packages = rhnPackage.get_info_for_packages(
+            [[pack.name, pack.version, pack.release, pack.epoch, pack.arch] for pack in packages],
+            channel_id, self.org_id)
 
+        for (pack, db_pack) in zip(packages, db_packages):
             to_download = True
             to_link = True
             # Package exists in DB
@@ -808,8 +890,8 @@ class RepoSync(object):
                 else:
                     pack.path = ""
 
-                if self.metadata_only or self.match_package_checksum(db_pack['path'], pack.path,
-                                                                     pack.checksum_type, pack.checksum):
+                if self.metadata_only or self.match_package_checksum(pack.path, pack.checksum_type,
+                                                                     pack.checksum):
                     # package is already on disk or not required
                     to_download = False
                     if db_pack['channel_id'] == channel_id:
@@ -846,10 +928,29 @@ class RepoSync(object):
 
         downloader = ThreadedDownloader()
         to_download_count = 0
-        for what in to_process:
+        # packages this sync downloads for others / gets from other syncs
+        claimed = {}
+        shared = {}
+        # each package is downloaded to a file of its own
+        queued = set()
+        for (index, what) in enumerate(to_process):
             pack, to_download, to_link = what
+            if to_download and self.download_registry is not None:
+                key = (pack.checksum_type, pack.checksum)
+                if self.download_registry.claim(key):
+                    claimed[index] = key
+                else:
+                    shared[index] = key
+                    to_process[index] = (pack, False, to_link)
+                    continue
             if to_download:
                 target_file = os.path.join(plug.repo.pkgdir, os.path.basename(pack.unique_id.relativepath))
+                if target_file in queued:
+                    # another package with the same file name, e.g. from a
+                    # different directory of the repository
+                    target_file = os.path.join(plug.repo.pkgdir, "%d-%s" % (
+                        index, os.path.basename(pack.unique_id.relativepath)))
+                queued.add(target_file)
                 pack.path = target_file
                 params = {}
                 checksum_type = pack.checksum_type
@@ -860,9 +961,10 @@ class RepoSync(object):
                 to_download_count += 1
         if num_to_process != 0:
             log(0, "New packages to download:     %5d" % to_download_count)
+            if shared:
+                log(0, "Downloaded by other syncs:    %5d" % len(shared))
         logger = TextLogger(None, to_download_count)
         downloader.set_log_obj(logger)
-        downloader.run()
 
         log2background(0, "Importing packages started.")
         progress_bar = ProgressBarLogger("Importing packages:    ", to_download_count)
@@ -873,24 +975,41 @@ class RepoSync(object):
 
         mpm_bin_batch = importLib.Collection()
         mpm_src_batch = importLib.Collection()
+        # indexes in to_process of the packages in the batches
+        bin_indexes = []
+        src_indexes = []
+        # indexes of the packages imported and committed
+        committed = set()
         affected_channels = []
         upload_caller = "server.app.uploadPackage"
 
-        import_count = 0
-        for (index, what) in enumerate(to_process):
-            pack, to_download, to_link = what
-            if not to_download:
-                continue
-            import_count += 1
+        def import_binary_batch(batch, indexes):
+            importer = packageImport.PackageImport(batch, backend, caller=upload_caller)
+            importer.setUploadForce(1)
+            importer.run()
+            rhnSQL.commit()
+            committed.update(indexes)
+            del importer.batch
+            affected_channels.extend(importer.affected_channels)
+
+        def import_source_batch(batch, indexes):
+            src_importer = packageImport.SourcePackageImport(batch, backend, caller=upload_caller)
+            src_importer.setUploadForce(1)
+            src_importer.run()
+            rhnSQL.commit()
+            committed.update(indexes)
+
+        for (index, checksum_result) in self._download_packages(downloader, to_process, to_download_count):
+            pack = to_process[index][0]
             stage_path = pack.path
 
             # pylint: disable=W0703
             try:
                 # check if package was downloaded
-                if not os.path.exists(stage_path):
+                if checksum_result is None or not os.path.exists(stage_path):
                     raise Exception
 
-                pack.load_checksum_from_header()
+                pack.load_header(*checksum_result.get())
 
                 if not self.metadata_only:
                     rel_package_path = rhnPackageUpload.relative_path_from_header(pack.a_pkg.header, self.org_id,
@@ -900,9 +1019,6 @@ class RepoSync(object):
                     rel_package_path = None
 
                 if rel_package_path:
-                    # Save uploaded package to cache with repository checksum type
-                    self.checksum_cache[rel_package_path] = {pack.checksum_type: pack.checksum}
-
                     # First write the package to the filesystem to final location
                     # pylint: disable=W0703
                     try:
@@ -918,6 +1034,10 @@ class RepoSync(object):
                     except Exception:
                         raise_with_tb(rhnFault(50, "File error"), sys.exc_info()[2])
 
+                    # Save uploaded package to checksum index with repository checksum type
+                    self.checksum_index.set(os.path.join(CFG.MOUNT_POINT, rel_package_path),
+                                            pack.checksum_type, pack.checksum)
+
                     # Remove any pending scheduled file deletion for this package
                     h_delete_package_queue.execute(path=rel_package_path)
 
@@ -929,8 +1049,10 @@ class RepoSync(object):
 
                 if pack.a_pkg.header.is_source:
                     mpm_src_batch.append(pkg)
+                    src_indexes.append(index)
                 else:
                     mpm_bin_batch.append(pkg)
+                    bin_indexes.append(index)
                 # we do not want to keep a whole 'a_pkg' object for every package in memory,
                 # because we need only checksum. see BZ 1397417
                 pack.checksum = pack.a_pkg.checksum
@@ -946,26 +1068,18 @@ class RepoSync(object):
                     # Set to_link to False, no need to link again
                     to_process[index] = (pack, True, False)
 
-                # importing packages by batch or if the current packages is the last
-                if len(mpm_bin_batch) > 0 and (import_count == to_download_count
-                                               or len(mpm_bin_batch) % self.import_batch_size == 0):
-                    importer = packageImport.PackageImport(mpm_bin_batch, backend, caller=upload_caller)
-                    importer.setUploadForce(1)
-                    importer.run()
-                    rhnSQL.commit()
-                    del importer.batch
-                    affected_channels.extend(importer.affected_channels)
+                # importing packages by batch, the rest is imported after the loop
+                if len(mpm_bin_batch) >= self.import_batch_size:
+                    import_binary_batch(mpm_bin_batch, bin_indexes)
                     del mpm_bin_batch
                     mpm_bin_batch = importLib.Collection()
+                    bin_indexes = []
 
-                if len(mpm_src_batch) > 0 and (import_count == to_download_count
-                                               or len(mpm_src_batch) % self.import_batch_size == 0):
-                    src_importer = packageImport.SourcePackageImport(mpm_src_batch, backend, caller=upload_caller)
-                    src_importer.setUploadForce(1)
-                    src_importer.run()
-                    rhnSQL.commit()
+                if len(mpm_src_batch) >= self.import_batch_size:
+                    import_source_batch(mpm_src_batch, src_indexes)
                     del mpm_src_batch
                     mpm_src_batch = importLib.Collection()
+                    src_indexes = []
 
                 progress_bar.log(True, None)
             except KeyboardInterrupt:
@@ -985,10 +1099,39 @@ class RepoSync(object):
                 if is_non_local_repo and stage_path and os.path.exists(stage_path):
                     os.remove(stage_path)
 
+        if len(mpm_bin_batch) > 0:
+            import_binary_batch(mpm_bin_batch, bin_indexes)
+        if len(mpm_src_batch) > 0:
+            import_source_batch(mpm_src_batch, src_indexes)
+        del mpm_bin_batch
+        del mpm_src_batch
+
         if affected_channels:
             errataCache.schedule_errata_cache_update(affected_channels)
         log2background(0, "Importing packages finished.")
 
+        if self.download_registry is not None:
+            for (index, key) in claimed.items():
+                pack, to_download, _to_link = to_process[index]
+                if to_download and index in committed:
+                    self.download_registry.done(key, pack.checksum_type, pack.checksum, pack.epoch)
+                else:
+                    self.download_registry.failed(key)
+            for (index, key) in sorted(shared.items()):
+                pack, _to_download, to_link = to_process[index]
+                imported = self.download_registry.wait(key)
+                if imported is None:
+                    failed_packages += 1
+                    log2(0, 1, "Package %s failed to sync in another channel." % pack.getNVREA(),
+                         stream=sys.stderr)
+                    to_process[index] = (pack, False, False)
+                    continue
+                pack.checksum_type, pack.checksum, pack.epoch = imported
+                self.all_packages.add((pack.checksum_type, pack.checksum))
+                if (pack.checksum_type, pack.checksum) in to_disassociate:
+                    to_disassociate[(pack.checksum_type, pack.checksum)] = False
+                    to_process[index] = (pack, False, False)
+
         # Disassociate packages
         for (checksum_type, checksum) in to_disassociate:
             if to_disassociate[(checksum_type, checksum)]:
@@ -1007,21 +1150,86 @@ class RepoSync(object):
             self.regen = True
         return failed_packages
 
-    def match_package_checksum(self, relpath, abspath, checksum_type, checksum):
-        if os.path.exists(abspath):
-            if relpath not in self.checksum_cache:
-                self.checksum_cache[relpath] = {}
-            cached_checksums = self.checksum_cache[relpath]
-            if checksum_type not in cached_checksums:
-                checksum_disk = getFileChecksum(checksum_type, filename=abspath)
-                cached_checksums[checksum_type] = checksum_disk
+    @staticmethod
+    def _download_packages(downloader, to_process, to_download_count):
+        """ Run the downloader in background and yield (index, checksum_result) for
+            packages in to_process as soon as they are downloaded, so they can be
+            imported while the rest is still downloading. Header parsing and
+            checksumming runs in a process pool (a thread pool in daemonic
+            processes); checksum_result is the pool's
+            AsyncResult or None if the package was not downloaded. """
+        targets = {}
+        for (index, (pack, to_download, _to_link)) in enumerate(to_process):
+            if to_download:
+                targets[pack.path] = index
+
+        pool = None
+        if to_download_count:
+            processes = int(CFG.REPOSYNC_CHECKSUM_PROCESSES or 0) or cpu_count()
+            if current_process().daemon:
+                # channel synced in a worker of cdnsync's pool, which may
+                # not have children of its own
+                pool = ThreadPool(min(processes, to_download_count))
             else:
-                checksum_disk = cached_checksums[checksum_type]
-            if checksum_disk == checksum:
+                pool = Pool(min(processes, to_download_count))
+
+        done = Queue()
+        downloader.set_callback(lambda success, params: done.put(params['target_file']))
+        errors = []
+
+        def download():
+            # pylint: disable=W0703
+            try:
+                downloader.run()
+            except (KeyboardInterrupt, Exception):
+                errors.append(sys.exc_info())
+            done.put(None)
+
+        thread = Thread(target=download)
+        thread.setDaemon(True)
+        thread.start()
+
+        pending = []
+        try:
+            downloading = True
+            while downloading:
+                try:
+                    # don't wait for more downloads while there's something to import
+                    target = done.get(block=not pending, timeout=1)
+                except Empty:
+                    if pending:
+                        yield pending.pop(0)
+                    continue
+                if target is None:
+                    downloading = False
+                elif target in targets:
+                    index = targets.pop(target)
+                    if os.path.exists(target):
+                        pending.append((index, pool.apply_async(package_checksum, (target, ))))
+                    else:
+                        pending.append((index, None))
+            thread.join()
+            if errors:
+                raise_with_tb(errors[0][1], errors[0][2])
+            for item in pending:
+                yield item
+            # packages the downloader never got to
+            for index in sorted(targets.values()):
+                yield (index, None)
+        finally:
+            if thread.isAlive():
+                downloader.fail_download(KeyboardInterrupt())
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+    def match_package_checksum(self, abspath, checksum_type, checksum):
+        if os.path.exists(abspath):
+            if self.checksum_index.get(checksum_type, abspath) == checksum:
                 return 1
-        elif relpath in self.checksum_cache:
-            # Remove path from cache if not exists
-            del self.checksum_cache[relpath]
+        elif abspath:
+            # Remove path from index if not exists
+            self.checksum_index.remove(abspath)
         return 0
 
     def associate_package(self, pack):
@@ -45,7 +45,7 @@ from spacewalk.common import rhnMail, rhnLib
 from spacewalk.common.rhnLog import initLOG
 from spacewalk.common.rhnConfig import CFG, initCFG, PRODUCT_NAME
 from spacewalk.common.rhnTB import exitWithTraceback, fetchTraceback
-from spacewalk.common.checksum import getFileChecksum
+from spacewalk.common.checksum import ChecksumIndex
 from spacewalk.server import rhnSQL
 from spacewalk.server.rhnSQL import SQLError, SQLSchemaError, SQLConnectError
 from spacewalk.server.rhnLib import get_package_path
@@ -88,6 +88,13 @@ DEFAULT_ORG = 1
 # global so we don't have to pass it to everyone.
 OPTIONS = None
 
+# checksums of files already verified by previous runs
+_checksum_index = ChecksumIndex()
+
+# RPCGetWireSource keeps its connection and login at class level, so the
+# download threads may only use it one at a time
+_rpc_wire_source_lock = threading.Lock()
+
 # pylint: disable=W0212
 
 
@@ -951,12 +958,13 @@ class Syncer:
             return 0
 
         # Have to check checksum
-        l_checksum = getFileChecksum(checksum_type, filename=abs_path)
+        l_checksum = _checksum_index.get(checksum_type, abs_path)
         if l_checksum != checksum:
             return 2
 
         # Set the mtime
         os.utime(abs_path, (mtime, mtime))
+        _checksum_index.set(abs_path, checksum_type, checksum)
         return 0
 
     def _process_package(self, package_id, package, l_timestamp, row,
@@ -1709,7 +1717,6 @@ class Syncer:
         total_size = 0
         queue = Queue.Queue()
         out_queue = Queue.Queue()
-        lock = threading.Lock()
 
         # count size of missing packages
         for package_id, path in missing_fs_packages:
@@ -1722,10 +1729,11 @@ class Syncer:
         real_processed_size = processed_size = 0
         real_total_size = total_size
         start_time = round(time.time())
+        fetch_start_time = time.time()
 
         all_threads = []
-        for _thread in range(4):
-            t = ThreadDownload(lock, queue, out_queue, short_package_collection, package_collection,
+        for _thread in range(int(CFG.SATSYNC_DOWNLOAD_THREADS or 4)):
+            t = ThreadDownload(queue, out_queue, short_package_collection, package_collection,
                                self, self._failed_fs_packages, self._extinct_packages, sources, channel)
             t.setDaemon(True)
             t.start()
@@ -1781,6 +1789,12 @@ class Syncer:
             notimeYN=1)
         log(2, messages.package_fetch_summary_extinct % extinct_count,
             notimeYN=1)
+        elapsed = time.time() - fetch_start_time
+        if real_processed_size and elapsed > 0:
+            log(2, messages.package_fetch_summary_throughput %
+                (self._bytes_to_fuzzy(real_processed_size),
+                 datetime.timedelta(seconds=int(elapsed)),
+                 self._bytes_to_fuzzy(int(real_processed_size / elapsed))), notimeYN=1)
 
     # Translate x bytes to string "x MB", "x GB" or "x kB"
     @staticmethod
@@ -1798,9 +1812,10 @@ class Syncer:
         # pylint: disable=W0631
         return "%*.*f %s" % (int_len, fract_len, fuzzy, unit)
 
-    def _get_package_stream(self, channel, package_id, nvrea, sources):
+    def _get_package_stream(self, channel, package_id, nvrea, sources, wire_source=None):
         """ returns (filepath, stream), so in the case of a "wire source",
             the return value is, of course, (None, stream)
+            wire_source is the source to download from, see PackageWireSource
         """
 
         # Returns a package stream from disk
@@ -1818,18 +1833,24 @@ class Syncer:
 
         # Wire stream
         if CFG.ISS_PARENT:
-            stream = self.xmlDataServer.getRpm(nvrea, channel)
+            if wire_source is None:
+                wire_source = self.xmlDataServer
+            stream = wire_source.getRpm(nvrea, channel)
         else:
-            rpmServer = xmlWireSource.RPCGetWireSource(self.systemid, self.sslYN,
-                                                       self.xml_dump_version)
-            stream = rpmServer.getPackageStream(channel, nvrea)
+            _rpc_wire_source_lock.acquire()
+            try:
+                rpmServer = xmlWireSource.RPCGetWireSource(self.systemid, self.sslYN,
+                                                           self.xml_dump_version)
+                stream = rpmServer.getPackageStream(channel, nvrea)
+            finally:
+                _rpc_wire_source_lock.release()
 
         return (None, stream)
 
 
 class ThreadDownload(threading.Thread):
 
-    def __init__(self, lock, queue, out_queue, short_package_collection, package_collection, syncer,
+    def __init__(self, queue, out_queue, short_package_collection, package_collection, syncer,
                  failed_fs_packages, extinct_packages, sources, channel):
         threading.Thread.__init__(self)
         self.queue = queue
@@ -1841,7 +1862,12 @@ class ThreadDownload(threading.Thread):
         self.extinct_packages = extinct_packages
         self.sources = sources
         self.channel = channel
-        self.lock = lock
+        # every thread downloads over its own connection
+        self.wire_source = None
+        if not syncer.mountpoint:
+            self.wire_source = xmlWireSource.PackageWireSource(syncer.systemid, syncer.sslYN,
+                                                               syncer.xml_dump_version,
+                                                               syncer.xmlDataServer.server_handler)
 
     def run(self):
         while not self.queue.empty():
@@ -1882,14 +1908,8 @@ class ThreadDownload(threading.Thread):
 
             # Retry a number of times, we may have network errors
             for _try in range(cfg['networkRetries']):
-                self.lock.acquire()
-                try:
-                    rpmFile, stream = self.syncer._get_package_stream(self.channel,
-                                                                      package_id, nvrea, self.sources)
-                except:
-                    self.lock.release()
-                    raise
-                self.lock.release()
+                rpmFile, stream = self.syncer._get_package_stream(self.channel, package_id, nvrea,
+                                                                  self.sources, self.wire_source)
                 if stream is None:
                     # Mark the package as extinct
                     self.extinct_packages.put(package_id)
@@ -40,18 +40,21 @@ class BaseCache:
         # Get the key
         key = self._get_key(object_id)
         return rhnCache.get(key, modified=timestamp, raw=0,
-                            compressed=self._compressed)
+                            compressed=self._compressed,
+                            backend=CFG.CACHE_BACKEND)
 
     def cache_set(self, object_id, value, timestamp=None):
         # Get the key
         key = self._get_key(object_id)
         return rhnCache.set(key, value, modified=timestamp, raw=0,
-                            compressed=self._compressed)
+                            compressed=self._compressed,
+                            backend=CFG.CACHE_BACKEND)
 
     def cache_has_key(self, object_id, timestamp=None):
         # Get the key
         key = self._get_key(object_id)
-        return rhnCache.has_key(key, modified=timestamp)
+        return rhnCache.has_key(key, modified=timestamp,
+                                backend=CFG.CACHE_BACKEND)
 
     def _get_key(self, object_id):
         raise NotImplementedError()
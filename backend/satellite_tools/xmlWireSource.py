@@ -106,12 +106,15 @@ class BaseWireSource:
     def _set_connection(self, url):
         "Instantiates a connection object"
 
-        serverObj = connection.StreamConnection(url, proxy=CFG.HTTP_PROXY,
-                                                username=CFG.HTTP_PROXY_USERNAME, password=CFG.HTTP_PROXY_PASSWORD,
-                                                xml_dump_version=self.xml_dump_version, timeout=CFG.timeout)
+        serverObj = self._new_connection(url)
         BaseWireSource.serverObj = serverObj
         return serverObj
 
+    def _new_connection(self, url):
+        return connection.StreamConnection(url, proxy=CFG.HTTP_PROXY,
+                                           username=CFG.HTTP_PROXY_USERNAME, password=CFG.HTTP_PROXY_PASSWORD,
+                                           xml_dump_version=self.xml_dump_version, timeout=CFG.timeout)
+
     def _set_ssl_trusted_certs(self, serverObj):
         if not self.sslYN:
             return None
@@ -296,6 +299,33 @@ class MetadataWireSource(BaseWireSource):
                                       (self.systemid, ks_label, relative_path))
 
 
+class PackageWireSource(MetadataWireSource):
+
+    """MetadataWireSource with a server connection of its own instead of the
+    one shared by all the wire sources, so several download threads can fetch
+    packages from the master at the same time, each with its own instance."""
+
+    def __init__(self, systemid, sslYN=0, xml_dump_version=None, server_handler=None):
+        MetadataWireSource.__init__(self, systemid, sslYN, xml_dump_version)
+        self.serverObj = None
+        self.handler = ''
+        self.url = ''
+        self.server_handler = server_handler
+
+    def getServer(self, forcedYN=0):
+        if forcedYN:
+            self.setServer(self.handler, self.url, forcedYN)
+        return self.serverObj
+
+    def _set_connection_params(self, handler, url):
+        self.handler = handler
+        self.url = url
+
+    def _set_connection(self, url):
+        self.serverObj = self._new_connection(url)
+        return self.serverObj
+
+
 class XMLRPCWireSource(BaseWireSource):
 
     "Base class for all the XMLRPC calls"
@@ -28,6 +28,7 @@ import rhnSQL
 
 from apacheRequest import apacheGET, apachePOST, HandlerNotFoundError
 import rhnCapability
+from rhnServer import server_lib
 
 # a lame timer function for pretty logs
 
@@ -52,10 +53,19 @@ class apacheHandler(apacheSession):
 
     """ main Apache XMLRPC point of entry for the server """
 
+    # seconds during which a worker trusts the configuration it parsed and a
+    # database connection that served the previous request fine
+    BOOTSTRAP_INTERVAL = 5
+
     def __init__(self):
         # First call the inherited constructor:
         apacheSession.__init__(self)
         self._req_processor = None
+        # per-process state kept between requests
+        self._bootstrap_time = 0
+        self._db_ok = 0
+        self._template_strings = None
+        self._template_strings_time = 0
 
     ###
     # HANDLERS, in the order which they are called:
@@ -72,8 +82,14 @@ class apacheHandler(apacheSession):
         if "RHNComponentType" not in options:
             # clearly nothing to do
             return apache.OK
-        initCFG(options["RHNComponentType"])
-        initLOG(CFG.LOG_FILE, CFG.DEBUG)
+        now = time.time()
+        bootstrap = (now - self._bootstrap_time >= self.BOOTSTRAP_INTERVAL or
+                     CFG.getComponent() != options["RHNComponentType"])
+        if bootstrap:
+            # re-reads the configuration if it changed
+            initCFG(options["RHNComponentType"])
+            self._bootstrap_time = now
+        initLOG(CFG.LOG_FILE, CFG.DEBUG, CFG.LOG_FORMAT)
 
         """ parse the request, init database and figure out what can we call """
         log_debug(2, req.the_request)
@@ -81,16 +97,20 @@ class apacheHandler(apacheSession):
         ret = apacheSession.headerParserHandler(self, req)
         if ret != apache.OK:
             return ret
-        # make sure we have DB connection
+        # make sure we have DB connection, unless the previous request
+        # found it working
         if not CFG.SEND_MESSAGE_TO_ALL:
-            try:
-                rhnSQL.initDB()
-            except rhnSQL.SQLConnectError:
-                rhnTB.Traceback(mail=1, req=req, severity="schema")
-                return apache.HTTP_INTERNAL_SERVER_ERROR
+            if bootstrap or not self._db_ok:
+                try:
+                    rhnSQL.initDB()
+                except rhnSQL.SQLConnectError:
+                    rhnTB.Traceback(mail=1, req=req, severity="schema")
+                    return apache.HTTP_INTERNAL_SERVER_ERROR
         else:
             # If in outage mode, close the DB connections
             rhnSQL.closeDB()
+            self._template_strings = None
+        self._db_ok = 0
 
         # Store client capabilities
         client_cap_header = 'X-RHN-Client-Capability'
@@ -147,22 +167,10 @@ class apacheHandler(apacheSession):
             # code gets executed, as the rhnFault error messages use the
             # templates
             # If send_message_to_all, we don't have DB connectivity though
-            h = rhnSQL.prepare("select label, value from rhnTemplateString")
-            h.execute()
-
-            templateStrings = {}
-            while 1:
-                row = h.fetchone_dict()
-                if not row:
-                    break
-
-                templateStrings[row['label']] = row['value']
-
+            templateStrings = self._get_template_strings()
             if templateStrings:
                 rhnFlags.set('templateOverrides', templateStrings)
 
-            log_debug(4, "template strings:  %s" % templateStrings)
-
         if not CFG.SECRET_KEY:
             # Secret key not defined, complain loudly
             try:
@@ -206,9 +214,36 @@ class apacheHandler(apacheSession):
             if not CFG.SEND_MESSAGE_TO_ALL:
                 rhnSQL.rollback()
             raise
+        # the connection works, the next request can skip checking it
+        self._db_ok = not CFG.SEND_MESSAGE_TO_ALL
         log_debug(4, "Leave with return value", ret)
         return ret
 
+    def _get_template_strings(self):
+        """ Returns the template string overrides, read from the database
+            at most every CFG.TEMPLATE_STRINGS_CACHE_TIMEOUT seconds
+        """
+        now = time.time()
+        if self._template_strings is not None and \
+                now - self._template_strings_time < CFG.TEMPLATE_STRINGS_CACHE_TIMEOUT:
+            return self._template_strings
+
+        h = rhnSQL.prepare("select label, value from rhnTemplateString")
+        h.execute()
+
+        templateStrings = {}
+        while 1:
+            row = h.fetchone_dict()
+            if not row:
+                break
+
+            templateStrings[row['label']] = row['value']
+
+        log_debug(4, "template strings:  %s" % templateStrings)
+        self._template_strings = templateStrings
+        self._template_strings_time = now
+        return templateStrings
+
     def cleanupHandler(self, req):
         """ Clean up stuff before we close down the session when we are called
         from apacheServer.Cleanup() """
@@ -223,5 +258,7 @@ class apacheHandler(apacheSession):
             else:
                 log_error("Reaped child process %d with status %d" % (
                           pid, status))
+        # write the checkins collected by this process, if it is time
+        server_lib.flush_due_checkins()
         ret = apacheSession.cleanupHandler(self, req)
         return ret
@@ -25,7 +25,7 @@ import random
 
 # common modules imports
 from spacewalk.common.usix import LongType
-from spacewalk.common import rhnCache, rhnFlags, rhn_rpm
+from spacewalk.common import rhnCache, rhnFlags, rhn_evr
 from spacewalk.common.rhnLog import log_debug
 from spacewalk.common.rhnConfig import CFG
 from spacewalk.common.rhnException import rhnFault
@@ -243,6 +243,8 @@ class Applet(rhnHandler):
             return ret
 
         contents = {}
+        # the sort keys of the versions stored in contents
+        stored_keys = {}
 
         for p in plist:
             for k in p.keys():
@@ -253,30 +255,21 @@ class Applet(rhnHandler):
             p["nvr"] = "%s-%s-%s" % (p["name"], p["version"], p["release"])
 
             pkg_name = p["name"]
+            key = rhn_evr.evr_key(p["epoch"], p["version"], p["release"])
 
             if pkg_name in contents:
-                stored_pkg = contents[pkg_name]
-
-                s = [stored_pkg["name"],
-                     stored_pkg["version"],
-                     stored_pkg["release"],
-                     stored_pkg["epoch"]]
-
-                n = [p["name"],
-                     p["version"],
-                     p["release"],
-                     p["epoch"]]
-
-                log_debug(7, "comparing vres", s, n)
-                if rhn_rpm.nvre_compare(s, n) < 0:
+                log_debug(7, "comparing vres", contents[pkg_name]["nevr"], p["nevr"])
+                if stored_keys[pkg_name] < key:
                     log_debug(7, "replacing %s with %s" % (pkg_name, p))
                     contents[pkg_name] = p
+                    stored_keys[pkg_name] = key
                 else:
                     # already have a higher vre stored...
                     pass
             else:
                 log_debug(7, "initial store for %s" % pkg_name)
                 contents[pkg_name] = p
+                stored_keys[pkg_name] = key
 
         ret["contents"] = list(contents.values())
 
@@ -118,6 +118,7 @@ class Registration(rhnHandler):
         self.functions.append("new_system_user_pass")
 # self.functions.append("new_system_activation_key")
         self.functions.append("new_user")               # obsoleted
+        self.functions.append("package_digest")
         self.functions.append("privacy_statement")
         self.functions.append("refresh_hw_profile")
         self.functions.append("register_osad")
@@ -886,6 +887,15 @@ class Registration(rhnHandler):
         server.save_packages()
         return 0
 
+    def package_digest(self, system_id):
+        """ Returns the digest of the package profile saved for the server,
+            or an empty string if there is none. Clients compare it with the
+            digest of their rpmdb to skip uploading an unchanged profile.
+        """
+        log_debug(5, system_id)
+        server = self.auth_system(system_id)
+        return server.get_packages_digest() or ''
+
     def virt_notify(self, system_id, actions):
         """ This function fields virtualization-related notifications from the
             client and delegates them out to the appropriate downstream handlers.
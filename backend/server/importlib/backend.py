@@ -24,12 +24,13 @@ from spacewalk.common.usix import raise_with_tb
 from spacewalk.common import rhn_rpm
 from spacewalk.common.rhnConfig import CFG
 from spacewalk.common.rhnException import rhnFault
+from spacewalk.common.rhnLib import LRUCache
 from spacewalk.server import rhnSQL, rhnChannel, taskomatic
 from importLib import Diff, Package, IncompletePackage, Erratum, \
     AlreadyUploadedError, InvalidPackageError, TransactionError, \
     InvalidSeverityError, SourcePackage
 from backendLib import TableCollection, sanitizeValue, TableDelete, \
-    TableUpdate, TableLookup, addHash, TableInsert
+    TableUpdate, TableLookup, TableBulkLookup, addHash, TableInsert
 
 sequences = {
     'rhnPackageCapability': 'rhn_pkg_capability_id_seq',
@@ -54,11 +55,64 @@ sequences = {
     'rhnContentSource': 'rhn_chan_content_src_id_seq',
 }
 
+# Keys looked up at once by Backend._lookup_existing()
+LOOKUP_CHUNK_SIZE = 500
+
+# Ids remembered per kind of lookup (EVRs, checksums, ...)
+LOOKUP_CACHE_SIZE = 100000
+
 
 class Backend:
     # This object is initialized by the specific subclasses (e.g.
     # OracleBackend)
     tables = TableCollection()
+
+    # Ids of the package names, EVRs, checksums and NEVRAs looked up so far
+    # by this process, keyed by the values looked up. These rows are never
+    # modified once created, so the ids can be reused across batches.
+    _name_cache = LRUCache(LOOKUP_CACHE_SIZE)
+    _evr_cache = LRUCache(LOOKUP_CACHE_SIZE)
+    _checksum_cache = LRUCache(LOOKUP_CACHE_SIZE)
+    _nevra_cache = LRUCache(LOOKUP_CACHE_SIZE)
+
+    _query_lookup_names = """
+        select k.n, pn.id
+          from rhnPackageName pn, (%s) k
+         where pn.name = k.name
+    """
+
+    _query_lookup_evrs = """
+        select k.n, e.id
+          from rhnPackageEVR e, (%s) k
+         where e.version = k.version
+           and e.release = k.release
+           and (e.epoch = k.epoch or (e.epoch is null and k.epoch is null))
+    """
+
+    _query_lookup_checksums = """
+        select k.n, c.id
+          from rhnChecksumView c, (%s) k
+         where c.checksum = k.checksum
+           and c.checksum_type = k.checksum_type
+    """
+
+    _query_lookup_nevras = """
+        select k.n, pn.id
+          from rhnPackageNEVRA pn, (%s) k
+         where pn.name_id = k.name_id
+           and pn.evr_id = k.evr_id
+           and (pn.package_arch_id = k.package_arch_id or
+                (pn.package_arch_id is null and k.package_arch_id is null))
+    """
+
+    _query_lookup_packages_by_nevra = """
+        select k.n, p.id
+          from rhnPackage p, (%s) k
+         where p.name_id = k.name_id
+           and p.evr_id = k.evr_id
+           and p.package_arch_id = k.package_arch_id
+    """
+
     # TODO: Some reason why we're passing a module in here? Seems to
     # always be rhnSQL anyhow...
 
@@ -433,14 +487,73 @@ class Backend:
                 continue
             entries_hash[sgt] = row['id']
 
+    def _lookup_existing(self, query, columns, keys, numeric=()):
+        """
+        Look up the ids of many keys with one query per LOOKUP_CHUNK_SIZE
+        keys.
+
+        keys are tuples of values for the columns; query joins them, as the
+        subquery k with these columns (and n, the position of the key), and
+        selects k.n and the id. The columns in numeric are compared to
+        numbers.
+
+        Returns a dictionary of the keys found and their ids.
+        """
+        found = {}
+        for i in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+            chunk = keys[i:i + LOOKUP_CHUNK_SIZE]
+            rows = []
+            params = {}
+            for n, key in enumerate(chunk):
+                values = []
+                for column, value in zip(columns, key):
+                    bind = "%s_%d" % (column, n)
+                    params[bind] = value
+                    if column in numeric:
+                        # Make sure a null is typed as a number
+                        values.append(":%s + 0 as %s" % (bind, column))
+                    else:
+                        values.append(":%s as %s" % (bind, column))
+                rows.append("select %d as n, %s from dual" % (n, ', '.join(values)))
+            h = self.dbmodule.prepare(query % ' union all '.join(rows))
+            h.execute(**params)
+            for row in h.fetchall_dict() or []:
+                found[chunk[int(row['n'])]] = row['id']
+        return found
+
+    def _lookup_cached(self, cache, query, columns, keys, numeric=()):
+        """
+        Same as _lookup_existing(), remembering the ids in the cache.
+        """
+        found = {}
+        missing = []
+        for key in keys:
+            key_id = cache.get(key)
+            if key_id is None:
+                missing.append(key)
+            else:
+                found[key] = key_id
+        if missing:
+            existing = self._lookup_existing(query, columns, missing, numeric)
+            for key, key_id in existing.items():
+                cache.set(key, key_id)
+            found.update(existing)
+        return found
+
     def lookupPackageNames(self, nameHash):
         if not nameHash:
             return
+        names = [(k, ) for k in nameHash.keys()]
+        found = self._lookup_cached(self._name_cache, self._query_lookup_names,
+                                    ('name', ), names)
         sql = "select LOOKUP_PACKAGE_NAME(:name) id from dual"
         h = self.dbmodule.prepare(sql)
-        for k in nameHash.keys():
-            h.execute(name=k)
-            nameHash[k] = h.fetchone_dict()['id']
+        for key in names:
+            if key not in found:
+                h.execute(name=key[0])
+                found[key] = h.fetchone_dict()['id']
+                self._name_cache.set(key, found[key])
+            nameHash[key[0]] = found[key]
 
     def lookupErratum(self, erratum):
         if not erratum:
@@ -488,71 +601,98 @@ class Backend:
         return row['id']
 
     def lookupEVRs(self, evrHash):
-        sql = "select LOOKUP_EVR(:epoch, :version, :release) id from dual"
-        h = self.dbmodule.prepare(sql)
+        evrs = {}
         for evr in evrHash.keys():
             epoch, version, release = evr
             if epoch == '' or epoch is None:
                 epoch = None
             else:
                 epoch = str(epoch)
-            h.execute(epoch=epoch, version=version, release=release)
-            row = h.fetchone_dict()
-            if row:
-                evrHash[evr] = row['id']
+            evrs[evr] = (epoch, version, release)
+        found = self._lookup_cached(self._evr_cache, self._query_lookup_evrs,
+                                    ('epoch', 'version', 'release'),
+                                    list(set(evrs.values())))
+        sql = "select LOOKUP_EVR(:epoch, :version, :release) id from dual"
+        h = self.dbmodule.prepare(sql)
+        for evr, key in evrs.items():
+            if key not in found:
+                epoch, version, release = key
+                h.execute(epoch=epoch, version=version, release=release)
+                row = h.fetchone_dict()
+                if not row:
+                    continue
+                found[key] = row['id']
+                self._evr_cache.set(key, row['id'])
+            evrHash[evr] = found[key]
+
+    def _lookupExistingChecksums(self, checksumHash):
+        """
+        Fill in the ids of the checksums known already; returns the keys of
+        the ones still to be created.
+        """
+        checksums = [k for k in checksumHash.keys() if k[1] != '']
+        found = self._lookup_cached(self._checksum_cache,
+                                    self._query_lookup_checksums,
+                                    ('checksum_type', 'checksum'), checksums)
+        for k, checksum_id in found.items():
+            checksumHash[k] = checksum_id
+        return [k for k in checksums if k not in found]
 
     # Note: postgres-specific implementation overrides this in PostgresBackend
     def lookupChecksums(self, checksumHash):
         if not checksumHash:
             return
+        missing = self._lookupExistingChecksums(checksumHash)
+        if not missing:
+            return
         sql = "select lookup_checksum(:ctype, :csum) id from dual"
         h = self.dbmodule.prepare(sql)
-        for k in checksumHash.keys():
+        for k in missing:
             ctype, csum = k
-            if csum != '':
-                h.execute(ctype=ctype, csum=csum)
-                row = h.fetchone_dict()
-                if row:
-                    checksumHash[k] = row['id']
+            h.execute(ctype=ctype, csum=csum)
+            row = h.fetchone_dict()
+            if row:
+                checksumHash[k] = row['id']
+                self._checksum_cache.set(k, row['id'])
 
     def lookupChecksumTypes(self, checksumTypeHash):
         if not checksumTypeHash:
             return
-        sql = "select id from rhnChecksumType where label = :label"
+        sql = "select id, label from rhnChecksumType"
         h = self.dbmodule.prepare(sql)
-        for l in checksumTypeHash.keys():
-            h.execute(label=l)
-            row = h.fetchone_dict()
-            if row:
-                checksumTypeHash[l] = row['id']
+        h.execute()
+        for row in h.fetchall_dict() or []:
+            if row['label'] in checksumTypeHash:
+                checksumTypeHash[row['label']] = row['id']
 
     def lookupPackageNEVRAs(self, nevraHash):
+        found = self._lookup_cached(self._nevra_cache, self._query_lookup_nevras,
+                                    ('name_id', 'evr_id', 'package_arch_id'),
+                                    list(nevraHash.keys()),
+                                    numeric=('name_id', 'evr_id', 'package_arch_id'))
         sql = "select LOOKUP_PACKAGE_NEVRA(:name, :evr, :arch) id from dual"
         h = self.dbmodule.prepare(sql)
         for nevra in nevraHash:
-            name, evr, arch = nevra
-            if arch is None:
-                arch = ''
-            h.execute(name=name, evr=evr, arch=arch)
-            row = h.fetchone_dict()
-            if row:
-                nevraHash[nevra] = row['id']
+            if nevra not in found:
+                name, evr, arch = nevra
+                if arch is None:
+                    arch = ''
+                h.execute(name=name, evr=evr, arch=arch)
+                row = h.fetchone_dict()
+                if not row:
+                    continue
+                found[nevra] = row['id']
+                self._nevra_cache.set(nevra, row['id'])
+            nevraHash[nevra] = found[nevra]
 
     def lookupPackagesByNEVRA(self, nevraHash):
-        sql = """
-              select id from rhnPackage
-              where name_id = :name and
-                    evr_id = :evr and
-                    package_arch_id = :arch
-              """
-        h = self.dbmodule.prepare(sql)
-
-        for nevra in nevraHash:
-            name, evr, arch = nevra
-            h.execute(name=name, evr=evr, arch=arch)
-            row = h.fetchone_dict()
-            if row:
-                nevraHash[nevra] = row['id']
+        # Packages can be deleted, so these are not cached
+        found = self._lookup_existing(self._query_lookup_packages_by_nevra,
+                                      ('name_id', 'evr_id', 'package_arch_id'),
+                                      list(nevraHash.keys()),
+                                      numeric=('name_id', 'evr_id', 'package_arch_id'))
+        for nevra, package_id in found.items():
+            nevraHash[nevra] = package_id
 
     def lookupPackageKeyId(self, header):
         lookup_keyid_sql = rhnSQL.prepare("""
@@ -1360,14 +1500,6 @@ class Backend:
             # saving id
             hash[k] = h.fetchone_dict().popitem()[1]
 
-    def __buildQueries(self, childTables):
-        childTableLookups = {}
-        queryTempl = "select * from %s where %s = :id"
-        for childTableName in childTables:
-            childTableLookups[childTableName] = self.dbmodule.prepare(
-                queryTempl % (childTableName, childTables[childTableName]))
-        return childTableLookups
-
     def __processObjectCollection(self, objColl, parentTable, childTables=[],
                                   colname=None, **kwargs):
         # Returns the DML object that was processed
@@ -1440,10 +1572,9 @@ class Backend:
         # current severity limit
         brokenTransaction = 0
 
-        # Lookup object
-        lookup = TableLookup(parentTableObj, self.dbmodule)
-        # XXX
-        childTableLookups = self.__buildQueries(childTables)
+        # Look all the objects up at once
+        objects = [object for object in objColl if not object.ignored]
+        rows = TableBulkLookup(parentTableObj, self.dbmodule).query(objects)
         # For each valid object in the collection, look it up
         #   if it doesn't exist, insert all the associated information
         #   if it already exists:
@@ -1457,12 +1588,7 @@ class Backend:
         #       one if not explicitly specified). The "global" severity is the
         #       max of all severities.
         #   New objects will have a diff level of -1
-        for object in objColl:
-            if object.ignored:
-                # Skip it
-                continue
-            h = lookup.query(object)
-            row = h.fetchone_dict()
+        for object, row in zip(objects, rows):
             if not row:
                 # Object does not exist
                 id = self.sequences[parentTable].next()
@@ -1509,6 +1635,7 @@ class Backend:
             uploadedObjects[row['id']] = [object, row]
 
         # Deal with already-uploaded objects
+        toVerify = []
         for objid, (object, row) in uploadedObjects.items():
             # Build the external value
             extObject = {'id': row['id']}
@@ -1525,9 +1652,15 @@ class Backend:
                     # Same object, or not different enough
                     # not enough karma either
                     continue
+            toVerify.append((objid, object, extObject, diffval))
 
+        # Grab the child tables information for all of them at once
+        childTablesInfo = self.__getChildTablesInfo(
+            [x[0] for x in toVerify], childTables)
+
+        for objid, object, extObject, diffval in toVerify:
             localDML = self.__processUploaded(objid, object, childTables,
-                                              childTableLookups)
+                                              childTablesInfo[objid])
 
             if uploadForce < object.diff.level:
                 # Not enough karma
@@ -1554,7 +1687,7 @@ class Backend:
             raise TransactionError("Error uploading package source batch")
         return self.__doDML(dml)
 
-    def __processUploaded(self, objid, object, childTables, childTableLookups):
+    def __processUploaded(self, objid, object, childTables, childTablesInfo):
         # Store the DML operations locally
         localDML = {
             'insert': {},
@@ -1562,10 +1695,6 @@ class Backend:
             'delete': {},
         }
 
-        # Grab the rest of the information
-        childTablesInfo = self.__getChildTablesInfo(objid, list(childTables.keys()),
-                                                    childTableLookups)
-
         # Start computing deltas
         for childTableName in childTables:
             # Init the local hashes
@@ -1742,34 +1871,39 @@ class Backend:
                 raise InvalidPackageError(object, "Could not find object %s in table %s" % (object, tableName))
             object.id = row['id']
 
-    def __getChildTablesInfo(self, id, tables, queries):
-        # Returns a hash with the information about package id from tables
+    def __getChildTablesInfo(self, ids, childTables):
+        # Returns a hash keyed on the object ids, of hashes with the
+        # information about that object from each of the child tables
         result = {}
-        for tname in tables:
+        for id in ids:
+            result[id] = {}
+            for tname in childTables:
+                result[id][tname] = {}
+        for tname, colname in childTables.items():
             tableobj = self.tables[tname]
             fields = tableobj.getFields()
-            q = queries[tname]
-            q.execute(id=id)
-            hash = {}
-            while 1:
-                row = q.fetchone_dict()
-                if not row:
-                    break
-                pks = tableobj.getPK()
-                key = []
-                for f in pks:
-                    value = row[f]
-                    datatype = fields[f]
-                    value = sanitizeValue(value, datatype)
-                    key.append(value)
-                val = {}
-                for f, datatype in fields.items():
-                    value = row[f]
-                    value = sanitizeValue(value, datatype)
-                    val[f] = value
-                hash[tuple(key)] = val
-
-            result[tname] = hash
+            pks = tableobj.getPK()
+            for start in range(0, len(ids), LOOKUP_CHUNK_SIZE):
+                chunk = ids[start:start + LOOKUP_CHUNK_SIZE]
+                params = {}
+                for i in range(len(chunk)):
+                    params['id_%d' % i] = chunk[i]
+                q = self.dbmodule.prepare("select * from %s where %s in (%s)" % (
+                    tname, colname, ', '.join([':id_%d' % i for i in range(len(chunk))])))
+                q.execute(**params)
+                for row in q.fetchall_dict() or []:
+                    key = []
+                    for f in pks:
+                        value = row[f]
+                        datatype = fields[f]
+                        value = sanitizeValue(value, datatype)
+                        key.append(value)
+                    val = {}
+                    for f, datatype in fields.items():
+                        value = row[f]
+                        value = sanitizeValue(value, datatype)
+                        val[f] = value
+                    result[row[colname]][tname][tuple(key)] = val
         return result
 
     def __populateTable(self, table_name, data, delete_extra=1):
@@ -256,6 +256,50 @@ class TableLookup(BaseTableLookup):
         return self.queryTemplate % (self.table.name, self.whereclauses[key])
 
 
+class TableBulkLookup(BaseTableLookup):
+
+    """
+    Looks up the rows of many objects by the table's primary key, with one
+    query per chunk_size objects.
+    """
+
+    def __init__(self, table, dbmodule, chunk_size=500):
+        BaseTableLookup.__init__(self, table, dbmodule)
+        self.chunk_size = chunk_size
+        self.fields = self.table.getFields()
+
+    def _rowKey(self, values):
+        return tuple([sanitizeValue(values[col], self.fields[col])
+                      for col in self.pks])
+
+    def query(self, objects):
+        """
+        Returns the list of the rows (as dictionaries) of the objects, with
+        None for the ones not in the table.
+        """
+        found = {}
+        for start in range(0, len(objects), self.chunk_size):
+            clauses = []
+            params = {}
+            for i, values in enumerate(objects[start:start + self.chunk_size]):
+                key, hash = self._selectQueryKey(values)
+                conditions = []
+                for col, isnull in zip(self.pks, key):
+                    if isnull:
+                        conditions.append("%s is null" % col)
+                    else:
+                        bind = "%s_%d" % (col, i)
+                        conditions.append("%s = :%s" % (col, bind))
+                        params[bind] = hash[col]
+                clauses.append("(%s)" % string.join(conditions, ' and '))
+            statement = self.dbmodule.prepare("select * from %s where %s" % (
+                self.table.name, string.join(clauses, ' or ')))
+            statement.execute(**params)
+            for row in statement.fetchall_dict() or []:
+                found[self._rowKey(row)] = row
+        return [found.get(self._rowKey(values)) for values in objects]
+
+
 class TableUpdate(BaseTableLookup):
 
     def __init__(self, table, dbmodule):
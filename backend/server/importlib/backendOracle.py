@@ -665,25 +665,32 @@ class PostgresqlBackend(OracleBackend):
     def lookupChecksums(self, checksumHash):
         if not checksumHash:
             return
+        # Only lock the table if there is something to insert
+        missing = self._lookupExistingChecksums(checksumHash)
+        if not missing:
+            return
         # must lock the table to keep rhnpush or whomever from causing
         # this transaction to fail
         lock_sql = "lock table rhnChecksum in exclusive mode"
         sql = "select lookup_checksum_fast(:ctype, :csum) id from dual"
+        created = {}
         try:
             self.dbmodule.execute_secondary(lock_sql)
             h = self.dbmodule.prepare_secondary(sql)
-            for k in checksumHash.keys():
+            for k in missing:
                 ctype, csum = k
-                if csum != '':
-                    h.execute(ctype=ctype, csum=csum)
-                    row = h.fetchone_dict()
-                    if row:
-                        checksumHash[k] = row['id']
+                h.execute(ctype=ctype, csum=csum)
+                row = h.fetchone_dict()
+                if row:
+                    created[k] = row['id']
             self.dbmodule.commit_secondary()  # commit also unlocks the table
         except Exception:
             e = sys.exc_info()[1]
             self.dbmodule.execute_secondary("rollback")
             raise e
+        for k, checksum_id in created.items():
+            checksumHash[k] = checksum_id
+            self._checksum_cache.set(k, checksum_id)
 
 
 def SQLBackend():
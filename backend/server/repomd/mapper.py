@@ -30,6 +30,10 @@ import domain
 
 CACHE_PREFIX = "/var/cache/rhn/"
 
+# Number of packages loaded with a single set of queries when generating
+# channel metadata. Kept below the 1000 element Oracle limit for IN lists.
+PACKAGE_CHUNK_SIZE = 500
+
 
 class ChannelMapper:
 
@@ -61,6 +65,19 @@ class ChannelMapper:
             channel_id = :channel_id
         """)
 
+        self.package_timestamps_sql = rhnSQL.prepare("""
+        select
+            cp.package_id,
+            to_char(p.last_modified, 'YYYYMMDDHH24MISS') as last_modified
+        from
+            rhnChannelPackage cp,
+            rhnPackage p
+        where
+            cp.channel_id = :channel_id
+        and cp.package_id = p.id
+        order by cp.package_id
+        """)
+
         self.last_modified_sql = rhnSQL.prepare("""
         select
             to_char(last_modified, 'YYYYMMDDHH24MISS') as last_modified
@@ -104,6 +121,15 @@ class ChannelMapper:
         self.last_modified_sql.execute(channel_id=channel_id)
         return self.last_modified_sql.fetchone()[0]
 
+    def get_package_timestamps(self, channel_id):
+        """
+        Get the (package id, last_modified) pairs of the packages in the
+        channel with id channel_id, ordered by package id.
+        """
+        self.package_timestamps_sql.execute(channel_id=channel_id)
+        return [(row[0], row[1]) for row in
+                self.package_timestamps_sql.fetchall() or []]
+
     def get_channel(self, channel_id):
         """ Load the channel with id channel_id and its packages. """
 
@@ -140,9 +166,10 @@ class ChannelMapper:
         return channel
 
     def _package_generator(self, package_ids):
-        for package_id in package_ids:
-            pkg = self.pkg_mapper.get_package(package_id[0])
-            yield pkg
+        for i in range(0, len(package_ids), PACKAGE_CHUNK_SIZE):
+            chunk = [row[0] for row in package_ids[i:i + PACKAGE_CHUNK_SIZE]]
+            for pkg in self.pkg_mapper.get_packages(chunk):
+                yield pkg
 
     def _erratum_generator(self, channel_id):
         self.errata_id_sql.execute(channel_id=channel_id)
@@ -158,7 +185,7 @@ class CachedPackageMapper:
     """ Data Mapper for Packages to an on-disc cache. """
 
     def __init__(self, mapper):
-        cache = rhnCache.Cache()
+        cache = rhnCache.get_backend(CFG.CACHE_BACKEND)
 
         # For more speed, we won't compress.
         # cache = rhnCache.CompressedCache(cache)
@@ -176,10 +203,7 @@ class CachedPackageMapper:
         """
         package_id = str(package_id)
 
-        last_modified = str(self.mapper.last_modified(package_id))
-        last_modified = last_modified.replace(" ", "")
-        last_modified = last_modified.replace(":", "")
-        last_modified = last_modified.replace("-", "")
+        last_modified = _normalize_timestamp(self.mapper.last_modified(package_id))
 
         cache_key = "repomd-packages/" + package_id
         if self.cache.has_key(cache_key, last_modified):
@@ -190,12 +214,151 @@ class CachedPackageMapper:
 
         return package
 
+    def get_packages(self, package_ids):
+        """
+        Load the packages with ids package_ids, in the given order.
+
+        Cache validity is checked for the whole chunk at once and only the
+        packages missing from the cache are loaded (in bulk) from the
+        provided mapper.
+        """
+        last_modified = self.mapper.last_modified_bulk(package_ids)
+
+        packages = {}
+        missing = []
+        for package_id in package_ids:
+            timestamp = _normalize_timestamp(last_modified.get(int(package_id)))
+            cache_key = "repomd-packages/" + str(package_id)
+            if self.cache.has_key(cache_key, timestamp):
+                packages[package_id] = self.cache.get(cache_key)
+            else:
+                missing.append(package_id)
+
+        for package in self.mapper.get_packages(missing):
+            package_id = package.id
+            timestamp = _normalize_timestamp(last_modified.get(int(package_id)))
+            self.cache.set("repomd-packages/" + str(package_id), package,
+                           timestamp)
+            packages[package_id] = package
+
+        for package_id in package_ids:
+            yield packages[package_id]
+
 
 class SqlPackageMapper:
 
     """ Data Mapper for Packages to the RHN db. """
 
+    # Bulk versions of the queries below; %(package_ids)s is replaced with
+    # a list of bound package ids (see _bind_package_ids)
+    details_bulk_query = """
+        select
+            p.id,
+            pn.name,
+            pevr.version,
+            pevr.release,
+            pevr.epoch,
+            pa.label arch,
+            c.checksum checksum,
+            p.summary,
+            p.description,
+            p.vendor,
+            p.build_time,
+            p.package_size,
+            p.payload_size,
+            p.installed_size,
+            p.header_start,
+            p.header_end,
+            pg.name package_group,
+            p.build_host,
+            p.copyright,
+            p.path,
+            sr.name source_rpm,
+            p.last_modified,
+            c.checksum_type
+        from
+            rhnPackage p,
+            rhnPackageName pn,
+            rhnPackageEVR pevr,
+            rhnPackageArch pa,
+            rhnPackageGroup pg,
+            rhnSourceRPM sr,
+            rhnChecksumView c
+        where
+            p.id in (%(package_ids)s)
+        and p.name_id = pn.id
+        and p.evr_id = pevr.id
+        and p.package_arch_id = pa.id
+        and p.package_group = pg.id
+        and p.source_rpm_id = sr.id
+        and p.checksum_id = c.id
+        """
+
+    filelist_bulk_query = """
+        select
+            pf.package_id,
+            pc.name
+        from
+            rhnPackageCapability pc,
+            rhnPackageFile pf
+        where
+            pf.package_id in (%(package_ids)s)
+        and pf.capability_id = pc.id
+        """
+
+    prco_bulk_subquery = """
+        select
+           '%(dep_type)s',
+           dep.package_id,
+           dep.sense,
+           pc.name,
+           pc.version
+        from
+           rhnPackageCapability pc,
+           %(table)s dep
+        where
+           dep.package_id in (%%(package_ids)s)
+           and dep.capability_id = pc.id
+        """
+
+    last_modified_bulk_query = """
+        select
+            id,
+            to_char(last_modified, 'YYYYMMDDHH24MISS') as last_modified
+        from
+            rhnPackage
+        where id in (%(package_ids)s)
+        """
+
+    other_bulk_query = """
+        select
+            package_id,
+            name,
+            text,
+            time
+        from
+            rhnPackageChangelog
+        where package_id in (%(package_ids)s)
+        """
+
+    prco_tables = [
+        ('provides', 'rhnPackageProvides'),
+        ('requires', 'rhnPackageRequires'),
+        ('recommends', 'rhnPackageRecommends'),
+        ('supplements', 'rhnPackageSupplements'),
+        ('enhances', 'rhnPackageEnhances'),
+        ('suggests', 'rhnPackageSuggests'),
+        ('conflicts', 'rhnPackageConflicts'),
+        ('obsoletes', 'rhnPackageObsoletes'),
+        ('breaks', 'rhnPackageBreaks'),
+        ('predepends', 'rhnPackagePredepends'),
+    ]
+
     def __init__(self):
+        self.prco_bulk_query = "union all".join(
+            [self.prco_bulk_subquery % {'dep_type': dep_type, 'table': table}
+             for dep_type, table in self.prco_tables])
+
         self.details_sql = rhnSQL.prepare("""
         select
             pn.name,
@@ -394,6 +557,19 @@ class SqlPackageMapper:
         self.last_modified_sql.execute(package_id=package_id)
         return self.last_modified_sql.fetchone()[0]
 
+    def last_modified_bulk(self, package_ids):
+        """
+        Get the last_modified dates of the packages with ids package_ids.
+
+        Returns a dictionary keyed by (integer) package id.
+        """
+        ret = {}
+        if not package_ids:
+            return ret
+        for row in self._fetch_bulk(self.last_modified_bulk_query, package_ids):
+            ret[int(row[0])] = row[1]
+        return ret
+
     def get_package(self, package_id):
         """ Get the package with id package_id from the RHN db. """
         package = domain.Package(package_id)
@@ -403,6 +579,46 @@ class SqlPackageMapper:
         self._fill_package_other(package)
         return package
 
+    def get_packages(self, package_ids):
+        """
+        Get the packages with ids package_ids from the RHN db.
+
+        Uses one query per table for all the packages, instead of a set of
+        queries per package. Packages are returned in the order of
+        package_ids.
+        """
+        if not package_ids:
+            return []
+
+        packages = {}
+        for package_id in package_ids:
+            packages[int(package_id)] = domain.Package(package_id)
+
+        for row in self._fetch_bulk(self.details_bulk_query, package_ids):
+            self._set_package_details(packages[int(row[0])], row[1:])
+
+        for row in self._fetch_bulk(self.prco_bulk_query, package_ids):
+            self._add_package_dep(packages[int(row[1])], (row[0],) + tuple(row[2:]))
+
+        for row in self._fetch_bulk(self.filelist_bulk_query, package_ids):
+            packages[int(row[0])].files.append(string_to_unicode(row[1]))
+
+        for row in self._fetch_bulk(self.other_bulk_query, package_ids):
+            self._add_package_changelog(packages[int(row[0])], row[1:])
+
+        return [packages[int(package_id)] for package_id in package_ids]
+
+    @staticmethod
+    def _fetch_bulk(query, package_ids):
+        """ Run a bulk query over package_ids, PACKAGE_CHUNK_SIZE at a time. """
+        for i in range(0, len(package_ids), PACKAGE_CHUNK_SIZE):
+            sql_list, bound_vars = _bind_package_ids(
+                package_ids[i:i + PACKAGE_CHUNK_SIZE])
+            h = rhnSQL.prepare(query % {'package_ids': sql_list})
+            h.execute(**bound_vars)
+            for row in h.fetchall() or []:
+                yield row
+
     def _get_package_filename(self, pkg):
         if pkg[18]:
             path = pkg[18]
@@ -418,8 +634,9 @@ class SqlPackageMapper:
     def _fill_package_details(self, package):
         """ Load the packages basic details (summary, description, etc). """
         self.details_sql.execute(package_id=package.id)
-        pkg = self.details_sql.fetchone()
+        self._set_package_details(package, self.details_sql.fetchone())
 
+    def _set_package_details(self, package, pkg):
         package.name = pkg[0]
         package.version = pkg[1]
         package.release = pkg[2]
@@ -452,49 +669,53 @@ class SqlPackageMapper:
         deps = self.prco_sql.fetchall() or []
 
         for item in deps:
-            version = item[3] or ""
-            relation = ""
-            release = None
-            epoch = 0
-            if version:
-                sense = item[1] or 0
-                relation = SqlPackageMapper.__get_relation(sense)
-
-                vertup = version.split('-')
-                if len(vertup) > 1:
-                    version = vertup[0]
-                    release = vertup[1]
-
-                vertup = version.split(':')
-                if len(vertup) > 1:
-                    epoch = vertup[0]
-                    version = vertup[1]
-
-            dep = {'name': string_to_unicode(item[2]), 'flag': relation,
-                   'version': version, 'release': release, 'epoch': epoch}
-
-            if item[0] == "provides":
-                package.provides.append(dep)
-            elif item[0] == "requires":
-                package.requires.append(dep)
-            elif item[0] == "conflicts":
-                package.conflicts.append(dep)
-            elif item[0] == "obsoletes":
-                package.obsoletes.append(dep)
-            elif item[0] == "recommends":
-                package.recommends.append(dep)
-            elif item[0] == "supplements":
-                package.supplements.append(dep)
-            elif item[0] == "enhances":
-                package.enhances.append(dep)
-            elif item[0] == "suggests":
-                package.suggests.append(dep)
-            elif item[0] == "breaks":
-                package.breaks.append(dep)
-            elif item[0] == "predepends":
-                package.predepends.append(dep)
-            else:
-                assert False, "Unknown PRCO type: %s" % item[0]
+            self._add_package_dep(package, item)
+
+    def _add_package_dep(self, package, item):
+        """ Add a (type, sense, name, version) dependency to the package. """
+        version = item[3] or ""
+        relation = ""
+        release = None
+        epoch = 0
+        if version:
+            sense = item[1] or 0
+            relation = SqlPackageMapper.__get_relation(sense)
+
+            vertup = version.split('-')
+            if len(vertup) > 1:
+                version = vertup[0]
+                release = vertup[1]
+
+            vertup = version.split(':')
+            if len(vertup) > 1:
+                epoch = vertup[0]
+                version = vertup[1]
+
+        dep = {'name': string_to_unicode(item[2]), 'flag': relation,
+               'version': version, 'release': release, 'epoch': epoch}
+
+        if item[0] == "provides":
+            package.provides.append(dep)
+        elif item[0] == "requires":
+            package.requires.append(dep)
+        elif item[0] == "conflicts":
+            package.conflicts.append(dep)
+        elif item[0] == "obsoletes":
+            package.obsoletes.append(dep)
+        elif item[0] == "recommends":
+            package.recommends.append(dep)
+        elif item[0] == "supplements":
+            package.supplements.append(dep)
+        elif item[0] == "enhances":
+            package.enhances.append(dep)
+        elif item[0] == "suggests":
+            package.suggests.append(dep)
+        elif item[0] == "breaks":
+            package.breaks.append(dep)
+        elif item[0] == "predepends":
+            package.predepends.append(dep)
+        else:
+            assert False, "Unknown PRCO type: %s" % item[0]
 
 #    @staticmethod
     def __get_relation(sense):
@@ -535,12 +756,16 @@ class SqlPackageMapper:
         log_data = self.other_sql.fetchall() or []
 
         for data in log_data:
+            self._add_package_changelog(package, data)
 
-            date = oratimestamp_to_sinceepoch(data[2])
+    @staticmethod
+    def _add_package_changelog(package, data):
+        """ Add a (name, text, time) changelog entry to the package. """
+        date = oratimestamp_to_sinceepoch(data[2])
 
-            chglog = {'author': string_to_unicode(data[0]), 'date': date,
-                      'text': string_to_unicode(data[1])}
-            package.changelog.append(chglog)
+        chglog = {'author': string_to_unicode(data[0]), 'date': date,
+                  'text': string_to_unicode(data[1])}
+        package.changelog.append(chglog)
 
 
 class CachedErratumMapper:
@@ -550,7 +775,7 @@ class CachedErratumMapper:
     def __init__(self, mapper, package_mapper):
         self.package_mapper = package_mapper
 
-        cache = rhnCache.Cache()
+        cache = rhnCache.get_backend(CFG.CACHE_BACKEND)
         cache = rhnCache.ObjectCache(cache)
         self.cache = rhnCache.NullCache(cache)
         self.mapper = mapper
@@ -572,9 +797,8 @@ class CachedErratumMapper:
         cache_key = "repomd-errata/" + erratum_id
         if self.cache.has_key(cache_key, last_modified):
             erratum = self.cache.get(cache_key)
-            for package_id in erratum.package_ids:
-                package = self.package_mapper.get_package(package_id)
-                erratum.packages.append(package)
+            erratum.packages.extend(
+                self.package_mapper.get_packages(erratum.package_ids))
         else:
             erratum = self.mapper.get_erratum(erratum_id)
 
@@ -704,10 +928,9 @@ class SqlErratumMapper:
         self.erratum_packages_sql.execute(erratum_id=erratum.id)
         pkgs = self.erratum_packages_sql.fetchall()
 
-        for pkg in pkgs:
-            package = self.package_mapper.get_package(pkg[0])
-            erratum.packages.append(package)
-            erratum.package_ids.append(pkg[0])
+        erratum.package_ids.extend([pkg[0] for pkg in pkgs])
+        erratum.packages.extend(
+            self.package_mapper.get_packages(erratum.package_ids))
 
 
 class SqlCompsMapper:
@@ -755,6 +978,30 @@ def get_erratum_mapper(package_mapper):
     return erratum_mapper
 
 
+def _bind_package_ids(package_ids):
+    """
+    Transform a list of package ids into an sql list with bound parameters.
+
+    Returns a tuple of the comma separated list of parameter names and a
+    dict of the parameter names and values.
+    """
+    bound_names = []
+    bound_vars = {}
+    for i, package_id in enumerate(package_ids):
+        bound_vars['p_%s' % i] = package_id
+        bound_names.append(':p_%s' % i)
+    return ', '.join(bound_names), bound_vars
+
+
+def _normalize_timestamp(last_modified):
+    """ Strip a last_modified value down to a YYYYMMDDHHMISS cache timestamp. """
+    last_modified = str(last_modified)
+    last_modified = last_modified.replace(" ", "")
+    last_modified = last_modified.replace(":", "")
+    last_modified = last_modified.replace("-", "")
+    return last_modified
+
+
 def oratimestamp_to_sinceepoch(ts):
     return time.mktime((ts.year, ts.month, ts.day, ts.hour, ts.minute,
                         ts.second, 0, 0, -1))
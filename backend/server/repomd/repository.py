@@ -17,19 +17,16 @@
 #
 
 import time
-try:
-    #  python 2
-    import StringIO
-except ImportError:
-    #  python3
-    import io as StringIO
 import shutil
+import struct
+import tempfile
+import threading
+import zlib
 import os.path
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 
-from gzip import GzipFile
-from gzip import write32u
-
-from spacewalk.common.usix import LongType
+from rhn.i18n import bstr
 from spacewalk.common import checksum
 from spacewalk.common import rhnCache
 from spacewalk.common.rhnLog import log_debug
@@ -43,6 +40,10 @@ from spacewalk.server import rhnChannel
 # One meg
 CHUNK_SIZE = 1048576
 
+# Size of the blocks compressed in parallel into separate gzip members
+GZIP_BLOCK_SIZE = 1048576
+GZIP_THREADS = cpu_count()
+
 comps_mapping = {
     'rhel-x86_64-client-5': 'rhn/kickstart/ks-rhel-x86_64-client-5/Client/repodata/comps-rhel5-client-core.xml',
     'rhel-x86_64-client-vt-5': 'rhn/kickstart/ks-rhel-x86_64-client-5/VT/repodata/comps-rhel5-vt.xml',
@@ -75,6 +76,7 @@ class Repository(object):
         self.updateinfo_prefix = "repomd_updateinfo.xml"
 
         self._channel = None
+        self._channel_mapper = None
 
         cache = rhnCache.Cache()
         self.cache = rhnCache.NullCache(cache)
@@ -140,7 +142,14 @@ class Repository(object):
     def get_cache_view(self, cache_prefix, view_class):
         cache_entry = self.get_cache_entry_name(cache_prefix)
         ret = self.cache.set_file(cache_entry, self.last_modified)
-        viewobj = view_class(self.channel, ret)
+
+        # Compress the metadata while it is generated, so that
+        # CachedRepository finds the gzipped version in the cache too
+        gz_cache_entry = self.get_cache_entry_name(cache_prefix + ".gz")
+        gz_ret = self.cache.set_file(gz_cache_entry, self.last_modified)
+
+        viewobj = view_class(self.channel,
+                             TeeFile(ret, ParallelGzipFile(gz_ret)))
         return viewobj
 
     def get_primary_cache(self):
@@ -191,16 +200,225 @@ class Repository(object):
             view.write_end()
             view.fileobj.close()
 
+    def _get_channel_mapper(self):
+        if self._channel_mapper is None:
+            self._channel_mapper = mapper.get_channel_mapper()
+        return self._channel_mapper
+
     def __get_channel(self):
         """ Late binding for the channel. """
         if self._channel is None:
-            channel_mapper = mapper.get_channel_mapper()
+            channel_mapper = self._get_channel_mapper()
             self._channel = channel_mapper.get_channel(self.channel_id)
         return self._channel
 
     channel = property(__get_channel)
 
 
+class IncrementalRepository(Repository):
+
+    """
+    Repository splicing its metadata together from cached package fragments.
+
+    The XML each view writes for the packages of the channel is kept in the
+    cache as one bundle per view, in package order, next to a manifest
+    recording the last_modified, offset and length of every package's
+    fragment. Regenerating a view compares the channel's packages with the
+    manifest of that view: only the added or changed packages are loaded and
+    rendered, the fragments of all the others are read sequentially from
+    the bundle.
+    """
+
+    def __init__(self, channel):
+        Repository.__init__(self, channel)
+
+        cache = rhnCache.get_backend(CFG.CACHE_BACKEND)
+        self.fragment_cache = rhnCache.NullCache(cache)
+        self.generation_cache = rhnCache.NullCache(rhnCache.ObjectCache(cache))
+
+    def _generation_key(self, view):
+        return "repomd-generations/%s/%s" % (view.fragment_name, self.channel_id)
+
+    def _bundle_key(self, view, slot):
+        return "repomd-fragments/%s/%s-%s" % (view.fragment_name,
+                                              self.channel_id, slot)
+
+    def _lock_key(self, view):
+        return "repomd-locks/%s/%s" % (view.fragment_name, self.channel_id)
+
+    def generate_files(self, views):
+        channel_mapper = self._get_channel_mapper()
+        packages = channel_mapper.get_package_timestamps(self.channel_id)
+
+        generations = []
+        try:
+            for view in views:
+                generations.append(_Generation(self, view, packages))
+
+            self.channel.num_packages = len(packages)
+            for view in views:
+                view.write_start()
+
+            for i in range(0, len(packages), mapper.PACKAGE_CHUNK_SIZE):
+                chunk = packages[i:i + mapper.PACKAGE_CHUNK_SIZE]
+                rendered = self._render_packages(
+                    views, [package for package in chunk
+                            if [g for g in generations if g.changed(package)]])
+                for package_id, last_modified in chunk:
+                    for view, generation in zip(views, generations):
+                        fragment = rendered.get((view.fragment_name, package_id))
+                        if fragment is None:
+                            fragment = generation.read(package_id)
+                        if fragment is None:
+                            fragment = self._render_package(view, package_id)
+                        view.write_fragment(fragment)
+                        generation.write(package_id, last_modified, fragment)
+
+            for view in views:
+                view.write_end()
+                view.fileobj.close()
+        except:
+            for generation in generations:
+                generation.abort()
+            raise
+
+        for generation in generations:
+            generation.commit()
+
+    def _render_packages(self, views, packages):
+        """
+        Render the fragments of the (package id, last_modified) pairs in
+        packages, for all the views.
+        """
+        rendered = {}
+        if not packages:
+            return rendered
+        pkg_mapper = self._get_channel_mapper().pkg_mapper
+        for package in pkg_mapper.get_packages([p[0] for p in packages]):
+            for view in views:
+                rendered[(view.fragment_name, package.id)] = bstr(view.render_package(package))
+        return rendered
+
+    def _render_package(self, view, package_id):
+        """ Render a fragment the bundle should have had, but did not. """
+        package = self._get_channel_mapper().pkg_mapper.get_package(package_id)
+        return bstr(view.render_package(package))
+
+
+# Serialize the generations of the same channel and view within a process;
+# the lock files only do so between processes
+_generation_locks = {}
+_generation_locks_lock = threading.Lock()
+
+
+def _generation_lock(key):
+    _generation_locks_lock.acquire()
+    try:
+        return _generation_locks.setdefault(key, threading.Lock())
+    finally:
+        _generation_locks_lock.release()
+
+
+class _Generation(object):
+
+    """
+    The cached fragments of one view of an IncrementalRepository: reads the
+    bundle of the previous generation and writes the bundle of the next one
+    into the other of two slots, switching the manifest over on commit().
+    Generations of the same channel and view are serialized by a lock file
+    held from before the slot is chosen until commit() or abort().
+    """
+
+    def __init__(self, repository, view, packages):
+        lock_key = repository._lock_key(view)
+        self.thread_lock = _generation_lock(lock_key)
+        self.thread_lock.acquire()
+        self.lock = None
+        try:
+            self.lock = rhnCache.WriteLockedFile(lock_key)
+            self._start(repository, view, packages)
+        except:
+            self._unlock()
+            raise
+
+    def _start(self, repository, view, packages):
+        self.repository = repository
+        self.key = repository._generation_key(view)
+        previous = repository.generation_cache.get(self.key)
+        self.bundle = None
+        if previous:
+            self.bundle = repository.fragment_cache.get_file(
+                repository._bundle_key(view, previous['slot']))
+        if self.bundle is None:
+            previous = {'slot': 1, 'packages': {}}
+        self.previous = previous['packages']
+        self.position = 0
+        self.slot = 1 - previous['slot']
+        self.bundle_key = repository._bundle_key(view, self.slot)
+        self.old_bundle_key = repository._bundle_key(view, previous['slot'])
+        self.output = repository.fragment_cache.set_file(self.bundle_key)
+        self.offset = 0
+        self.current = {}
+        current = dict(packages)
+        log_debug(2, "Channel %s, %s: %d packages, %d added or changed, %d removed"
+                  % (repository.channel_id, view.fragment_name, len(packages),
+                     len([p for p in packages if self.changed(p)]),
+                     len([package_id for package_id in self.previous
+                          if package_id not in current])))
+
+    def changed(self, package):
+        entry = self.previous.get(package[0])
+        return entry is None or entry[0] != package[1]
+
+    def read(self, package_id):
+        """ The fragment of an unchanged package, or None """
+        entry = self.previous.get(package_id)
+        if entry is None or self.bundle is None:
+            return None
+        offset, length = entry[1], entry[2]
+        # the packages come in the same order as in the bundle, so this
+        # only skips the fragments of changed or removed packages
+        if offset != self.position:
+            self.bundle.seek(offset)
+        fragment = self.bundle.read(length)
+        self.position = offset + len(fragment)
+        if len(fragment) != length:
+            return None
+        return fragment
+
+    def write(self, package_id, last_modified, fragment):
+        self.output.write(fragment)
+        self.current[package_id] = (last_modified, self.offset, len(fragment))
+        self.offset = self.offset + len(fragment)
+
+    def _unlock(self):
+        if self.lock is not None:
+            self.lock.close()
+        self.thread_lock.release()
+
+    def _close_bundle(self):
+        if self.bundle is not None:
+            self.bundle.close()
+            self.bundle = None
+
+    def commit(self):
+        self._close_bundle()
+        self.output.close()
+        self.repository.generation_cache.set(
+            self.key, {'slot': self.slot, 'packages': self.current})
+        try:
+            self.repository.fragment_cache.delete(self.old_bundle_key)
+        except (KeyError, OSError):
+            pass
+        self._unlock()
+
+    def abort(self):
+        self._close_bundle()
+        # the manifest still describes the bundle of the previous generation
+        self.output.close()
+        self._unlock()
+
+
 class CompressedRepository:
 
     """ Decorator for Repositories adding gzip compression of the output. """
@@ -236,16 +454,16 @@ class CompressedRepository:
         return getattr(self.repository, x)
 
     def __get_compressed_file(self, uncompressed_file):
-        string_file = StringIO.StringIO()
-        gzip_file = NoTimeStampGzipFile(mode="wb", fileobj=string_file)
+        temp_file = tempfile.TemporaryFile()
+        gzip_file = ParallelGzipFile(temp_file)
 
-        shutil.copyfileobj(uncompressed_file, gzip_file)
+        shutil.copyfileobj(uncompressed_file, gzip_file, CHUNK_SIZE)
 
-        gzip_file.close()
+        gzip_file.finish()
 
-        string_file.seek(0, 0)
+        temp_file.seek(0, 0)
 
-        return string_file
+        return temp_file
 
 
 class CachedRepository:
@@ -409,7 +627,10 @@ class MetadataRepository:
 
 def get_repository(channel):
     """ Factory Method-ish function to create a repository from a channel. """
-    repository = Repository(channel)
+    if CFG.REPOMD_INCREMENTAL:
+        repository = IncrementalRepository(channel)
+    else:
+        repository = Repository(channel)
 
     compressed_repository = CompressedRepository(repository)
     compressed_repository = CachedRepository(compressed_repository)
@@ -419,13 +640,101 @@ def get_repository(channel):
     return meta_repository
 
 
-class NoTimeStampGzipFile(GzipFile):
+# gzip member header without file name and timestamp, so that the output
+# only depends on the data
+_GZIP_HEADER = b'\037\213\010\000\000\000\000\000\002\377'
+
+_gzip_pool = None
+_gzip_pool_lock = threading.Lock()
+
+
+def _get_gzip_pool():
+    global _gzip_pool
+    _gzip_pool_lock.acquire()
+    try:
+        if _gzip_pool is None:
+            _gzip_pool = ThreadPool(GZIP_THREADS)
+        return _gzip_pool
+    finally:
+        _gzip_pool_lock.release()
+
+
+def _gzip_member(data, level):
+    """ Compress data into a complete gzip member. """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return _GZIP_HEADER + compressor.compress(data) + compressor.flush() + \
+        struct.pack("<II", zlib.crc32(data) & 0xffffffff,
+                    len(data) & 0xffffffff)
+
+
+class ParallelGzipFile(object):
+
+    """
+    Write-only gzip file compressing blocks of data on all the CPUs.
+
+    Every block becomes an independent gzip member, the way pigz does it;
+    a concatenation of gzip members is a valid gzip file. zlib releases the
+    GIL while compressing, so the blocks get compressed in parallel while
+    the caller keeps producing data. Only a few blocks per thread are kept
+    in memory.
+    """
 
-    def _write_gzip_header(self):
-        self.fileobj.write('\037\213')
-        self.fileobj.write('\010')
-        # no flags
-        self.fileobj.write('\x00')
-        write32u(self.fileobj, LongType(0))
-        self.fileobj.write('\002')
-        self.fileobj.write('\377')
+    def __init__(self, fileobj, level=9, block_size=GZIP_BLOCK_SIZE):
+        self.fileobj = fileobj
+        self.level = level
+        self.block_size = block_size
+        self.buffer = []
+        self.buffered = 0
+        self.pending = []
+        self.members = 0
+        self.closed = False
+
+    def write(self, data):
+        self.buffer.append(data)
+        self.buffered = self.buffered + len(data)
+        if self.buffered >= self.block_size:
+            self._compress_buffer()
+
+    def _compress_buffer(self):
+        block = b''.join(self.buffer)
+        self.buffer = []
+        self.buffered = 0
+        self.pending.append(_get_gzip_pool().apply_async(
+            _gzip_member, (block, self.level)))
+        self.members = self.members + 1
+        while len(self.pending) > 2 * GZIP_THREADS:
+            self.fileobj.write(self.pending.pop(0).get())
+
+    def flush(self):
+        pass
+
+    def finish(self):
+        """ Write out all the data, leaving fileobj open. """
+        if self.buffer or not self.members:
+            # An empty file still needs one (empty) gzip member
+            self._compress_buffer()
+        while self.pending:
+            self.fileobj.write(self.pending.pop(0).get())
+
+    def close(self):
+        """ Write out all the data and close fileobj. """
+        if not self.closed:
+            self.finish()
+            self.fileobj.close()
+            self.closed = True
+
+
+class TeeFile(object):
+
+    """ Write-only file object copying the data to several files. """
+
+    def __init__(self, *files):
+        self.files = files
+
+    def write(self, data):
+        for f in self.files:
+            f.write(data)
+
+    def close(self):
+        for f in self.files:
+            f.close()
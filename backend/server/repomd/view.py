@@ -16,6 +16,48 @@ import re
 
 XML_ENCODING = "<?xml version=\"1.0\" encoding=\"UTF-8\"?>"
 
+# Files listed in primary.xml (in addition to filelists.xml)
+PRIMARY_FILES_RE = re.compile(r'.*bin\/.*|^\/etc\/.*|^\/usr\/lib\.sendmail$')
+
+# Views hand their output to the underlying file in pieces of this size
+CHUNK_SIZE = 65536
+
+
+class ChunkedWriter(object):
+
+    """ Collects the many small writes of a view into CHUNK_SIZE pieces. """
+
+    def __init__(self, fileobj, chunk_size=CHUNK_SIZE):
+        self.fileobj = fileobj
+        self.chunk_size = chunk_size
+        self.buffer = []
+        self.buffered = 0
+
+    def write(self, data):
+        self.buffer.append(data)
+        self.buffered = self.buffered + len(data)
+        if self.buffered >= self.chunk_size:
+            self.flush()
+
+    def write_lines(self, lines):
+        """ Write lines separated (not terminated) by newlines. """
+        first = True
+        for line in lines:
+            if not first:
+                self.write('\n')
+            self.write(line)
+            first = False
+
+    def flush(self):
+        if self.buffer:
+            self.fileobj.write(''.join(self.buffer))
+            self.buffer = []
+            self.buffered = 0
+
+    def close(self):
+        self.flush()
+        self.fileobj.close()
+
 
 class RepoView:
 
@@ -74,12 +116,15 @@ class RepoView:
 
 class PrimaryView(object):
 
+    # Name of the cached package fragments of the view (see
+    # repository.IncrementalRepository)
+    fragment_name = "primary"
+
     def __init__(self, channel, fileobj):
         self.channel = channel
-        self.fileobj = fileobj
+        self.fileobj = ChunkedWriter(fileobj)
 
     def _get_deps(self, deps):
-        output = []
         for dep in deps:
             if dep['flag']:
                 line = "        <rpm:entry name=\"%s\" flags=\"%s\" \
@@ -88,96 +133,99 @@ class PrimaryView(object):
                 if dep['release']:
                     line += "rel=\"%s\" " % dep['release']
                 line += "/>"
-                output.append(line)
+                yield line
             else:
-                output.append("         <rpm:entry name=\"%s\" />"
-                              % (text_filter(dep['name'])))
-        return output
+                yield ("         <rpm:entry name=\"%s\" />"
+                       % (text_filter(dep['name'])))
 
-    def _get_files(self, files):
-        output = []
-        filere = re.compile('.*bin\/.*|^\/etc\/.*|^\/usr\/lib\.sendmail$')
+    @staticmethod
+    def _get_files(files):
         for pkg_file in files:
-            if filere.match(pkg_file):
-                output.append("      <file>%s</file>"
-                              % (text_filter(pkg_file)))
-        return output
+            if PRIMARY_FILES_RE.match(pkg_file):
+                yield ("      <file>%s</file>"
+                       % (text_filter(pkg_file)))
 
     def _get_package(self, package):
-        output = []
-        output.append("  <package type=\"rpm\">")
-        output.append("    <name>%s</name>" % (package.name))
-        output.append("    <arch>%s</arch>" % (package.arch))
-        output.append("    <version epoch=\"%s\" ver=\"%s\" rel=\"%s\" />"
-                      % (package.epoch, package.version, package.release))
-        output.append("    <checksum type=\"%s\" pkgid=\"YES\">%s</checksum>"
-                      % (package.checksum_type, package.checksum))
-        output.append("    <summary>%s</summary>"
-                      % (text_filter(package.summary)))
-        output.append("    <description>%s</description>"
-                      % (text_filter(package.description)))
-        output.append("    <packager></packager>")
-        output.append("    <url></url>")
-        output.append("    <time file=\"%d\" build=\"%d\" />"
-                      % (package.build_time, package.build_time))
-        output.append("    <size package=\"%d\" installed=\"%d\" "
-                      "archive=\"%d\" />"
-                      % (package.package_size, package.installed_size,
-                         package.payload_size))
-        output.append("    <location href=\"getPackage/%s\" />"
-                      % (package.filename))
-        output.append("    <format>")
-        output.append("      <rpm:license>%s</rpm:license>"
-                      % (text_filter(package.copyright)))
-        output.append("      <rpm:vendor>%s</rpm:vendor>"
-                      % (text_filter(package.vendor)))
-        output.append("      <rpm:group>%s</rpm:group>"
-                      % (text_filter(package.package_group)))
-        output.append("      <rpm:buildhost>%s</rpm:buildhost>"
-                      % (text_filter(package.build_host)))
-        output.append("      <rpm:sourcerpm>%s</rpm:sourcerpm>"
-                      % (text_filter(package.source_rpm)))
-        output.append("      <rpm:header-range start=\"%d\" end=\"%d\" />"
-                      % (package.header_start, package.header_end))
-
-        output.append("      <rpm:provides>")
-        output.extend(self._get_deps(package.provides))
-        output.append("      </rpm:provides>")
-
-        output.append("      <rpm:requires>")
-        output.extend(self._get_deps(package.requires))
-        output.append("      </rpm:requires>")
-
-        output.append("      <rpm:recommends>")
-        output.extend(self._get_deps(package.recommends))
-        output.append("      </rpm:recommends>")
-
-        output.append("      <rpm:suggests>")
-        output.extend(self._get_deps(package.suggests))
-        output.append("      </rpm:suggests>")
-
-        output.append("      <rpm:supplements>")
-        output.extend(self._get_deps(package.supplements))
-        output.append("      </rpm:supplements>")
-
-        output.append("      <rpm:enhances>")
-        output.extend(self._get_deps(package.enhances))
-        output.append("      </rpm:enhances>")
-
-        output.append("      <rpm:conflicts>")
-        output.extend(self._get_deps(package.conflicts))
-        output.append("      </rpm:conflicts>")
-
-        output.append("      <rpm:obsoletes>")
-        output.extend(self._get_deps(package.obsoletes))
-        output.append("      </rpm:obsoletes>")
-
-        output.extend(self._get_files(package.files))
-
-        output.append("    </format>")
-        output.append("  </package>")
-
-        return output
+        yield "  <package type=\"rpm\">"
+        yield "    <name>%s</name>" % (package.name)
+        yield "    <arch>%s</arch>" % (package.arch)
+        yield ("    <version epoch=\"%s\" ver=\"%s\" rel=\"%s\" />"
+               % (package.epoch, package.version, package.release))
+        yield ("    <checksum type=\"%s\" pkgid=\"YES\">%s</checksum>"
+               % (package.checksum_type, package.checksum))
+        yield ("    <summary>%s</summary>"
+               % (text_filter(package.summary)))
+        yield ("    <description>%s</description>"
+               % (text_filter(package.description)))
+        yield "    <packager></packager>"
+        yield "    <url></url>"
+        yield ("    <time file=\"%d\" build=\"%d\" />"
+               % (package.build_time, package.build_time))
+        yield ("    <size package=\"%d\" installed=\"%d\" "
+               "archive=\"%d\" />"
+               % (package.package_size, package.installed_size,
+                  package.payload_size))
+        yield ("    <location href=\"getPackage/%s\" />"
+               % (package.filename))
+        yield "    <format>"
+        yield ("      <rpm:license>%s</rpm:license>"
+               % (text_filter(package.copyright)))
+        yield ("      <rpm:vendor>%s</rpm:vendor>"
+               % (text_filter(package.vendor)))
+        yield ("      <rpm:group>%s</rpm:group>"
+               % (text_filter(package.package_group)))
+        yield ("      <rpm:buildhost>%s</rpm:buildhost>"
+               % (text_filter(package.build_host)))
+        yield ("      <rpm:sourcerpm>%s</rpm:sourcerpm>"
+               % (text_filter(package.source_rpm)))
+        yield ("      <rpm:header-range start=\"%d\" end=\"%d\" />"
+               % (package.header_start, package.header_end))
+
+        yield "      <rpm:provides>"
+        for line in self._get_deps(package.provides):
+            yield line
+        yield "      </rpm:provides>"
+
+        yield "      <rpm:requires>"
+        for line in self._get_deps(package.requires):
+            yield line
+        yield "      </rpm:requires>"
+
+        yield "      <rpm:recommends>"
+        for line in self._get_deps(package.recommends):
+            yield line
+        yield "      </rpm:recommends>"
+
+        yield "      <rpm:suggests>"
+        for line in self._get_deps(package.suggests):
+            yield line
+        yield "      </rpm:suggests>"
+
+        yield "      <rpm:supplements>"
+        for line in self._get_deps(package.supplements):
+            yield line
+        yield "      </rpm:supplements>"
+
+        yield "      <rpm:enhances>"
+        for line in self._get_deps(package.enhances):
+            yield line
+        yield "      </rpm:enhances>"
+
+        yield "      <rpm:conflicts>"
+        for line in self._get_deps(package.conflicts):
+            yield line
+        yield "      </rpm:conflicts>"
+
+        yield "      <rpm:obsoletes>"
+        for line in self._get_deps(package.obsoletes):
+            yield line
+        yield "      </rpm:obsoletes>"
+
+        for line in self._get_files(package.files):
+            yield line
+
+        yield "    </format>"
+        yield "  </package>"
 
     def write_start(self):
         output = XML_ENCODING + "\n" + \
@@ -188,7 +236,14 @@ class PrimaryView(object):
         self.fileobj.write(output)
 
     def write_package(self, package):
-        self.fileobj.write('\n'.join(self._get_package(package)))
+        self.fileobj.write_lines(self._get_package(package))
+
+    def render_package(self, package):
+        """ Return what write_package() would write, as a string. """
+        return '\n'.join(self._get_package(package))
+
+    def write_fragment(self, fragment):
+        self.fileobj.write(fragment)
 
     def write_end(self):
         self.fileobj.write("</metadata>")
@@ -196,21 +251,21 @@ class PrimaryView(object):
 
 class FilelistsView(object):
 
+    fragment_name = "filelists"
+
     def __init__(self, channel, fileobj):
         self.channel = channel
-        self.fileobj = fileobj
+        self.fileobj = ChunkedWriter(fileobj)
 
     def _get_package(self, package):
-        output = []
-        output.append("  <package pkgid=\"%s\" name=\"%s\" arch=\"%s\">"
-                      % (package.checksum, package.name, package.arch))
-        output.append("    <version epoch=\"%s\" ver=\"%s\" rel=\"%s\" />"
-                      % (package.epoch, package.version, package.release))
+        yield ("  <package pkgid=\"%s\" name=\"%s\" arch=\"%s\">"
+               % (package.checksum, package.name, package.arch))
+        yield ("    <version epoch=\"%s\" ver=\"%s\" rel=\"%s\" />"
+               % (package.epoch, package.version, package.release))
 
         for file_name in package.files:
-            output.append("    <file>%s</file>" % (text_filter(file_name)))
-        output.append("  </package>")
-        return output
+            yield "    <file>%s</file>" % (text_filter(file_name))
+        yield "  </package>"
 
     def write_start(self):
         output = XML_ENCODING + "\n" + \
@@ -220,7 +275,14 @@ class FilelistsView(object):
         self.fileobj.write(output)
 
     def write_package(self, package):
-        self.fileobj.write('\n'.join(self._get_package(package)))
+        self.fileobj.write_lines(self._get_package(package))
+
+    def render_package(self, package):
+        """ Return what write_package() would write, as a string. """
+        return '\n'.join(self._get_package(package))
+
+    def write_fragment(self, fragment):
+        self.fileobj.write(fragment)
 
     def write_end(self):
         self.fileobj.write("</filelists>")
@@ -228,25 +290,25 @@ class FilelistsView(object):
 
 class OtherView(object):
 
+    fragment_name = "other"
+
     def __init__(self, channel, fileobj):
         self.channel = channel
-        self.fileobj = fileobj
+        self.fileobj = ChunkedWriter(fileobj)
 
     def _get_package(self, package):
-        output = []
-        output.append("  <package pkgid=\"%s\" name=\"%s\" arch=\"%s\">"
-                      % (package.checksum, package.name, package.arch))
-        output.append("    <version epoch=\"%s\" ver=\"%s\" rel=\"%s\" />"
-                      % (package.epoch, package.version, package.release))
+        yield ("  <package pkgid=\"%s\" name=\"%s\" arch=\"%s\">"
+               % (package.checksum, package.name, package.arch))
+        yield ("    <version epoch=\"%s\" ver=\"%s\" rel=\"%s\" />"
+               % (package.epoch, package.version, package.release))
 
         for changelog in package.changelog:
-            output.append("    <changelog author=\"%s\" date=\"%d\">"
-                          % (text_filter_attribute(changelog['author']),
-                             changelog['date']))
-            output.append("      " + text_filter(changelog['text']))
-            output.append("    </changelog>")
-        output.append("  </package>")
-        return output
+            yield ("    <changelog author=\"%s\" date=\"%d\">"
+                   % (text_filter_attribute(changelog['author']),
+                      changelog['date']))
+            yield "      " + text_filter(changelog['text'])
+            yield "    </changelog>"
+        yield "  </package>"
 
     def write_start(self):
         output = XML_ENCODING + "\n" + \
@@ -256,7 +318,14 @@ class OtherView(object):
         self.fileobj.write(output)
 
     def write_package(self, package):
-        self.fileobj.write('\n'.join(self._get_package(package)))
+        self.fileobj.write_lines(self._get_package(package))
+
+    def render_package(self, package):
+        """ Return what write_package() would write, as a string. """
+        return '\n'.join(self._get_package(package))
+
+    def write_fragment(self, fragment):
+        self.fileobj.write(fragment)
 
     def write_end(self):
         self.fileobj.write("</otherdata>")
@@ -266,72 +335,65 @@ class UpdateinfoView(object):
 
     def __init__(self, channel, fileobj):
         self.channel = channel
-        self.fileobj = fileobj
+        self.fileobj = ChunkedWriter(fileobj)
 
     def _get_references(self, erratum):
-        output = []
-        output.append("    <references>")
+        yield "    <references>"
 
         ref_string = "       <reference href=\"%s%s\" id=\"%s\" type=\"%s\">"
         for cve_ref in erratum.cve_references:
-            output.append(ref_string
-                          % ("http://www.cve.mitre.org/cgi-bin/cvename.cgi?name=",
-                             cve_ref, cve_ref, "cve"))
-            output.append("      </reference>")
+            yield (ref_string
+                   % ("http://www.cve.mitre.org/cgi-bin/cvename.cgi?name=",
+                      cve_ref, cve_ref, "cve"))
+            yield "      </reference>"
 
         for bz_ref in erratum.bz_references:
-            output.append(ref_string
-                          % ("http://bugzilla.redhat.com/bugzilla/show_bug.cgi?id=",
-                             bz_ref['bug_id'], bz_ref['bug_id'], "bugzilla"))
-            output.append("        " + text_filter(bz_ref['summary']))
-            output.append("      </reference>")
+            yield (ref_string
+                   % ("http://bugzilla.redhat.com/bugzilla/show_bug.cgi?id=",
+                      bz_ref['bug_id'], bz_ref['bug_id'], "bugzilla"))
+            yield "        " + text_filter(bz_ref['summary'])
+            yield "      </reference>"
 
-        output.append("    </references>")
-        return output
+        yield "    </references>"
 
     def _get_packages(self, erratum):
-        output = []
-
-        output.append("    <pkglist>")
-        output.append("      <collection short=\"%s\">"
-                      % text_filter_attribute(self.channel.label))
-        output.append("        <name>%s</name>"
-                      % text_filter(self.channel.name))
+        yield "    <pkglist>"
+        yield ("      <collection short=\"%s\">"
+               % text_filter_attribute(self.channel.label))
+        yield ("        <name>%s</name>"
+               % text_filter(self.channel.name))
 
         for package in erratum.packages:
-            output.append("          <package name=\"%s\" version=\"%s\" "
-                          "release=\"%s\" epoch=\"%s\" arch=\"%s\" src=\"%s\">"
-                          % (package.name, package.version, package.release,
-                             package.epoch, package.arch, text_filter(package.source_rpm)))
-            output.append("            <filename>%s</filename>"
-                          % text_filter(package.filename))
-            output.append("            <sum type=\"%s\">%s</sum>"
-                          % (package.checksum_type, package.checksum))
-            output.append("          </package>")
-
-        output.append("      </collection>")
-        output.append("    </pkglist>")
-        return output
+            yield ("          <package name=\"%s\" version=\"%s\" "
+                   "release=\"%s\" epoch=\"%s\" arch=\"%s\" src=\"%s\">"
+                   % (package.name, package.version, package.release,
+                      package.epoch, package.arch, text_filter(package.source_rpm)))
+            yield ("            <filename>%s</filename>"
+                   % text_filter(package.filename))
+            yield ("            <sum type=\"%s\">%s</sum>"
+                   % (package.checksum_type, package.checksum))
+            yield "          </package>"
+
+        yield "      </collection>"
+        yield "    </pkglist>"
 
     def _get_erratum(self, erratum):
-        output = []
-
-        output.append("  <update from=\"security@redhat.com\" " +
-                      "status=\"final\" type=\"%s\" version=\"%s\">"
-                      % (erratum.advisory_type, erratum.version))
-        output.append("    <id>%s</id>" % erratum.readable_id)
-        output.append("    <title>%s</title>" % text_filter(erratum.title))
-        output.append("    <issued date=\"%s\"/>" % erratum.issued)
-        output.append("    <updated date=\"%s\"/>" % erratum.updated)
-        output.append("    <description>%s</description>"
-                      % text_filter("%s\n\n\%s" % (erratum.synopsis,  erratum.description)))
-
-        output.extend(self._get_references(erratum))
-        output.extend(self._get_packages(erratum))
-
-        output.append("  </update>")
-
-        return output
+        yield ("  <update from=\"security@redhat.com\" " +
+               "status=\"final\" type=\"%s\" version=\"%s\">"
+               % (erratum.advisory_type, erratum.version))
+        yield "    <id>%s</id>" % erratum.readable_id
+        yield "    <title>%s</title>" % text_filter(erratum.title)
+        yield "    <issued date=\"%s\"/>" % erratum.issued
+        yield "    <updated date=\"%s\"/>" % erratum.updated
+        yield ("    <description>%s</description>"
+               % text_filter("%s\n\n\%s" % (erratum.synopsis,  erratum.description)))
+
+        for line in self._get_references(erratum):
+            yield line
+        for line in self._get_packages(erratum):
+            yield line
+
+        yield "  </update>"
 
     def write_updateinfo(self):
         output = XML_ENCODING + "\n" + "<updates>\n"
@@ -339,7 +401,7 @@ class UpdateinfoView(object):
         self.fileobj.write(output)
 
         for erratum in self.channel.errata:
-            self.fileobj.write('\n'.join(self._get_erratum(erratum)))
+            self.fileobj.write_lines(self._get_erratum(erratum))
 
         self.fileobj.write("\n</updates>")
 
@@ -164,6 +164,7 @@ def _set_server_capabilities():
         'registration.remaining_subscriptions': {'version': 1, 'value': 1},
         'registration.update_contact_info': {'version': 1, 'value': 1},
         'registration.delta_packages': {'version': 1, 'value': 1},
+        'registration.package_digest': {'version': 1, 'value': 1},
         'registration.extended_update_support': {'version': 1, 'value': 1},
         'registration.smbios': {'version': 1, 'value': 1},
         'registration.update_systemid': {'version': 1, 'value': 1},
@@ -14,11 +14,11 @@
 #
 #
 
+from spacewalk.common import rhn_evr
 from spacewalk.common.rhnLog import log_debug, log_error
 from spacewalk.common.rhnException import rhnFault
 import rhnSQL
 import rhnLib
-import rpm
 
 # QUERY PACKAGES
 # sql query for solving a dep as a package
@@ -364,7 +364,7 @@ def solve_dependencies_with_limits(server_id, deps, version, all=0, limit_operat
         # sort all the package lists so the most recent version is first
         for pl in packages_all.keys():
 
-            packages_all[pl].sort(cmp_evr)
+            packages_all[pl].sort(key=evr_key)
             package_list = package_list + packages_all[pl]
 
         package_list.reverse()
@@ -556,26 +556,15 @@ def cmp_evr(pkg1, pkg2):
     """ Intended to be passed to a list object's sort().
         In: {'epoch': 'value', 'version':'value', 'release':'value'}
     """
-    pkg1_epoch = pkg1['epoch']
-    pkg1_version = pkg1['version']
-    pkg1_release = pkg1['release']
+    return rhn_evr.evr_compare((pkg1['epoch'], pkg1['version'], pkg1['release']),
+                               (pkg2['epoch'], pkg2['version'], pkg2['release']))
 
-    pkg2_epoch = pkg2['epoch']
-    pkg2_version = pkg2['version']
-    pkg2_release = pkg2['release']
 
-    if pkg1_epoch is not None:
-        pkg1_epoch = str(pkg1_epoch)
-    elif pkg1_epoch == '':
-        pkg1_epoch = None
-
-    if pkg2_epoch is not None:
-        pkg2_epoch = str(pkg2_epoch)
-    elif pkg1_epoch == '':
-        pkg1_epoch = None
-
-    return rpm.labelCompare((pkg1_epoch, pkg1_version, pkg1_release),
-                            (pkg2_epoch, pkg2_version, pkg2_release))
+def evr_key(pkg):
+    """ Intended to be passed as the key of a list object's sort().
+        In: {'epoch': 'value', 'version':'value', 'release':'value'}
+    """
+    return rhn_evr.evr_key(pkg['epoch'], pkg['version'], pkg['release'])
 
 
 def test_evr(evr, operator, limit):
@@ -592,26 +581,8 @@ def test_evr(evr, operator, limit):
         raise rhnFault(err_code=21,
                        err_text="Bad operator passed into test_evr.")
 
-    evr_epoch = evr['epoch']
-    evr_version = evr['version']
-    evr_release = evr['release']
-
-    limit_epoch = limit['epoch']
-    limit_version = limit['version']
-    limit_release = limit['release']
-
-    if evr_epoch is not None:
-        evr_epoch = str(evr_epoch)
-    elif evr_epoch == '':
-        evr_epoch = None
-
-    if limit_epoch is not None:
-        limit_epoch = str(limit_epoch)
-    elif limit_epoch == '':
-        limit_epoch = None
-
-    ret = rpm.labelCompare((evr_epoch, evr_version, evr_release),
-                           (limit_epoch, limit_version, limit_release))
+    ret = rhn_evr.evr_compare((evr['epoch'], evr['version'], evr['release']),
+                              (limit['epoch'], limit['version'], limit['release']))
 
     return check_against_operator(ret, operator)
 
@@ -246,6 +246,82 @@ def get_info_for_package(pkg, channel_id, org_id):
     return ret
 
 
+# Number of package names looked up by one get_info_for_packages() query
+INFO_CHUNK_SIZE = 500
+
+
+def _info_keys(pkg):
+    pkg = list(map(str, pkg))
+    keys = [tuple(pkg)]
+    # yum repo has epoch="0" not only when epoch is "0" but also if it's NULL
+    if pkg[3] == '0' or pkg[3] == '':
+        keys.append(tuple(pkg[:3] + [None] + pkg[4:]))
+    return keys
+
+
+def get_info_for_packages(pkgs, channel_id, org_id):
+    """ Bulk version of get_info_for_package().
+        Returns list of the results get_info_for_package() would return
+        for every package in pkgs, in the same order. """
+    log_debug(3, len(pkgs), channel_id, org_id)
+    names = sorted(set([str(pkg[0]) for pkg in pkgs]))
+    if org_id:
+        orgStatement = "p.org_id = :org_id"
+    else:
+        orgStatement = "p.org_id is null"
+
+    # (name, version, release, epoch, arch) -> (rank, info)
+    found = {}
+    for i in range(0, len(names), INFO_CHUNK_SIZE):
+        chunk = names[i:i + INFO_CHUNK_SIZE]
+        params = {'channel_id': channel_id}
+        if org_id:
+            params['org_id'] = org_id
+        for j, name in enumerate(chunk):
+            params['name_%d' % j] = name
+        statement = """
+        select p.id, p.path, cp.channel_id,
+               cv.checksum_type, cv.checksum,
+               pn.name, pe.epoch, pe.version, pe.release, pa.label as arch
+          from rhnPackage p
+          join rhnPackageName pn
+            on p.name_id = pn.id
+          join rhnPackageEVR pe
+            on p.evr_id = pe.id
+          join rhnPackageArch pa
+            on p.package_arch_id = pa.id
+          left join rhnChannelPackage cp
+            on p.id = cp.package_id
+           and cp.channel_id = :channel_id
+          join rhnChecksumView cv
+            on p.checksum_id = cv.id
+         where pn.name in (%s)
+           and %s
+        """ % (', '.join([':name_%d' % j for j in range(len(chunk))]), orgStatement)
+
+        h = rhnSQL.prepare(statement, stream=True)
+        h.execute(**params)
+        for row in h:
+            epoch = row['epoch']
+            if epoch is not None:
+                epoch = str(epoch)
+            key = (str(row['name']), str(row['version']), str(row['release']), epoch, str(row['arch']))
+            # same preference as "order by cp.channel_id nulls last, p.id desc"
+            rank = (row['channel_id'] is not None, row['id'])
+            if key not in found or rank > found[key][0]:
+                found[key] = (rank, dict([(k, row[k]) for k in
+                                          ('path', 'channel_id', 'checksum_type', 'checksum', 'epoch')]))
+
+    ret = []
+    for pkg in pkgs:
+        matches = [found[key] for key in _info_keys(pkg) if key in found]
+        if matches:
+            ret.append(max(matches)[1])
+        else:
+            ret.append(None)
+    return ret
+
+
 def _none2emptyString(foo):
     if foo is None:
         return ""
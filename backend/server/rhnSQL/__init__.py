@@ -263,18 +263,25 @@ def cursor():
     return db.cursor()
 
 
-def prepare(sql, blob_map=None):
+def prepare(sql, blob_map=None, stream=False):
+    """
+    Prepare sql for execution.
+
+    With stream set, the rows are fetched from the database in batches as
+    they are read (instead of all at once by execute()), so that large
+    result sets can be processed in constant memory.
+    """
     db = __test_DB()
     if isinstance(sql, Statement):
         sql = sql.statement
-    return db.prepare(sql, blob_map=blob_map)
+    return db.prepare(sql, blob_map=blob_map, stream=stream)
 
 
-def prepare_secondary(sql, blob_map=None):
+def prepare_secondary(sql, blob_map=None, stream=False):
     db = __test_DB2()
     if isinstance(sql, Statement):
         sql = sql.statement
-    return db.prepare(sql, blob_map=blob_map)
+    return db.prepare(sql, blob_map=blob_map, stream=stream)
 
 
 def execute(sql, *args, **kwargs):
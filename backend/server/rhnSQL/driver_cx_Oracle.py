@@ -38,6 +38,9 @@ from spacewalk.common.rhnException import rhnException
 from spacewalk.common.stringutils import to_string
 from const import ORACLE
 
+# Rows fetched at once by the cursors of prepare(..., stream=True)
+STREAM_ARRAYSIZE = 1000
+
 ORACLE_TYPE_MAPPING = [
     (sql_types.NUMBER, cx_Oracle.NUMBER),
     (sql_types.STRING, cx_Oracle.STRING),
@@ -470,7 +473,7 @@ class Database(sql_base.Database):
         return self._cursor_class(dbh=self.dbh)
 
     # pass-through functions for when you want to do SQL yourself
-    def prepare(self, sql, force=0, blob_map=None):
+    def prepare(self, sql, force=0, blob_map=None, stream=False):
         # Abuse the map calls to get rid of SQL comments and extra spaces
         sql = string.join([a for a in list(map(string.strip,
                                      [(a + " ")[:string.find(a, '--')] for a in string.split(sql, "\n")])) if len(a)],
@@ -485,7 +488,12 @@ class Database(sql_base.Database):
                 bind_list.append(":%s_blob" % bind_var)
             sql += " returning %s into %s" % (','.join(col_list), ','.join(bind_list))
         # this way we only hit the network once for each sql statement
-        return self._cursor_class(dbh=self.dbh, sql=sql, force=force, blob_map=blob_map)
+        cursor = self._cursor_class(dbh=self.dbh, sql=sql, force=force, blob_map=blob_map)
+        if stream:
+            # cx_Oracle fetches the rows as they are read anyway, only do it
+            # in bigger batches
+            cursor._real_cursor.arraysize = STREAM_ARRAYSIZE
+        return cursor
 
     def procedure(self, name):
         try:
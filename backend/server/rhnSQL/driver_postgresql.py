@@ -21,6 +21,12 @@ import sys
 import string
 import re
 import psycopg2
+try:
+    #  python 2
+    from cStringIO import StringIO
+except ImportError:
+    #  python3
+    from io import StringIO
 
 # workaround for python-psycopg2 = 2.0.13 (RHEL6)
 # which does not import extensions by default
@@ -31,11 +37,35 @@ import sql_base
 from rhn.UserDictCase import UserDictCase
 from spacewalk.server import rhnSQL
 
-from spacewalk.common.usix import BufferType, raise_with_tb
+from spacewalk.common.usix import BufferType, UnicodeType, raise_with_tb
 from spacewalk.common.rhnLog import log_debug, log_error
 from spacewalk.common.rhnException import rhnException
+from spacewalk.common.rhnConfig import CFG
+from spacewalk.common.rhnLib import LRUCache
 from const import POSTGRESQL
 
+NAMED_PARAM_RE = re.compile(r'(\W):(\w+)')
+
+# Converted queries, keyed by the original query text
+_converted_queries = LRUCache(1024)
+
+# Server side prepared statements kept per connection
+PREPARED_STATEMENTS_MAX = 256
+
+# insert into table (columns) values (...), as converted for psycopg2
+INSERT_RE = re.compile(r'^\s*insert\s+into\s+([\w.]+)\s*\(([^()]*)\)\s*'
+                       r'values\s*\((.*)\)\s*$', re.I | re.S)
+BIND_RE = re.compile(r'^%\((\w+)\)s$')
+BINDS_RE = re.compile(r'%\(\w+\)s')
+
+# Rows fetched at once by the cursors of prepare(..., stream=True)
+STREAM_ITERSIZE = 1000
+
+# Rows sent in one multi-row insert ... values statement
+BULK_VALUES_PAGE_SIZE = 1000
+
+_COPY_ESCAPES = [('\\', '\\\\'), ('\t', '\\t'), ('\n', '\\n'), ('\r', '\\r')]
+
 
 def convert_named_query_params(query):
     """
@@ -48,12 +78,225 @@ def convert_named_query_params(query):
 
     RETURNS: the new query with parameters replaced
     """
-    log_debug(6, "Converting query for PostgreSQL: %s" % query)
-    new_query = re.sub(r'(\W):(\w+)', r'\1%(\2)s', query.replace('%', '%%'))
-    log_debug(6, "New query: %s" % new_query)
+    new_query = _converted_queries.get(query)
+    if new_query is None:
+        log_debug(6, "Converting query for PostgreSQL:", query)
+        new_query = NAMED_PARAM_RE.sub(r'\1%(\2)s', query.replace('%', '%%'))
+        log_debug(6, "New query:", new_query)
+        _converted_queries.set(query, new_query)
     return new_query
 
 
+def convert_positional_query_params(query):
+    """
+    Convert a query with named parameters into one that uses $1, $2
+    parameters, as required by PREPARE.
+
+    RETURNS: the new query and the list of parameter names, in the order
+    of their positions
+    """
+    names = []
+
+    def _replace(match):
+        name = match.group(2).lower()
+        if name not in names:
+            names.append(name)
+        return "%s$%d" % (match.group(1), names.index(name) + 1)
+    return NAMED_PARAM_RE.sub(_replace, query), names
+
+
+def _split_values(values):
+    """ Split the expressions in a values clause on the top level commas. """
+    items = []
+    depth = 0
+    quoted = False
+    start = 0
+    for i, c in enumerate(values):
+        if c == "'":
+            quoted = not quoted
+        elif quoted:
+            continue
+        elif c == '(':
+            depth = depth + 1
+        elif c == ')':
+            depth = depth - 1
+        elif c == ',' and depth == 0:
+            items.append(values[start:i].strip())
+            start = i + 1
+    items.append(values[start:].strip())
+    return items
+
+
+class BulkInsert:
+
+    """
+    Multi-row form of an insert ... values statement.
+
+    Inserts whose values are all plain bind variables are loaded with
+    COPY ... FROM STDIN; the others are sent as insert ... values (...),
+    (...) statements of up to BULK_VALUES_PAGE_SIZE rows.
+    """
+
+    def __init__(self, table, columns, values):
+        self.table = table
+        self.columns = columns
+        # the row template, i.e. "(%(a)s, lookup_evr(%(e)s, ...))"; bind
+        # names are case insensitive, the rows are looked up lowercased
+        self.values = BINDS_RE.sub(lambda m: m.group(0).lower(), values)
+        self.copy_binds = None
+        binds = [BIND_RE.match(item) for item in _split_values(values[1:-1])]
+        if None not in binds and len(binds) == len(columns):
+            self.copy_binds = [m.group(1).lower() for m in binds]
+
+    def execute(self, cursor, rows):
+        rows = [dict([(k.lower(), v) for (k, v) in row.items()])
+                for row in rows]
+        if self.copy_binds is not None:
+            data = self._copy_data(rows)
+            if data is not None:
+                cursor.copy_expert("COPY %s (%s) FROM STDIN" % (
+                    self.table, ', '.join(self.columns)), data)
+                return len(rows)
+
+        rowcount = 0
+        for start in range(0, len(rows), BULK_VALUES_PAGE_SIZE):
+            values = [cursor.mogrify(self.values, row)
+                      for row in rows[start:start + BULK_VALUES_PAGE_SIZE]]
+            cursor.execute("insert into %s (%s) values %s" % (
+                self.table, ', '.join(self.columns), ', '.join(values)))
+            rowcount = rowcount + cursor.rowcount
+        return rowcount
+
+    def _copy_data(self, rows):
+        """
+        Return the rows in COPY text format, or None if they contain values
+        that cannot be sent this way.
+        """
+        data = StringIO()
+        for row in rows:
+            line = []
+            for bind in self.copy_binds:
+                value = _copy_value(row[bind])
+                if value is None:
+                    return None
+                line.append(value)
+            data.write('\t'.join(line))
+            data.write('\n')
+        data.seek(0)
+        return data
+
+    @staticmethod
+    def parse(sql):
+        """ Return a BulkInsert for sql, or None if it is not an insert. """
+        m = INSERT_RE.match(sql)
+        if m is None:
+            return None
+        columns = [c.strip() for c in m.group(2).split(',')]
+        return BulkInsert(m.group(1), columns, "(%s)" % m.group(3))
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        if value:
+            return 't'
+        return 'f'
+    if isinstance(value, float):
+        value = repr(value)
+    elif isinstance(value, UnicodeType):
+        if UnicodeType is not str:
+            value = value.encode('utf-8')
+    elif isinstance(value, (BufferType, bytearray)) or \
+            (bytes is not str and isinstance(value, bytes)):
+        # binary data; leave it to the multi-row insert
+        return None
+    else:
+        value = str(value)
+    for c, escaped in _COPY_ESCAPES:
+        if c in value:
+            value = value.replace(c, escaped)
+    return value
+
+
+class PreparedStatements:
+
+    """
+    Server side prepared statements of one database connection.
+
+    Statements are counted as they are executed; once one has been executed
+    threshold times, it is PREPAREd and executed with EXECUTE from then on,
+    saving PostgreSQL the parsing and planning. A threshold of 0 disables
+    server side preparing altogether.
+    """
+
+    def __init__(self, dbh, threshold, size=PREPARED_STATEMENTS_MAX):
+        self.dbh = dbh
+        self.threshold = threshold
+        # Executions so far of the statements not prepared yet, or None for
+        # the ones PostgreSQL refused to prepare
+        self._counts = LRUCache(4 * size)
+        self._statements = LRUCache(size, self._deallocate)
+        self._names = 0
+
+    def lookup(self, sql):
+        """
+        Return the (name, parameter names) of the server side statement for
+        the (original) sql, or None if it is not (yet) worth preparing.
+        """
+        if not self.threshold:
+            return None
+        statement = self._statements.get(sql)
+        if statement is not None:
+            return statement
+        count = self._counts.get(sql, 0)
+        if count is None:
+            return None
+        count = count + 1
+        if count < self.threshold:
+            self._counts.set(sql, count)
+            return None
+        statement = self._prepare(sql)
+        if statement is None:
+            self._counts.set(sql, None)
+        else:
+            self._counts.delete(sql)
+            self._statements.set(sql, statement)
+        return statement
+
+    def _prepare(self, sql):
+        if sql.split(None, 1)[0].lower() not in ('select', 'insert', 'update',
+                                                 'delete', 'with'):
+            return None
+        self._names = self._names + 1
+        name = "rhn_stmt_%d" % self._names
+        query, params = convert_positional_query_params(sql)
+        cursor = self.dbh.cursor()
+        # A failed PREPARE would abort the whole transaction
+        cursor.execute("savepoint rhn_prepare")
+        try:
+            cursor.execute("PREPARE %s AS %s" % (name, query))
+        except psycopg2.Error:
+            e = sys.exc_info()[1]
+            log_debug(4, "Not preparing statement", sql, e.pgerror)
+            cursor.execute("rollback to savepoint rhn_prepare")
+            return None
+        cursor.execute("release savepoint rhn_prepare")
+        log_debug(5, "Prepared statement", name, sql)
+        if params:
+            execute = "EXECUTE %s (%s)" % (
+                name, ', '.join(["%%(%s)s" % p for p in params]))
+        else:
+            execute = "EXECUTE %s" % name
+        return name, execute
+
+    def _deallocate(self, sql, statement):
+        try:
+            self.dbh.cursor().execute("DEALLOCATE %s" % statement[0])
+        except psycopg2.Error:
+            pass
+
+
 class Function(sql_base.Procedure):
 
     """
@@ -161,6 +404,7 @@ class Database(sql_base.Database):
             self.port = -1
 
         self.dbh = None
+        self.prepared_statements = None
 
         sql_base.Database.__init__(self)
 
@@ -187,6 +431,11 @@ class Database(sql_base.Database):
             DEC2INTFLOAT = psycopg2.extensions.new_type(psycopg2._psycopg.DECIMAL.values,
                                                         'DEC2INTFLOAT', decimal2intfloat)
             psycopg2.extensions.register_type(DEC2INTFLOAT)
+
+            threshold = 0
+            if CFG.is_initialized() and CFG.has_key('db_prepare_threshold'):
+                threshold = int(CFG.db_prepare_threshold or 0)
+            self.prepared_statements = PreparedStatements(self.dbh, threshold)
         except psycopg2.Error:
             e = sys.exc_info()[1]
             if reconnect > 0:
@@ -219,8 +468,10 @@ class Database(sql_base.Database):
                       "Exception information: %s" % sys.exc_info()[1])
             self.connect()  # only allow one try
 
-    def prepare(self, sql, force=0, blob_map=None):
-        return Cursor(dbh=self.dbh, sql=sql, force=force, blob_map=blob_map)
+    def prepare(self, sql, force=0, blob_map=None, stream=False):
+        return Cursor(dbh=self.dbh, sql=sql, force=force, blob_map=blob_map,
+                      prepared_statements=self.prepared_statements,
+                      stream=stream)
 
     def execute(self, sql, *args, **kwargs):
         cursor = self.prepare(sql)
@@ -264,27 +515,49 @@ class Cursor(sql_base.Cursor):
 
     """ PostgreSQL specific wrapper over sql_base.Cursor. """
 
-    def __init__(self, dbh=None, sql=None, force=None, blob_map=None):
+    # Number of the last server side (streaming) cursor declared
+    _streams = 0
+
+    def __init__(self, dbh=None, sql=None, force=None, blob_map=None,
+                 prepared_statements=None, stream=False):
+
+        self.stream = stream
+        # Rows fetched from the server side cursor but not read yet, in
+        # reverse order
+        self._rows = []
 
         sql_base.Cursor.__init__(self, dbh, sql, force)
         self.blob_map = blob_map
+        self.prepared_statements = prepared_statements
 
         # Accept Oracle style named query params, but convert for python-pgsql
         # under the hood:
         temp_sql = ""
         if self.sql is not None:
             temp_sql = self.sql
+        self.original_sql = temp_sql
         self.sql = convert_named_query_params(temp_sql)
+        self._bulk_insert = None
+
+    def _prepare(self, force=None):
+        if self.stream:
+            # Server side cursors can only be executed once, so they are
+            # declared by _execute_() and never cached
+            return None
+        return sql_base.Cursor._prepare(self, force=force)
 
     def _prepare_sql(self):
         cursor = self.dbh.cursor()
         return cursor
 
+    def _declare(self):
+        self.close()
+        Cursor._streams = Cursor._streams + 1
+        self._real_cursor = self.dbh.cursor("rhn_stream_%d" % Cursor._streams)
+        self._rows = []
+
     def _execute_wrapper(self, function, *p, **kw):
-        params = ','.join(["%s: %s" % (key, value) for key, value
-                           in list(kw.items())])
-        log_debug(5, "Executing SQL: \"%s\" with bind params: {%s}"
-                  % (self.sql, params))
+        log_debug(5, "Executing SQL:", self.sql, "with bind params:", kw)
         if self.sql is None:
             raise rhnException("Cannot execute empty cursor")
         if self.blob_map:
@@ -314,8 +587,15 @@ class Cursor(sql_base.Cursor):
         PostgreSQL specific execution of the query.
         """
         params = UserDictCase(kwargs)
+        sql = self.sql
+        if self.stream:
+            self._declare()
+        elif self.prepared_statements is not None and not self.blob_map:
+            statement = self.prepared_statements.lookup(self.original_sql)
+            if statement is not None:
+                sql = statement[1]
         try:
-            self._real_cursor.execute(self.sql, params)
+            self._real_cursor.execute(sql, params)
         except psycopg2.OperationalError:
             e = sys.exc_info()[1]
             raise sql_base.SQLError("Cannot execute SQL statement: %s" % str(e))
@@ -342,11 +622,29 @@ class Cursor(sql_base.Cursor):
                 all_kwargs[i][key] = val
                 i = i + 1
 
+        if len(all_kwargs) > 1 and not self.blob_map:
+            if self._bulk_insert is None:
+                self._bulk_insert = BulkInsert.parse(self.sql) or False
+            if self._bulk_insert:
+                rowcount = self._bulk_insert.execute(self._real_cursor,
+                                                     all_kwargs)
+                self.description = None
+                return rowcount
+
         self._real_cursor.executemany(self.sql, all_kwargs)
         self.description = self._real_cursor.description
         rowcount = self._real_cursor.rowcount
         return rowcount
 
+    def execute_bulk(self, dict, chunk_size=100):
+        """
+        Inserts are turned into a few multi-row statements (or a COPY) by
+        executemany already, so the arrays are not chopped into chunks here.
+        """
+        if not dict or not [arr for arr in dict.values() if arr]:
+            return 0
+        return self.executemany(**dict)
+
     def update_blob(self, table_name, column_name, where_clause, data,
                     **kwargs):
         """
@@ -360,5 +658,33 @@ class Cursor(sql_base.Cursor):
         kwargs[column_name] = data
         c.execute(**kwargs)
 
+    def fetchone(self):
+        if not self.stream:
+            return self._real_cursor.fetchone()
+        if not self._rows:
+            self._rows = self._real_cursor.fetchmany(STREAM_ITERSIZE)
+            self._rows.reverse()
+            # Declared cursors only describe the rows once they are fetched
+            self.description = self._real_cursor.description
+            if not self._rows:
+                return None
+        return self._rows.pop()
+
+    def fetchall(self):
+        if not self.stream:
+            return self._real_cursor.fetchall()
+        rows = self._rows
+        rows.reverse()
+        rows.extend(self._real_cursor.fetchall())
+        self.description = self._real_cursor.description
+        self._rows = []
+        return rows
+
     def close(self):
-        pass
+        if self.stream and self._real_cursor is not None:
+            try:
+                self._real_cursor.close()
+            except psycopg2.Error:
+                # The transaction it belonged to is gone already
+                pass
+            self._real_cursor = None
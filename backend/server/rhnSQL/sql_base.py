@@ -227,7 +227,8 @@ class Cursor:
         Return a dictionary for the row returned mapping column name to
         it's value.
         """
-        ret = ociDict(self.description, self._real_cursor.fetchone())
+        row = self.fetchone()
+        ret = ociDict(self.description, row)
 
         if len(ret) == 0:
             return None
@@ -237,7 +238,7 @@ class Cursor:
         """
         Fetch all rows as a list of dictionaries.
         """
-        rows = self._real_cursor.fetchall()
+        rows = self.fetchall()
 
         ret = []
         for x in rows:
@@ -248,6 +249,14 @@ class Cursor:
             return None
         return ret
 
+    def __iter__(self):
+        """ Iterate over the (remaining) rows, as dictionaries. """
+        while 1:
+            row = self.fetchone_dict()
+            if row is None:
+                return
+            yield row
+
     def _is_sequence_type(self, val):
         if type(val) in (usix.ListType, usix.TupleType):
             return 1
@@ -298,8 +307,13 @@ class Database:
         # query:
         raise NotImplementedError()
 
-    def prepare(self, sql, force=0):
-        """ Prepare an SQL statement. """
+    def prepare(self, sql, force=0, blob_map=None, stream=False):
+        """
+        Prepare an SQL statement.
+
+        stream asks for a cursor fetching the rows in batches as they are
+        read, rather than all of them on execute.
+        """
         raise NotImplementedError()
 
     def commit(self):
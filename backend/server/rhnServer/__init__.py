@@ -16,8 +16,11 @@
 #
 
 
+import time
+
 # these are pretty much the only entry points
 from spacewalk.common.usix import StringType, UnicodeType
+from spacewalk.common.rhnConfig import CFG
 from spacewalk.common.rhnException import rhnFault
 from spacewalk.common.rhnLog import log_debug, log_error
 from spacewalk.server import rhnUser
@@ -28,12 +31,31 @@ from server_certificate import Certificate
 from server_token import fetch_token, fetch_org_token
 
 
+# Certificates verified recently, by their text. A hit saves parsing and
+# verifying the certificate and looking up the server id; the row loaded
+# for the server shows whether its secret changed in the meantime.
+_auth_cache = {}
+
+
+class _AuthCacheEntry:
+
+    def __init__(self, cert, server):
+        self.server_id = server.getid()
+        self.secret = server.server["secret"]
+        self.username = cert["username"]
+        self.entitlements = server.check_entitlement()
+        self.expires = time.time() + CFG.SYSTEM_AUTH_CACHE_TIMEOUT
+
+
 def get(system_id, load_user=1):
     """ retrieve the server with matching certificate from the database """
     log_debug(3, "load_user = %s" % load_user)
     # This has to be a string
     if not isinstance(system_id, (StringType, UnicodeType)):
         return None
+    server = _get_cached(system_id, load_user)
+    if server is not None:
+        return server
     # Try to initialize the certificate object
     cert = Certificate()
     if not cert.reload(system_id) == 0:
@@ -48,9 +70,48 @@ def get(system_id, load_user=1):
     if not server.loadcert(cert, load_user) == 0:
         return None
     # okay, it is a valid certificate
+    _cache_cert(system_id, cert, server)
+    return server
+
+
+def _get_cached(system_id, load_user):
+    entry = _auth_cache.get(system_id)
+    if entry is None:
+        return None
+    if entry.expires < time.time():
+        del _auth_cache[system_id]
+        return None
+    server = Server(None)
+    try:
+        server.reload(entry.server_id)
+    except rhnFault:
+        # deleted since
+        del _auth_cache[system_id]
+        return None
+    if server.server["secret"] != entry.secret:
+        # registered again, the certificate has to be verified
+        del _auth_cache[system_id]
+        return None
+    log_debug(4, "Certificate verified already", entry.server_id)
+    if load_user:
+        server.user = rhnUser.search(entry.username)
+    server.entitlements = entry.entitlements
     return server
 
 
+def _cache_cert(system_id, cert, server):
+    if not CFG.SYSTEM_AUTH_CACHE_TIMEOUT:
+        return
+    if len(_auth_cache) >= CFG.SYSTEM_AUTH_CACHE_SIZE:
+        now = time.time()
+        for key, entry in list(_auth_cache.items()):
+            if entry.expires < now:
+                del _auth_cache[key]
+        if len(_auth_cache) >= CFG.SYSTEM_AUTH_CACHE_SIZE:
+            _auth_cache.clear()
+    _auth_cache[system_id] = _AuthCacheEntry(cert, server)
+
+
 def search(server_id, username=None):
     """ search for a server in the database and return the Server object """
     log_debug(3, server_id, username)
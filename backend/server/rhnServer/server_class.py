@@ -37,6 +37,10 @@ from server_certificate import Certificate, gen_secret
 from server_wrapper import ServerWrapper
 
 
+# server architecture labels by id, they never change
+_server_arch_labels = {}
+
+
 class Server(ServerWrapper):
 
     """ Main Server class """
@@ -70,6 +74,9 @@ class Server(ServerWrapper):
         self.virt_uuid = None
         self.registration_number = None
 
+        # filled in by check_entitlement()
+        self.entitlements = None
+
     _query_lookup_arch = rhnSQL.Statement("""
         select sa.id,
                case when at.label = 'rpm' then 1 else 0 end is_rpm_managed
@@ -435,6 +442,7 @@ class Server(ServerWrapper):
         if entitlement not in system_entitlements:
             entitle_server = rhnSQL.Procedure("rhn_entitlements.entitle_server")
             entitle_server(self.server['id'], entitlement)
+            self.entitlements = None
 
     def create_perm_cache(self):
         log_debug(4)
@@ -594,17 +602,21 @@ class Server(ServerWrapper):
             log_error("Could not find server record for reload", server)
             raise rhnFault(29, "Could not find server record in the database")
         self.cert = None
-        # it is lame that we have to do this
-        h = rhnSQL.prepare("""
-        select label from rhnServerArch where id = :archid
-        """)
-        h.execute(archid=self.server["server_arch_id"])
-        data = h.fetchone_dict()
-        if not data:
-            raise rhnException("Found server with invalid numeric "
-                               "architecture reference",
-                               self.server.data)
-        self.archname = data['label']
+        self.entitlements = None
+        archid = self.server["server_arch_id"]
+        if archid not in _server_arch_labels:
+            # it is lame that we have to do this
+            h = rhnSQL.prepare("""
+            select label from rhnServerArch where id = :archid
+            """)
+            h.execute(archid=archid)
+            data = h.fetchone_dict()
+            if not data:
+                raise rhnException("Found server with invalid numeric "
+                                   "architecture reference",
+                                   self.server.data)
+            _server_arch_labels[archid] = data['label']
+        self.archname = _server_arch_labels[archid]
         # we don't know this one anymore (well, we could look for, but
         # why would we do that?)
         self.user = None
@@ -670,7 +682,9 @@ class Server(ServerWrapper):
             return None
         log_debug(3, self.server["id"])
 
-        return server_lib.check_entitlement(self.server['id'])
+        if self.entitlements is None:
+            self.entitlements = server_lib.check_entitlement(self.server['id'])
+        return self.entitlements
 
     def checkin(self, commit=1):
         """ convenient wrapper for these thing until we clean the code up """
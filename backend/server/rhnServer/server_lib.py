@@ -16,6 +16,7 @@
 #
 
 import os
+import atexit
 import hashlib
 import time
 import string
@@ -194,10 +195,18 @@ def create_server_setup(server_id, org_id):
     return 1
 
 
+# Checkins not written yet when CFG.CHECKIN_FLUSH_INTERVAL is set:
+# server_id -> [time of the last checkin, number of checkins]
+_pending_checkins = {}
+_last_checkin_flush = time.time()
+
+
 def checkin(server_id, commit=1):
     """ checkin - update the last checkin time
     """
     log_debug(3, server_id)
+    if CFG.CHECKIN_FLUSH_INTERVAL:
+        return _defer_checkin(server_id, commit)
     h = rhnSQL.prepare("""
     update rhnServerInfo
     set checkin = current_timestamp, checkin_counter = checkin_counter + 1
@@ -209,6 +218,89 @@ def checkin(server_id, commit=1):
     return 1
 
 
+def _defer_checkin(server_id, _commit):
+    """ records the checkin to be written by flush_due_checkins() at the end
+        of a request, with the others that come in during
+        CFG.CHECKIN_FLUSH_INTERVAL
+    """
+    now = time.time()
+    # the flush sorts them numerically
+    server_id = int(server_id)
+    pending = _pending_checkins.get(server_id)
+    if pending is None:
+        _pending_checkins[server_id] = [now, 1]
+    else:
+        pending[0] = now
+        pending[1] += 1
+    return 1
+
+
+_query_flush_checkins = rhnSQL.Statement("""
+    update rhnServerInfo
+       set checkin = current_timestamp - numtodsinterval(:age, 'second'),
+           checkin_counter = checkin_counter + :count
+     where server_id = :server_id
+""")
+
+
+def flush_checkins(commit=1):
+    """ writes the checkins recorded by _defer_checkin() in one statement """
+    global _last_checkin_flush
+    now = time.time()
+    _last_checkin_flush = now
+    if not _pending_checkins:
+        return
+    server_ids = []
+    ages = []
+    counts = []
+    # rows locked in the same order by every process, so that concurrent
+    # flushes can't deadlock
+    for server_id in sorted(_pending_checkins.keys()):
+        checkin_time, count = _pending_checkins[server_id]
+        server_ids.append(server_id)
+        ages.append(int(now - checkin_time))
+        counts.append(count)
+    log_debug(3, "Writing %d checkins" % len(server_ids))
+    h = rhnSQL.prepare(_query_flush_checkins)
+    h.executemany(server_id=server_ids, age=ages, count=counts)
+    if commit:
+        rhnSQL.commit()
+    # kept for the next attempt if anything above failed
+    _pending_checkins.clear()
+
+
+def flush_due_checkins():
+    """ called at the end of every request: writes the recorded checkins once
+        CFG.CHECKIN_FLUSH_INTERVAL has passed since the last flush
+    """
+    if not _pending_checkins or \
+            time.time() - _last_checkin_flush < CFG.CHECKIN_FLUSH_INTERVAL:
+        return
+    count = len(_pending_checkins)
+    try:
+        flush_checkins()
+    except Exception:
+        e = sys.exc_info()[1]
+        log_error("Unable to write %d checkins" % count, e)
+        try:
+            rhnSQL.rollback()
+        except Exception:
+            pass
+
+
+def _flush_checkins_at_exit():
+    count = len(_pending_checkins)
+    if not count:
+        return
+    try:
+        flush_checkins()
+    except Exception:
+        e = sys.exc_info()[1]
+        log_error("Unable to write %d checkins" % count, e)
+
+atexit.register(_flush_checkins_at_exit)
+
+
 def set_qos(server_id):
     pass
 
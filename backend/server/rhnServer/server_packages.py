@@ -17,13 +17,15 @@
 # profiles.
 #
 
+import hashlib
 import string
 import sys
 import time
 from spacewalk.common.usix import DictType
 
 from spacewalk.common.usix import raise_with_tb
-from spacewalk.common import rhn_rpm
+from rhn.i18n import bstr
+from spacewalk.common import rhn_evr, rhn_rpm
 from spacewalk.common.rhnLog import log_debug
 from spacewalk.common.rhnException import rhnFault
 from spacewalk.server import rhnSQL
@@ -247,6 +249,16 @@ class Packages:
             commits = commits + len(alist)
             del alist
 
+        # the digest clients compare their profile with before uploading it
+        h = rhnSQL.prepare("""
+        update rhnServerInfo
+           set package_digest = :digest
+         where server_id = :sysid
+        """)
+        h.execute(sysid=sysid, digest=profile_digest(
+            [a.nvrea + (a.installtime,) for a in list(self.__p.values())
+             if a.status != DELETED]))
+
         if schedule:
             # queue this server for an errata update
             update_errata_cache(sysid)
@@ -266,6 +278,19 @@ class Packages:
           from rhnPackageArch
     """)
 
+    def get_packages_digest(self, sysid):
+        """ the digest of the saved package profile, None if unknown """
+        h = rhnSQL.prepare("""
+        select package_digest
+          from rhnServerInfo
+         where server_id = :sysid
+        """)
+        h.execute(sysid=sysid)
+        row = h.fetchone_dict()
+        if not row:
+            return None
+        return row['package_digest']
+
     def get_package_arches(self):
         # None gets automatically converted to empty string
         package_arches_hash = {None: ''}
@@ -412,6 +437,28 @@ def processPackageKeyAssociations(header, checksum_type, checksum):
             provider_sql.execute(key_id=keyid[0]['id'], package_id=pkg_id['id'])
 
 
+def profile_digest(packages):
+    """ Computes the digest of a package profile, a list of
+        (n, v, r, e, a, installtime) tuples. Clients compute the very same
+        digest from the rpmdb (up2date_client.rhnPackageInfo), so keep both
+        in sync.
+    """
+    lines = []
+    for n, v, r, e, a, installtime in packages:
+        if e is None:
+            e = ''
+        if installtime:
+            installtime = int(installtime)
+        else:
+            installtime = ''
+        lines.append("%s %s %s %s %s %s\n" % (n, e, v, r, a or '', installtime))
+    lines.sort()
+    digest = hashlib.sha256()
+    for line in lines:
+        digest.update(bstr(line))
+    return digest.hexdigest()
+
+
 def package_delta(list1, list2):
     """ Compares list1 and list2 (each list is a tuple (n, v, r, e)
         returns two lists
@@ -459,32 +506,15 @@ def _package_list_to_hash(package_list, package_registry):
         for instance, version 51 and 0051 are indentical, but that would break the
         list comparison in Python. package_registry is storing representatives for
         each equivalence class (where the equivalence relationship is rpm's version
-        comparison algorigthm
+        comparison algorigthm), keyed by name and rhn_evr.nvre_key()
         Side effect: Modifies second argument!
     """
     hash = {}
     for e in package_list:
         e = tuple(e)
-        pn = e[0]
-        if pn not in package_registry:
-            # Definitely new equivalence class
-            _add_to_hash(package_registry, pn, e)
-            _add_to_hash(hash, pn, e)
-            continue
-
-        # Look for a match for this package name in the registry
-        plist = list(package_registry[pn].keys())
-        for p in plist:
-            if rhn_rpm.nvre_compare(p, e) == 0:
-                # Packages are identical
-                e = p
-                break
-        else:
-            # Package not found in the global registry - add it
-            _add_to_hash(package_registry, pn, e)
-
-        # Add it to the hash too
-        _add_to_hash(hash, pn, e)
+        # Identical packages share the representative seen first
+        e = package_registry.setdefault((e[0], rhn_evr.nvre_key(e)), e)
+        _add_to_hash(hash, e[0], e)
 
     return hash
 
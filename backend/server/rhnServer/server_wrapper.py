@@ -75,6 +75,9 @@ class ServerWrapper(Packages, Hardware, History):
         rhnSQL.commit()
         return ret
 
+    def get_packages_digest(self):
+        return Packages.get_packages_digest(self, self.server["id"])
+
     ###
     # HARDWARE
     ###
@@ -61,4 +61,13 @@ print("Remove set:   ", r)
 assert i == [aalib1, kernel3, unzip1, unzip2], "Invalid install set %s" % i
 assert r == [aalib2, abiword1, abiword2, kernel1, kernel2, quota], "Invalid remove set %s" % r
 
+# the digest does not depend on the order of the packages nor on how the
+# installtime was stored
+profile1 = [unzip1 + ('i386', 1500000000), kernel3 + ('i686', 1500000001.0)]
+profile2 = [kernel3 + ('i686', 1500000001), unzip1 + ('i386', 1500000000.0)]
+assert server_packages.profile_digest(profile1) == server_packages.profile_digest(profile2), \
+    "Profile digest depends on order"
+assert server_packages.profile_digest(profile1) != server_packages.profile_digest(profile1[:1]), \
+    "Profile digest does not change"
+
 print("All assertions passed")
@@ -372,7 +372,7 @@ cp $RPM_BUILD_ROOT%{pythonrhnroot}/__init__.py \
     $RPM_BUILD_ROOT%{python3rhnroot}/
 cp $RPM_BUILD_ROOT%{pythonrhnroot}/common/__init__.py \
     $RPM_BUILD_ROOT%{python3rhnroot}/common
-cp $RPM_BUILD_ROOT%{pythonrhnroot}/common/{checksum.py,cli.py,rhn_deb.py,rhn_mpm.py,rhn_pkg.py,rhn_rpm.py,stringutils.py,fileutils.py,rhnLib.py} \
+cp $RPM_BUILD_ROOT%{pythonrhnroot}/common/{checksum.py,cli.py,rhn_deb.py,rhn_evr.py,rhn_mpm.py,rhn_pkg.py,rhn_rpm.py,stringutils.py,fileutils.py,rhnLib.py} \
     $RPM_BUILD_ROOT%{python3rhnroot}/common
 %endif
 export PYTHON_MODULE_NAME=%{name}
@@ -640,6 +640,7 @@ rm -f %{rhnconf}/rhnSecret.py*
 %{pythonrhnroot}/common/cli.py*
 %{pythonrhnroot}/common/fileutils.py*
 %{pythonrhnroot}/common/rhn_deb.py*
+%{pythonrhnroot}/common/rhn_evr.py*
 %{pythonrhnroot}/common/rhn_mpm.py*
 %{pythonrhnroot}/common/rhn_pkg.py*
 %{pythonrhnroot}/common/rhn_rpm.py*
@@ -656,6 +657,7 @@ rm -f %{rhnconf}/rhnSecret.py*
 %{python3rhnroot}/common/cli.py
 %{python3rhnroot}/common/fileutils.py
 %{python3rhnroot}/common/rhn_deb.py
+%{python3rhnroot}/common/rhn_evr.py
 %{python3rhnroot}/common/rhn_mpm.py
 %{python3rhnroot}/common/rhn_pkg.py
 %{python3rhnroot}/common/rhn_rpm.py
@@ -2,12 +2,18 @@
 # all the crap that is stored on the rhn side of stuff
 # updating/fetching package lists, channels, etc
 
+import hashlib
+import os
+import pickle
 
+from rhn.i18n import bstr
 from up2date_client import up2dateAuth
 from up2date_client import up2dateLog
 from up2date_client import rhnserver
 from up2date_client import pkgUtils
 
+# the package profile last acknowledged by the server
+pcklProfileFileName = "/var/spool/up2date/packageProfile.pkl"
 
 def logDeltaPackages(pkgs):
     log = up2dateLog.initLog()
@@ -25,8 +31,97 @@ def updatePackageProfile(timeout=None):
     if not s.capabilities.hasCapability('xmlrpc.packages.extended_profile', 2):
         # for older satellites and hosted - convert to old format
         packages = convertPackagesFromHashToList(packages)
+    elif s.capabilities.hasCapability('registration.package_digest'):
+        updatePackageDelta(s, packages)
+        return
     s.registration.update_packages(up2dateAuth.getSystemId(), packages)
 
+def updatePackageDelta(s, packages):
+    """ send only what changed since the profile the server acknowledged,
+        or nothing if the server's profile digest matches ours
+    """
+    log = up2dateLog.initLog()
+    systemId = up2dateAuth.getSystemId()
+    profile = packageProfile(packages)
+    cached = readCachedProfile()
+    if cached is not None:
+        cachedDigest = profileDigest(cached)
+    else:
+        cachedDigest = None
+    serverDigest = s.registration.package_digest(systemId)
+    if serverDigest == profileDigest(profile):
+        log.log_me("Package profile is up to date")
+        if cachedDigest != serverDigest:
+            writeCachedProfile(profile)
+        return
+    if cachedDigest == serverDigest:
+        # same name, version, etc. but a new installtime is an update
+        # of the package, not a removal
+        delta = {
+            'added': [p for k, p in profile.items() if cached.get(k) != p],
+            'deleted': [p for k, p in cached.items() if k not in profile],
+        }
+        log.log_me("Adding %d and removing %d packages of package profile" %
+                   (len(delta['added']), len(delta['deleted'])))
+        s.registration.delta_packages(systemId, delta)
+    else:
+        s.registration.update_packages(systemId, packages)
+    writeCachedProfile(profile)
+
+def packageProfile(packages):
+    """ hash of the packages by (name, version, release, epoch, arch) """
+    profile = {}
+    for p in packages:
+        profile[(p['name'], p['version'], p['release'], p['epoch'],
+                 p.get('arch'))] = p
+    return profile
+
+def profileDigest(profile):
+    """ digest of a package profile, the same the server computes in
+        server_packages.profile_digest()
+    """
+    lines = []
+    for p in profile.values():
+        installtime = p.get('installtime')
+        if installtime:
+            installtime = int(installtime)
+        else:
+            installtime = ''
+        lines.append("%s %s %s %s %s %s\n" % (p['name'], p['epoch'] or '',
+                     p['version'], p['release'], p.get('arch') or '', installtime))
+    lines.sort()
+    digest = hashlib.sha256()
+    for line in lines:
+        digest.update(bstr(line))
+    return digest.hexdigest()
+
+def readCachedProfile():
+    if not os.access(pcklProfileFileName, os.R_OK):
+        return None
+    try:
+        f = open(pcklProfileFileName, 'rb')
+        try:
+            return packageProfile(pickle.load(f))
+        finally:
+            f.close()
+    except Exception:
+        log = up2dateLog.initLog()
+        log.log_debug("Unable to read cached package profile at: %s" % pcklProfileFileName)
+        return None
+
+def writeCachedProfile(profile):
+    pcklDir = os.path.dirname(pcklProfileFileName)
+    try:
+        if not os.access(pcklDir, os.W_OK):
+            os.mkdir(pcklDir)
+            os.chmod(pcklDir, int('0700', 8))
+        f = open(pcklProfileFileName, 'wb')
+        pickle.dump(list(profile.values()), f)
+        f.close()
+    except (IOError, OSError):
+        log = up2dateLog.initLog()
+        log.log_me("Unable to write cached package profile to %s" % pcklDir)
+
 def pprint_pkglist(pkglist):
     if type(pkglist) == type([]):
         output = ["%s-%s-%s" % (a[0],a[1],a[2]) for a in pkglist]
@@ -127,6 +127,9 @@ class Server:
         username: username for authenticated HTTP proxy
         password: password for authenticated HTTP proxy
 
+    The connection to the server is kept open between calls; see
+    set_keepalive() and close().
+
     All 8-bit strings passed to the server proxy are assumed to use
     the given encoding.
     """
@@ -168,6 +171,9 @@ class Server:
         self._username = username
         self._password = password
         self._timeout = timeout
+        self._keepalive = 1
+        # cleared when the server turns system.multicall down
+        self._multicall = 1
 
         if len(__version__.split()) > 1:
             self.rpc_version = __version__.split()[1]
@@ -442,9 +448,11 @@ class Server:
 
             # Create a new transport for the redirected service and
             # set up the parameters on the new transport
+            self._transport.close()
             del self._transport
             self._transport = self.default_transport(typ, self._proxy,
                     self._username, self._password, self._timeout)
+            self.set_keepalive(self._keepalive)
             self.set_progress_callback(self._progressCallback)
             self.set_refresh_callback(self._refreshCallback)
             self.set_buffer_size(self._bufferSize)
@@ -533,6 +541,12 @@ class Server:
         if self._transport and hasattr(self._transport, "add_trusted_cert"):
             self._transport.add_trusted_cert(certfile)
 
+    # Keep the connection to the server open between calls (the default)
+    def set_keepalive(self, keepalive):
+        self._keepalive = keepalive
+        if self._transport and hasattr(self._transport, "set_keepalive"):
+            self._transport.set_keepalive(keepalive)
+
     def close(self):
         if self._transport:
             self._transport.close()
@@ -699,6 +713,68 @@ class SlicingMethod(_Method):
         return result
 
 
+class MultiCall:
+    """ Collects calls to an XML-RPC server and sends them together in a
+        single system.multicall request:
+
+            multicall = rpclib.MultiCall(server)
+            for label in labels:
+                multicall.channel.software.listAllPackages(session, label)
+            for packages in multicall():
+                ...
+
+        The results come back in the order of the calls; a call that failed
+        raises its xmlrpclib.Fault when its result is reached. Calls to
+        servers without system.multicall are sent one by one.
+    """
+    def __init__(self, server):
+        self._server = server
+        self._calls = []
+    def __getattr__(self, name):
+        return _Method(self._add_call, name)
+    def _add_call(self, methodname, params):
+        self._calls.append((methodname, params))
+    def __call__(self):
+        calls = self._calls
+        self._calls = []
+        if calls and self._server._multicall:
+            batch = [{'methodName': name, 'params': list(params)}
+                     for name, params in calls]
+            try:
+                results = self._server._request('system.multicall', (batch,))
+            except xmlrpclib.Fault:
+                # not supported by this server; don't ask again
+                self._server._multicall = 0
+            else:
+                return MultiCallResults(results)
+        return MultiCallResults(self._call_each(calls))
+    def _call_each(self, calls):
+        results = []
+        for name, params in calls:
+            try:
+                results.append([self._server._request(name, params)])
+            except xmlrpclib.Fault:
+                e = sys.exc_info()[1]
+                results.append({'faultCode': e.faultCode,
+                                'faultString': e.faultString})
+        return results
+
+
+class MultiCallResults:
+    """ The results of a MultiCall, by index or in a for loop """
+    def __init__(self, results):
+        self._results = results
+    def __len__(self):
+        return len(self._results)
+    def __getitem__(self, i):
+        result = self._results[i]
+        if isinstance(result, dict):
+            raise xmlrpclib.Fault(result['faultCode'], result['faultString'])
+        if not isinstance(result, (list, tuple)) or len(result) != 1:
+            raise ValueError("unexpected type in multicall result")
+        return result[0]
+
+
 def reportError(headers):
     """ Reports the error from the headers. """
     errcode = 0
@@ -12,7 +12,10 @@
 # Transport objects
 import os
 import sys
+import errno
 import time
+import select
+import socket
 from rhn import connections
 from rhn.i18n import sstr, bstr
 from rhn.SmartIO import SmartIO
@@ -20,9 +23,11 @@ from rhn.UserDictCase import UserDictCase
 
 try: # python2
     import xmlrpclib
+    from httplib import BadStatusLine
     from types import IntType, StringType, ListType
 except ImportError: # python3
     import xmlrpc.client as xmlrpclib
+    from http.client import BadStatusLine
     IntType = int
     StringType = bytes
     ListType = list
@@ -46,7 +51,10 @@ class Transport(xmlrpclib.Transport):
         self.set_transport_flags(transfer=transfer, encoding=encoding)
         self._headers = UserDictCase()
         self.verbose = 0
+        # connection kept open for the next request, and its host
         self.connection = None
+        self._connection_host = None
+        self._keepalive = 1
         self.method = "POST"
         self._lang = None
         self.refreshCallback = refreshCallback
@@ -137,20 +145,90 @@ class Transport(xmlrpclib.Transport):
         else:
             return connections.HTTPConnection(host)
 
+    # keep the connection to the server open between requests
+    def set_keepalive(self, keepalive):
+        self._keepalive = keepalive
+        if not keepalive:
+            self.close()
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
     def request(self, host, handler, request_body, verbose=0):
         # issue XML-RPC request
         # XXX: automatically compute how to send depending on how much data
         #      you want to send
 
-        # XXX Deal with HTTP/1.1 if necessary
         self.verbose = verbose
 
         # implement BASIC HTTP AUTHENTICATION
         host, extra_headers, x509 = self.get_host_info(host)
         if not extra_headers:
             extra_headers = []
-        # Establish the connection
-        connection = self.get_connection(host)
+        # Reuse the connection of the previous request if there is one
+        connection = self._get_kept_connection(host)
+        if connection is not None:
+            try:
+                headers, fd = self._send_request(connection, host, handler,
+                    request_body, extra_headers)
+            except (socket.error, BadStatusLine):
+                # The server closed it meanwhile; try again on a new one.
+                # Anything else (a timeout in particular) may have reached
+                # the server, the request is not sent twice then.
+                connection.close()
+                if not _connection_dropped(sys.exc_info()[1]):
+                    raise
+                connection = None
+        if connection is None:
+            connection = self.get_connection(host)
+            headers, fd = self._send_request(connection, host, handler,
+                request_body, extra_headers)
+        self._connection_host = host
+
+        if self.verbose:
+            print("Incoming headers:")
+            for header, value in headers.items():
+                print("\t%s : %s" % (header, value))
+
+        if fd.status in (301, 302):
+            self._redirected = headers["Location"]
+            self.response_status = fd.status
+            return None
+
+        # Save the headers
+        self.headers_in = headers
+        self.response_status = fd.status
+        self.response_reason = fd.reason
+
+        return self._process_response(fd, connection)
+
+    def _get_kept_connection(self, host):
+        connection, self.connection = self.connection, None
+        if connection is None:
+            return None
+        if host == self._connection_host and _connection_alive(connection):
+            if self.verbose:
+                print("Reusing the connection to %s" % (host, ))
+            return connection
+        connection.close()
+        return None
+
+    def _keep_connection(self, connection, response):
+        # The connection can be used for the next request only if the
+        # response was read completely
+        complete = response.length == 0
+        response.close()
+        if self._keepalive and complete and connection.sock is not None:
+            if self.connection is not None:
+                self.connection.close()
+            self.connection = connection
+        else:
+            connection.close()
+
+    def _send_request(self, connection, host, handler, request_body,
+            extra_headers):
         # Setting the user agent. Only interesting for SSL tunnels, in any
         # other case the general headers are good enough.
         connection.set_user_agent(self.user_agent)
@@ -174,26 +252,10 @@ class Transport(xmlrpclib.Transport):
         for h in ['Content-Length', 'Host']:
             req.clear_header(h)
 
-        headers, fd = req.send_http(host, handler)
-
-        if self.verbose:
-            print("Incoming headers:")
-            for header, value in headers.items():
-                print("\t%s : %s" % (header, value))
-
-        if fd.status in (301, 302):
-            self._redirected = headers["Location"]
-            self.response_status = fd.status
-            return None
-
-        # Save the headers
-        self.headers_in = headers
-        self.response_status = fd.status
-        self.response_reason = fd.reason
-
-        return self._process_response(fd, connection)
+        return req.send_http(host, handler)
 
     def _process_response(self, fd, connection):
+        response = fd
         # Now use the Input class in case we get an enhanced response
         resp = Input(self.headers_in, progressCallback=self.progressCallback,
                 bufferSize=self.bufferSize)
@@ -206,18 +268,24 @@ class Transport(xmlrpclib.Transport):
             # cleanly reap it
             f = File(fd.fd, fd.length, fd.name, bufferSize=self.bufferSize,
                 progressCallback=self.progressCallback)
-            # Set the File's close method to the connection's
+            # Set the File's close method to release the connection
             # Note that calling the HTTPResponse's close() is not enough,
             # since the main socket would remain open, and this is
             # particularily bad with SSL
-            f.close = connection.close
+            released = []
+            def close():
+                # File calls it again when garbage collected
+                if not released:
+                    released.append(1)
+                    self._keep_connection(connection, response)
+            f.close = close
             return f
 
-        # We can safely close the connection now; if we had an
+        # We can release the connection now; if we had an
         # application/octet/stream (for which Input.read passes the original
         # socket object), Input.decode would return an InputStream,
         # so we wouldn't reach this point
-        connection.close()
+        self._keep_connection(connection, response)
 
         return self.parse_response(fd)
 
@@ -492,6 +560,27 @@ class Input:
 
 # Utility functions
 
+def _connection_alive(connection):
+    """Returns true if the server did not close an idle connection"""
+    if connection.sock is None:
+        return 0
+    try:
+        readable = select.select([connection.sock], [], [], 0)[0]
+    except (select.error, socket.error, ValueError):
+        return 0
+    # Nothing is to be read from an idle connection, unless it got closed
+    return not readable
+
+def _connection_dropped(e):
+    """Returns true if e tells the server closed the connection before
+    answering, so the request can be sent again"""
+    if isinstance(e, BadStatusLine):
+        return 1
+    if isinstance(e, socket.timeout):
+        return 0
+    return getattr(e, 'errno', None) in (errno.ECONNRESET, errno.ECONNABORTED,
+        errno.EPIPE)
+
 def _smart_total_read(fd, bufferSize=1024, max_mem_size=16384):
     """
     Tries to read data from the supplied stream, and puts the results into a
@@ -727,7 +816,9 @@ class BaseOutput:
 
         if self._connection is None:
             raise Exception("No connection object found")
-        self._connection.connect()
+        if self._connection.sock is None:
+            # not kept open from a previous request
+            self._connection.connect()
         # wrap self data into binary object, otherwise HTTPConnection.request
         # will encode it as ISO-8859-1 https://docs.python.org/3/library/http.client.html#httpconnection-objects
         self._connection.request(self.method, handler, body=bstr(self.data), headers=self.headers)
@@ -0,0 +1,137 @@
+/**
+ * Copyright (c) 2016 Red Hat, Inc.
+ *
+ * This software is licensed to you under the GNU General Public License,
+ * version 2 (GPLv2). There is NO WARRANTY for this software, express or
+ * implied, including the implied warranties of MERCHANTABILITY or FITNESS
+ * FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+ * along with this software; if not, see
+ * http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+ *
+ * Red Hat trademarks are not licensed under GPLv2. No permission is
+ * granted to use or replicate Red Hat trademarks that are incorporated
+ * in this software or its documentation.
+ */
+
+package com.redhat.rhn.frontend.xmlrpc;
+
+import com.redhat.rhn.common.hibernate.HibernateFactory;
+
+import org.apache.log4j.Logger;
+
+import java.util.ArrayList;
+import java.util.HashMap;
+import java.util.List;
+import java.util.Map;
+
+import redstone.xmlrpc.XmlRpcFault;
+import redstone.xmlrpc.XmlRpcInvocationHandler;
+
+/**
+ * MultiCallHandler implements system.multicall, which runs a batch of calls
+ * in a single request. The "system" namespace belongs to SystemHandler, so
+ * this handler takes its place and passes every other system.* call on.
+ *
+ * Every call of the batch runs in its own transaction, just as if it came
+ * in a request of its own, and a fault only fails the call raising it.
+ * @version $Rev$
+ */
+public class MultiCallHandler implements XmlRpcInvocationHandler {
+
+    public static final String NAMESPACE = "system";
+    public static final String METHOD = "multicall";
+
+    private static Logger log = Logger.getLogger(MultiCallHandler.class);
+
+    private Map<String, XmlRpcInvocationHandler> handlers;
+    private XmlRpcInvocationHandler systemHandler;
+
+    /**
+     * Constructor
+     * @param handlersIn the handlers of the server by namespace
+     * @param systemHandlerIn the handler of the other system.* calls
+     */
+    public MultiCallHandler(Map<String, XmlRpcInvocationHandler> handlersIn,
+            XmlRpcInvocationHandler systemHandlerIn) {
+        handlers = handlersIn;
+        systemHandler = systemHandlerIn;
+    }
+
+    /**
+     * {@inheritDoc}
+     */
+    public Object invoke(String methodName, List arguments) throws Throwable {
+        if (!METHOD.equals(methodName)) {
+            return systemHandler.invoke(methodName, arguments);
+        }
+        if (arguments.size() != 1 || !(arguments.get(0) instanceof List)) {
+            throw new XmlRpcFault(-1, "system.multicall expects a list of calls");
+        }
+
+        List calls = (List) arguments.get(0);
+        List<Object> results = new ArrayList<Object>(calls.size());
+        for (Object call : calls) {
+            results.add(invokeCall(call));
+        }
+        return results;
+    }
+
+    /**
+     * Runs one call of the batch
+     * @param call struct with the methodName and params of the call
+     * @return the result wrapped in a list, or a fault struct
+     */
+    private Object invokeCall(Object call) {
+        try {
+            if (!(call instanceof Map)) {
+                throw new XmlRpcFault(-1, "system.multicall expects a list of structs");
+            }
+            Map callMap = (Map) call;
+            Object name = callMap.get("methodName");
+            Object params = callMap.get("params");
+            if (!(name instanceof String) || !(params instanceof List)) {
+                throw new XmlRpcFault(-1, "system.multicall expects methodName " +
+                        "and params in every call");
+            }
+
+            String methodCalled = (String) name;
+            int separator = methodCalled.lastIndexOf('.');
+            if (separator == -1 ||
+                    (NAMESPACE + "." + METHOD).equals(methodCalled)) {
+                throw new XmlRpcFault(-1, "Unable to call " + methodCalled +
+                        " from system.multicall");
+            }
+            XmlRpcInvocationHandler handler =
+                handlers.get(methodCalled.substring(0, separator));
+            if (handler == null) {
+                throw new XmlRpcFault(-1, "No such handler: " + methodCalled);
+            }
+
+            List<Object> result = new ArrayList<Object>(1);
+            result.add(handler.invoke(methodCalled.substring(separator + 1),
+                    new ArrayList((List) params)));
+            HibernateFactory.commitTransaction();
+            return result;
+        }
+        catch (XmlRpcFault e) {
+            return fault(e.getErrorCode(), e.getMessage());
+        }
+        catch (Throwable t) {
+            log.error("Error in system.multicall: ", t);
+            HibernateFactory.rollbackTransaction();
+            return fault(-1, "unhandled internal exception: " +
+                    t.getLocalizedMessage());
+        }
+        finally {
+            // the next call of the batch starts with a new transaction
+            HibernateFactory.closeSession();
+        }
+    }
+
+    private Map<String, Object> fault(int code, String message) {
+        Map<String, Object> fault = new HashMap<String, Object>();
+        fault.put("faultCode", code);
+        fault.put("faultString", message);
+        return fault;
+    }
+}
@@ -20,7 +20,9 @@ import com.redhat.rhn.frontend.xmlrpc.serializer.SerializerFactory;
 import org.apache.log4j.Logger;
 
 import java.io.IOException;
+import java.util.HashMap;
 import java.util.Iterator;
+import java.util.Map;
 
 import javax.servlet.ServletException;
 import javax.servlet.http.HttpServlet;
@@ -28,6 +30,7 @@ import javax.servlet.http.HttpServletRequest;
 import javax.servlet.http.HttpServletResponse;
 
 import redstone.xmlrpc.XmlRpcCustomSerializer;
+import redstone.xmlrpc.XmlRpcInvocationHandler;
 
 /**
  * A basic servlet class that registers handlers for xmlrpc calls
@@ -104,6 +107,9 @@ public class XmlRpcServlet extends HttpServlet {
             handlers = new HandlerFactory();
         }
 
+        Map<String, XmlRpcInvocationHandler> registered =
+            new HashMap<String, XmlRpcInvocationHandler>();
+
         // find the configured handlers...
         Iterator i = handlers.getKeys().iterator();
         while (i.hasNext()) {
@@ -113,7 +119,13 @@ public class XmlRpcServlet extends HttpServlet {
                 log.debug("registerInvocationHandler: namespace [" + namespace +
                           "] handler [" + handlers.getHandler(namespace) + "]");
             }
-            srvr.addInvocationHandler(namespace, handlers.getHandler(namespace));
+            XmlRpcInvocationHandler handler = handlers.getHandler(namespace);
+            if (MultiCallHandler.NAMESPACE.equals(namespace)) {
+                // system.multicall shares the namespace with SystemHandler
+                handler = new MultiCallHandler(registered, handler);
+            }
+            registered.put(namespace, handler);
+            srvr.addInvocationHandler(namespace, handler);
         }
     }
 
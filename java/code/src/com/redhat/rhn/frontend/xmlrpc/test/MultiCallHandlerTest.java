@@ -0,0 +1,87 @@
+/**
+ * Copyright (c) 2016 Red Hat, Inc.
+ *
+ * This software is licensed to you under the GNU General Public License,
+ * version 2 (GPLv2). There is NO WARRANTY for this software, express or
+ * implied, including the implied warranties of MERCHANTABILITY or FITNESS
+ * FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+ * along with this software; if not, see
+ * http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+ *
+ * Red Hat trademarks are not licensed under GPLv2. No permission is
+ * granted to use or replicate Red Hat trademarks that are incorporated
+ * in this software or its documentation.
+ */
+package com.redhat.rhn.frontend.xmlrpc.test;
+
+import com.redhat.rhn.frontend.xmlrpc.MultiCallHandler;
+import com.redhat.rhn.testing.RhnBaseTestCase;
+
+import java.util.ArrayList;
+import java.util.HashMap;
+import java.util.List;
+import java.util.Map;
+
+import redstone.xmlrpc.XmlRpcInvocationHandler;
+
+public class MultiCallHandlerTest extends RhnBaseTestCase {
+
+    private MultiCallHandler handler;
+
+    public void setUp() throws Exception {
+        super.setUp();
+        Map<String, XmlRpcInvocationHandler> handlers =
+            new HashMap<String, XmlRpcInvocationHandler>();
+        handlers.put("unittest", new UnitTestHandler());
+        handler = new MultiCallHandler(handlers, new UnitTestHandler());
+        handlers.put(MultiCallHandler.NAMESPACE, handler);
+    }
+
+    private Map<String, Object> call(String methodName, Object... params) {
+        Map<String, Object> call = new HashMap<String, Object>();
+        call.put("methodName", methodName);
+        List<Object> paramList = new ArrayList<Object>();
+        for (Object param : params) {
+            paramList.add(param);
+        }
+        call.put("params", paramList);
+        return call;
+    }
+
+    private List multicall(Object... calls) throws Throwable {
+        List<Object> callList = new ArrayList<Object>();
+        for (Object call : calls) {
+            callList.add(call);
+        }
+        List<Object> arguments = new ArrayList<Object>();
+        arguments.add(callList);
+        return (List) handler.invoke(MultiCallHandler.METHOD, arguments);
+    }
+
+    public void testMultiCall() throws Throwable {
+        List results = multicall(call("unittest.add", 1, 2),
+                call("unittest.add", 3, 4));
+        assertEquals(2, results.size());
+        assertEquals(new Integer(3), ((List) results.get(0)).get(0));
+        assertEquals(new Integer(7), ((List) results.get(1)).get(0));
+    }
+
+    public void testFaultFailsOnlyItsCall() throws Throwable {
+        List results = multicall(call("unittest.throwFault"),
+                call("unittest.add", 1, 1),
+                call("nohandler.add", 1, 1),
+                call("system.multicall", new ArrayList()));
+        assertEquals(4, results.size());
+        assertEquals(1, ((Map) results.get(0)).get("faultCode"));
+        assertEquals(new Integer(2), ((List) results.get(1)).get(0));
+        assertEquals(-1, ((Map) results.get(2)).get("faultCode"));
+        assertEquals(-1, ((Map) results.get(3)).get("faultCode"));
+    }
+
+    public void testOtherMethodsArePassedOn() throws Throwable {
+        List<Object> arguments = new ArrayList<Object>();
+        arguments.add(5);
+        arguments.add(6);
+        assertEquals(new Integer(11), handler.invoke("add", arguments));
+    }
+}
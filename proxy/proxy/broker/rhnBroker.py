@@ -33,6 +33,7 @@ from spacewalk.common.rhnTranslate import _
 from proxy.rhnShared import SharedHandler
 from proxy.rhnConstants import URI_PREFIX_KS_CHECKSUM
 import rhnRepository
+import rhnPackageCache
 import proxy.rhnProxyAuth
 
 
@@ -67,6 +68,8 @@ class BrokerHandler(SharedHandler):
         self.authChannels = None
         self.clientServerId = None
         self.rhnParentXMLRPC = None
+        # package being downloaded from the parent into the package cache
+        self.packageCacheEntry = None
         hostname = ''
         # should *always* exist and be my ip address
         my_ip_addr = req.headers_in['SERVER_ADDR']
@@ -315,6 +318,29 @@ class BrokerHandler(SharedHandler):
         """ prep handler and check PROXY_AUTH's expiration. """
         SharedHandler._prepHandler(self)
 
+    def _forwardHTTPBody(self, fromResponse, toRequest):
+        """ Also writes the body to the package cache if this request is
+            fetching a package into it.
+        """
+        SharedHandler._forwardHTTPBody(self, fromResponse, toRequest)
+        entry, self.packageCacheEntry = self.packageCacheEntry, None
+        if entry is None:
+            return
+        size = -1
+        if fromResponse is not None and fromResponse.status == apache.HTTP_OK:
+            size = self._determineHTTPBodySize(fromResponse.msg)
+        if size <= 0 or toRequest.method != 'GET':
+            entry.abort()
+            return
+        try:
+            entry.start(size)
+        except OSError, e:
+            log_error("Unable to write to the package cache", e)
+            entry.abort()
+            return
+        toRequest.output = rhnPackageCache.CachingIterator(toRequest.output,
+                                                           entry)
+
     @staticmethod
     def _split_ks_url(req):
         """ read kickstart options from incoming url
@@ -431,6 +457,7 @@ class BrokerHandler(SharedHandler):
             return None
 
         # --- LOCAL GET:
+        cacheOnly = 0
         localFlist = CFG.PROXY_LOCAL_FLIST or []
 
         if reqaction not in localFlist:
@@ -452,15 +479,17 @@ class BrokerHandler(SharedHandler):
                     # Local channel
                     break
             else:
-                # Not a local channel
-                return None
+                # Not a local channel; its packages can still be cached
+                if reqaction != 'getPackage' or not rhnPackageCache.enabled():
+                    return None
+                cacheOnly = 1
 
         # We have a match; we'll try to serve packages from the local
         # repository
         log_debug(3, "Retrieve from local repository.")
         log_debug(3, req_type, reqident, reqaction, reqparams)
         result = self.__callLocalRepository(req_type, reqident, reqaction,
-                                            reqparams)
+                                            reqparams, cacheOnly)
         if result is None:
             log_debug(3, "Not available locally; will try higher up the chain.")
         else:
@@ -515,7 +544,8 @@ class BrokerHandler(SharedHandler):
         self.proxyAuth.set_client_token(self.clientServerId, token)
         return token
 
-    def __callLocalRepository(self, req_type, identifier, funct, params):
+    def __callLocalRepository(self, req_type, identifier, funct, params,
+                              cacheOnly=0):
         """ Contacts the local repository and retrieves files"""
 
         log_debug(2, req_type, identifier, funct, params)
@@ -569,7 +599,7 @@ class BrokerHandler(SharedHandler):
                                            httpProxy=self.httpProxy,
                                            httpProxyUsername=self.httpProxyUsername,
                                            httpProxyPassword=self.httpProxyPassword,
-                                           caChain=self.caChain)
+                                           caChain=self.caChain, cacheOnly=cacheOnly)
 
         f = rep.get_function(funct)
         if not f:
@@ -581,12 +611,26 @@ class BrokerHandler(SharedHandler):
             params = ()
         try:
             ret = f(*params)
-        except rhnRepository.NotLocalError:
+        except rhnRepository.NotLocalError, e:
             # The package is not local
+            if funct == 'getPackage' and e.args:
+                return self.__packageCacheMiss(e.args[0])
             return None
 
         return ret
 
+    def __packageCacheMiss(self, filePath):
+        """ Either fetch the package from the parent into the package cache,
+            or serve it while another request is fetching it.
+            Returns None if the request has to go to the parent.
+        """
+        # a byte range of the package can not be cached
+        if not self.req.headers_in.has_key('Range'):
+            self.packageCacheEntry = rhnPackageCache.claim(filePath)
+            if self.packageCacheEntry is not None:
+                return None
+        return rhnPackageCache.follow(filePath)
+
     def __checkAuthSessionTokenCache(self, token, channel):
         """ Authentication / authorize the channel """
 
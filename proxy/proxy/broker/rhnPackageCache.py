@@ -0,0 +1,435 @@
+# rhnPackageCache.py                   - Cache of packages fetched from the parent
+#-------------------------------------------------------------------------------
+# Packages the broker can not serve from the local repository are stored
+# here while they are streamed from the parent to the client. Files are
+# addressed by the checksum path from listAllPackagesChecksum, so a cached
+# package never goes stale. The cache is bounded by CFG.PKG_CACHE_SIZE (MiB,
+# 0 disables it), the least recently used packages are removed first.
+#
+# Only one request downloads a package at a time: it holds an exclusive lock
+# on <package>.lock while it writes <package>.part. Other requests for the
+# same package read the .part file as it grows instead of going upstream.
+# The lock file is removed together with the package when it is evicted.
+#
+# Copyright (c) 2008--2015 Red Hat, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+# Red Hat trademarks are not licensed under GPLv2. No permission is
+# granted to use or replicate Red Hat trademarks that are incorporated
+# in this software or its documentation.
+#
+#-------------------------------------------------------------------------------
+
+## language imports
+import os
+import time
+import fcntl
+import errno
+import hashlib
+
+## common imports
+from spacewalk.common.rhnLog import log_debug, log_error
+from spacewalk.common.rhnConfig import CFG
+
+## local imports
+from rhn import rpclib
+
+
+# checksum type by the length of its hex digest
+CHECKSUM_TYPES = {32: 'md5', 40: 'sha1', 64: 'sha256', 96: 'sha384',
+                  128: 'sha512'}
+# seconds between two walks of the cache looking for packages to remove
+EVICT_INTERVAL = 60
+# seconds to wait between two polls of a package being downloaded
+POLL_INTERVAL = 0.1
+
+_last_evict = 0
+
+
+def enabled():
+    return bool(CFG.PKG_DIR and CFG.PKG_CACHE_SIZE)
+
+
+def lookup(relPath):
+    """ Returns the path of the cached package for relPath (a path from
+        computePackagePaths) or None.
+    """
+    if not enabled() or _checksum(relPath) is None:
+        return None
+    path = _cache_path(relPath)
+    try:
+        st = os.stat(path)
+        # the access time is the clock of the LRU
+        os.utime(path, (time.time(), st.st_mtime))
+    except OSError:
+        return None
+    log_debug(3, "Serving cached package", path)
+    return path
+
+
+def claim(relPath):
+    """ Returns a CacheEntry to fill with the package if it is not cached and
+        nobody else is downloading it, None otherwise.
+    """
+    if not enabled() or _checksum(relPath) is None:
+        return None
+    path = _cache_path(relPath)
+    if os.path.exists(path):
+        return None
+    while 1:
+        try:
+            _makedirs(os.path.dirname(path))
+            lockFd = os.open(path + '.lock', os.O_RDWR | os.O_CREAT,
+                             int('0644', 8))
+        except OSError, e:
+            if e.errno == errno.ENOENT:
+                # the directory was removed by _evict() meanwhile
+                continue
+            log_error("Unable to use the package cache", path, e)
+            return None
+        try:
+            fcntl.flock(lockFd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            # somebody else is downloading it
+            os.close(lockFd)
+            return None
+        if _same_file(lockFd, path + '.lock'):
+            break
+        # removed by _evict() before we got the lock
+        os.close(lockFd)
+    if os.path.exists(path):
+        # cached since we looked
+        os.close(lockFd)
+        return None
+    # the size of an earlier, failed download
+    os.ftruncate(lockFd, 0)
+    return CacheEntry(path, lockFd, _checksum(relPath))
+
+
+def follow(relPath):
+    """ Returns a rpclib.transports.File reading the package while another
+        request is downloading it, or None if there is no such download.
+    """
+    if not enabled() or _checksum(relPath) is None:
+        return None
+    path = _cache_path(relPath)
+    try:
+        lockFd = os.open(path + '.lock', os.O_RDONLY)
+    except OSError:
+        return None
+    # wait for the downloading request to know the size of the package
+    deadline = time.time() + CFG.TIMEOUT
+    while 1:
+        if not _locked(lockFd):
+            os.close(lockFd)
+            # finished already
+            path = lookup(relPath)
+            if path is None:
+                return None
+            return rpclib.transports.File(open(path, "rb"),
+                                          os.path.getsize(path), name=path)
+        size = _pread(lockFd)
+        if size.endswith('\n'):
+            break
+        if time.time() > deadline:
+            os.close(lockFd)
+            return None
+        time.sleep(POLL_INTERVAL)
+    try:
+        fd = os.open(path + '.part', os.O_RDONLY)
+    except OSError:
+        os.close(lockFd)
+        # renamed meanwhile
+        return follow(relPath)
+    log_debug(3, "Following the download of", path)
+    return rpclib.transports.File(GrowingFile(fd, lockFd, int(size)),
+                                  int(size), name=path)
+
+
+class CacheEntry:
+
+    """ A package being written to the cache by the request holding its
+        lock. start() makes it visible to other requests, commit() verifies
+        the checksum and moves it in place, abort() throws it away.
+    """
+
+    def __init__(self, path, lockFd, checksum):
+        self.path = path
+        self.lockFd = lockFd
+        self.checksum = checksum
+        self.digest = hashlib.new(CHECKSUM_TYPES[len(checksum)])
+        self.fd = None
+        self.size = None
+        self.written = 0
+
+    def start(self, size):
+        self.size = size
+        self.fd = os.open(self.path + '.part',
+                          os.O_WRONLY | os.O_CREAT | os.O_TRUNC, int('0644', 8))
+        # followers wait for the size before opening the .part file
+        os.write(self.lockFd, "%d\n" % size)
+
+    def write(self, data):
+        os.write(self.fd, data)
+        self.digest.update(data)
+        self.written += len(data)
+
+    def commit(self):
+        if self.lockFd is None:
+            return
+        if self.fd is None:
+            self.abort()
+            return
+        try:
+            os.close(self.fd)
+            self.fd = None
+            if self.written != self.size or \
+                    self.digest.hexdigest() != self.checksum:
+                log_error("Not caching corrupted download", self.path,
+                          self.written, self.size)
+                os.unlink(self.path + '.part')
+            else:
+                os.rename(self.path + '.part', self.path)
+                log_debug(3, "Cached package", self.path)
+        finally:
+            self._release()
+        _evict()
+
+    def abort(self):
+        if self.lockFd is None:
+            return
+        try:
+            if self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
+                os.unlink(self.path + '.part')
+        finally:
+            self._release()
+
+    def _release(self):
+        os.close(self.lockFd)
+        self.lockFd = None
+
+    def __del__(self):
+        self.abort()
+
+
+class CachingIterator:
+
+    """ Passes the chunks of the response body through to the client while
+        writing them to the CacheEntry. The entry is committed only if the
+        whole body went through.
+    """
+
+    def __init__(self, output, entry):
+        self.output = output
+        self.iterator = iter(output)
+        self.entry = entry
+        self.done = 0
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        try:
+            buf = self.iterator.next()
+        except StopIteration:
+            self.done = 1
+            raise
+        if self.entry is not None:
+            try:
+                self.entry.write(buf)
+            except OSError, e:
+                # the client gets the package anyway
+                log_error("Unable to write to the package cache", e)
+                self.entry.abort()
+                self.entry = None
+        return buf
+
+    def close(self):
+        if hasattr(self.output, 'close'):
+            self.output.close()
+        if self.entry is not None:
+            if self.done:
+                self.entry.commit()
+            else:
+                self.entry.abort()
+            self.entry = None
+
+
+class GrowingFile:
+
+    """ Reads a .part file while the request holding lockFd writes it """
+
+    def __init__(self, fd, lockFd, size):
+        self.fd = fd
+        self.lockFd = lockFd
+        self.size = size
+        self.pos = 0
+
+    def seek(self, pos, mode=0):
+        self.pos = os.lseek(self.fd, pos, mode)
+
+    def tell(self):
+        return self.pos
+
+    def read(self, amt=None):
+        if amt is None:
+            amt = self.size
+        amt = min(amt, self.size - self.pos)
+        lastProgress = time.time()
+        while amt > 0:
+            buf = os.read(self.fd, amt)
+            if buf:
+                self.pos += len(buf)
+                return buf
+            if not _locked(self.lockFd):
+                # the download is over; whatever it wrote is readable now
+                buf = os.read(self.fd, amt)
+                self.pos += len(buf)
+                return buf
+            if time.time() - lastProgress > CFG.TIMEOUT:
+                log_error("Download of a cached package stalled")
+                return ''
+            time.sleep(POLL_INTERVAL)
+        return ''
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            os.close(self.lockFd)
+            self.fd = self.lockFd = None
+
+
+def _checksum(relPath):
+    """ Returns the checksum in a path made from the checksum template of
+        computePackagePaths: rhn/<c[:3]>/name/version-release/arch/<c>/file
+    """
+    parts = relPath.split('/')
+    if len(parts) != 7:
+        return None
+    checksum = parts[5]
+    if len(checksum) not in CHECKSUM_TYPES or parts[1] != checksum[:3]:
+        return None
+    return checksum
+
+
+def _cache_path(relPath):
+    return os.path.join(CFG.PKG_DIR, 'cache', relPath)
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError, e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def _locked(lockFd):
+    """ Is the lock held by a request downloading the package? """
+    try:
+        fcntl.flock(lockFd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+    except IOError:
+        return 1
+    fcntl.flock(lockFd, fcntl.LOCK_UN)
+    return 0
+
+
+def _same_file(fd, path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return 0
+    fst = os.fstat(fd)
+    return (st.st_dev, st.st_ino) == (fst.st_dev, fst.st_ino)
+
+
+def _pread(fd):
+    """ Reads the size written to a lock file by CacheEntry.start() """
+    os.lseek(fd, 0, 0)
+    return os.read(fd, 32)
+
+
+def _evict():
+    """ Removes the least recently used packages above CFG.PKG_CACHE_SIZE """
+    global _last_evict
+    now = time.time()
+    if now - _last_evict < EVICT_INTERVAL:
+        return
+    _last_evict = now
+
+    limit = CFG.PKG_CACHE_SIZE * 1024 * 1024
+    files = []
+    total = 0
+    for root, _dirs, names in os.walk(os.path.join(CFG.PKG_DIR, 'cache')):
+        for name in names:
+            if name.endswith('.lock'):
+                if name[:-5] not in names and name[:-5] + '.part' not in names:
+                    # left by a failed download
+                    _remove(os.path.join(root, name[:-5]))
+                continue
+            if name.endswith('.part'):
+                continue
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_atime, st.st_size, path))
+            total += st.st_size
+    if total <= limit:
+        return
+    files.sort()
+    for _atime, size, path in files:
+        if total <= limit:
+            break
+        if not _remove(path):
+            continue
+        total -= size
+        log_debug(4, "Removed from the package cache", path)
+
+
+def _remove(path):
+    """ Removes a cached package with its lock file, unless it is being
+        downloaded; the lock is held while they are removed so that claim()
+        notices. Empty directories are removed too. Returns true if the
+        package was removed.
+    """
+    lockPath = path + '.lock'
+    try:
+        lockFd = os.open(lockPath, os.O_RDONLY)
+    except OSError:
+        lockFd = None
+    if lockFd is not None:
+        try:
+            fcntl.flock(lockFd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            os.close(lockFd)
+            return 0
+    try:
+        try:
+            os.unlink(path)
+            removed = 1
+        except OSError:
+            removed = 0
+        if lockFd is not None and _same_file(lockFd, lockPath):
+            os.unlink(lockPath)
+    finally:
+        if lockFd is not None:
+            os.close(lockFd)
+    top = os.path.join(CFG.PKG_DIR, 'cache')
+    path = os.path.dirname(path)
+    while path.startswith(top + os.sep):
+        try:
+            os.rmdir(path)
+        except OSError:
+            break
+        path = os.path.dirname(path)
+    return removed
@@ -37,6 +37,7 @@ from spacewalk.common.rhnTranslate import _
 
 ## local imports
 from rhn import rpclib
+import rhnPackageCache
 
 
 PKG_LIST_DIR = os.path.join(CFG.PKG_DIR, 'list')
@@ -55,7 +56,7 @@ class Repository(rhnRepository.Repository):
     def __init__(self,
                  channelName, channelVersion, clientInfo,
                  rhnParent=None, rhnParentXMLRPC=None, httpProxy=None, httpProxyUsername=None,
-                 httpProxyPassword=None, caChain=None):
+                 httpProxyPassword=None, caChain=None, cacheOnly=0):
 
         log_debug(3, channelName)
         rhnRepository.Repository.__init__(self, channelName)
@@ -69,6 +70,8 @@ class Repository(rhnRepository.Repository):
         self.httpProxyUsername = httpProxyUsername
         self.httpProxyPassword = httpProxyPassword
         self.caChain = caChain
+        # only packages from the package cache, channel is not local
+        self.cacheOnly = cacheOnly
 
     def getPackagePath(self, pkgFilename, redirect=0):
         """ OVERLOADS getPackagePath in common/rhnRepository.
@@ -103,10 +106,17 @@ class Repository(rhnRepository.Repository):
         filePaths = mapping[pkgFilename]
         # Can we see a file at any of the possible filepaths?
         for filePath in filePaths:
+            if self.cacheOnly:
+                # packages of other channels are not in the local repository
+                break
             filePath = "%s/%s" % (CFG.PKG_DIR, filePath)
             log_debug(4, "File path", filePath)
             if os.access(filePath, os.R_OK):
                 return filePath
+        # maybe it was fetched from the parent before
+        filePath = rhnPackageCache.lookup(filePaths[0])
+        if filePath:
+            return filePath
         log_debug(4, "Package not found locally: %s" % pkgFilename)
         raise NotLocalError(filePaths[0], pkgFilename)
 
@@ -28,11 +28,14 @@ class ResponseContext:
     """ This class provides a response context for use by the proxy broker
         and redirect components.  This context provides a stackable set of
         response, header, and connection sets which can be used to easily maintain
-        the proxy's response state in the event of redirects. """
+        the proxy's response state in the event of redirects.
+        If a connection pool is given, connections are released to it instead
+        of being closed. """
 
     # Constructors and Destructors ############################################
 
-    def __init__(self):
+    def __init__(self, connectionPool=None):
+        self._connectionPool = connectionPool
         self._contextStack = []
         self.add()
 
@@ -93,9 +96,15 @@ class ResponseContext:
     def _isEmpty(self):
         return len(self._contextStack) <= 0
 
-    @staticmethod
-    def _closeContext(context):
+    def _closeContext(self, context):
         if context:
+            if context[CXT_CONNECTION] and self._connectionPool is not None:
+                # the pool closes the body and decides whether to keep the
+                # connection
+                self._connectionPool.release(context[CXT_CONNECTION],
+                                             context[CXT_RESP_BODYFD])
+                context[CXT_CONNECTION] = context[CXT_RESP_BODYFD] = None
+                return
             if context[CXT_RESP_BODYFD]:
                 context[CXT_RESP_BODYFD].close()
             if context[CXT_CONNECTION]:
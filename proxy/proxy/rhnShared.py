@@ -15,9 +15,15 @@
 #
 
 # language imports
+import errno
 import urllib
+import httplib
+import select
 import socket
 import sys
+import threading
+import time
+import weakref
 from types import ListType, TupleType
 
 # global imports
@@ -61,8 +67,10 @@ class SharedHandler:
             smartFd.write(self.req.headers_in['wsgi.input'].read())
             self.req.headers_in['wsgi.input'] = smartFd
 
-        self.responseContext = ResponseContext()
+        self.responseContext = ResponseContext(PARENT_CONNECTIONS)
         self.uri = None   # ''
+        self._connectionKey = None
+        self._connectionReused = False
 
         # Common settings for both the proxy and the redirect
         # broker and redirect immediately alter these for their own purposes
@@ -109,10 +117,18 @@ class SharedHandler:
     def _connectToParent(self):
         """ Handler part 1
             Should not return an error code -- simply connects.
+            A kept-alive connection to the parent is reused if there is one.
         """
 
         scheme, host, port, self.uri = self._parse_url(self.rhnParent)
-        self.responseContext.setConnection(self._create_connection())
+        self._connectionKey = (scheme, host, port, self.httpProxy,
+                               self.httpProxyUsername, self.caChain)
+        connection = PARENT_CONNECTIONS.get(self._connectionKey)
+        self._connectionReused = connection is not None
+        if connection is None:
+            connection = self._create_connection()
+            PARENT_CONNECTIONS.register(self._connectionKey, connection)
+        self.responseContext.setConnection(connection)
 
         if not self.uri:
             self.uri = '/'
@@ -126,8 +142,15 @@ class SharedHandler:
         log_debug(3, 'HTTP proxy password:', "<password>")
         log_debug(3, 'CA cert:', self.caChain)
 
+        if self._connectionReused:
+            log_debug(3, "Reusing kept-alive connection to parent: %s" % self.rhnParent)
+            return
+        self._openConnection(connection)
+
+    def _openConnection(self, connection):
+        """ Connect a new connection to the parent """
         try:
-            self.responseContext.getConnection().connect()
+            connection.connect()
         except socket.error, e:
             log_error("Error opening connection", self.rhnParent, e)
             Traceback(mail=0)
@@ -145,7 +168,7 @@ class SharedHandler:
                 log_debug(3, "HTTP proxy info: %s" % self.httpProxy)
         else:
             log_debug(3, "HTTP proxy info: not using an HTTP proxy")
-        peer = self.responseContext.getConnection().sock.getpeername()
+        peer = connection.sock.getpeername()
         log_debug(4, "Other connection info: %s:%s%s" %
                   (peer[0], peer[1], self.uri))
 
@@ -202,12 +225,10 @@ class SharedHandler:
         # handler for this server
         # We add path_info to the put (GET, CONNECT, HEAD, PUT, POST) request.
         log_debug(2, self.req.method, self.uri)
-        self.responseContext.getConnection().putrequest(self.req.method,
-                                                        self.uri)
 
         # Send the headers, the body and expect a response
         try:
-            status, headers, bodyFd = self._proxy2server()
+            status, headers, bodyFd = self._sendToParent()
             self.responseContext.setHeaders(headers)
             self.responseContext.setBodyFd(bodyFd)
         except IOError:
@@ -231,6 +252,31 @@ class SharedHandler:
 
         return self._handleServerResponse(status)
 
+    def _sendToParent(self):
+        """ Send the request and return what _proxy2server does. If a reused
+            kept-alive connection turns out to be closed by the parent in the
+            meantime, the request is sent again over a new connection.
+            Other errors (a timeout in particular) may come after the parent
+            got the request, which is then not sent twice.
+        """
+        try:
+            self.responseContext.getConnection().putrequest(self.req.method,
+                                                            self.uri)
+            return self._proxy2server()
+        except (socket.error, httplib.BadStatusLine), e:
+            if not self._connectionReused or not _connection_dropped(e):
+                raise
+            log_debug(2, "Kept-alive connection to parent lost, reconnecting", e)
+
+        self.responseContext.getConnection().close()
+        connection = self._create_connection()
+        PARENT_CONNECTIONS.register(self._connectionKey, connection)
+        self._connectionReused = False
+        self.responseContext.setConnection(connection)
+        self._openConnection(connection)
+        connection.putrequest(self.req.method, self.uri)
+        return self._proxy2server()
+
     def _handleServerResponse(self, status):
         """ This method can be overridden by subclasses who want to handle server
             responses in their own way.  By default, we will wrap all the headers up
@@ -460,7 +506,16 @@ class SharedHandler:
         # Now fill in the bytes if need be.
 
         # read content if there is some or the size is unknown
-        if (size > 0 or size == -1) and (toRequest.method != 'HEAD'):
+        if (size > 0 or size == -1) and (toRequest.method != 'HEAD') and CFG.STREAM_BODY:
+            connection = None
+            if self.responseContext.getBodyFd() is fromResponse:
+                # the body is sent after the handler returns, the iterator
+                # closes the response and connection once it is done
+                connection = self.responseContext.getConnection()
+                self.responseContext.setBodyFd(None)
+                self.responseContext.setConnection(None)
+            toRequest.output = ResponseBodyIterator(fromResponse, size, CFG.BUFFER_SIZE, connection)
+        elif (size > 0 or size == -1) and (toRequest.method != 'HEAD'):
             tfile = SmartIO(max_mem_size=CFG.MAX_MEM_FILE_SIZE)
             buf = fromResponse.read(CFG.BUFFER_SIZE)
             while buf:
@@ -474,3 +529,136 @@ class SharedHandler:
                 toRequest.output = toRequest.headers_in['wsgi.file_wrapper'](tfile, CFG.BUFFER_SIZE)
             else:
                 toRequest.output = iter(lambda: tfile.read(CFG.BUFFER_SIZE), '')
+
+
+class ResponseBodyIterator:
+
+    """ WSGI iterable passing the body of a parent's response to the client
+        chunk by chunk as it arrives, instead of reading all of it first.
+        size is the Content-Length of the body or -1 if unknown.
+    """
+
+    def __init__(self, response, size, buffer_size, connection=None):
+        self.response = response
+        self.remaining = size
+        self.buffer_size = buffer_size
+        self.connection = connection
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self.response is None or self.remaining == 0:
+            self.close()
+            raise StopIteration
+        amt = self.buffer_size
+        if self.remaining > 0:
+            amt = min(amt, self.remaining)
+        try:
+            buf = self.response.read(amt)
+        except IOError:
+            buf = ''
+        if not buf:
+            self.close()
+            raise StopIteration
+        if self.remaining > 0:
+            self.remaining -= len(buf)
+        return buf
+
+    def close(self):
+        """ Called by the WSGI server also when the client goes away """
+        if self.connection is not None:
+            # keeps the connection for the next request if the body was
+            # read completely
+            PARENT_CONNECTIONS.release(self.connection, self.response)
+            self.connection = None
+        elif self.response is not None:
+            self.response.close()
+        self.response = None
+
+
+class ParentConnectionPool:
+
+    """ Per process pool of idle keep-alive connections to the parent, so
+        that requests do not pay for a new TCP and SSL handshake each time.
+        Connections are keyed by everything _create_connection uses.
+        CFG.PARENT_KEEPALIVE_CONNECTIONS limits the idle connections per key
+        (0 disables keep-alive), CFG.PARENT_KEEPALIVE_TIMEOUT is the time in
+        seconds after which an idle connection is dropped.
+    """
+
+    def __init__(self):
+        self._idle = {}
+        # key of every connection handed out, until it is released
+        self._keys = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """ Return a live idle connection for key or None """
+        now = time.time()
+        self._lock.acquire()
+        try:
+            idle = self._idle.get(key, [])
+            while idle:
+                connection, last_used = idle.pop()
+                if now - last_used < CFG.PARENT_KEEPALIVE_TIMEOUT and \
+                        self._is_alive(connection):
+                    self._keys[connection] = key
+                    return connection
+                connection.close()
+        finally:
+            self._lock.release()
+        return None
+
+    def register(self, key, connection):
+        """ Make a new connection returnable to the pool """
+        self._keys[connection] = key
+
+    def release(self, connection, response=None):
+        """ Close response and keep the connection for reuse if response was
+            read completely and the parent did not close the connection,
+            close it otherwise.
+        """
+        key = self._keys.pop(connection, None)
+        reusable = False
+        if response is not None:
+            # httplib closes a response itself once it has been read
+            reusable = response.isclosed() or response.length == 0
+            response.close()
+        if key is not None and reusable and connection.sock is not None:
+            self._lock.acquire()
+            try:
+                idle = self._idle.setdefault(key, [])
+                if len(idle) < CFG.PARENT_KEEPALIVE_CONNECTIONS:
+                    idle.append((connection, time.time()))
+                    return
+            finally:
+                self._lock.release()
+        connection.close()
+
+    @staticmethod
+    def _is_alive(connection):
+        if connection.sock is None:
+            return False
+        try:
+            readable = select.select([connection.sock], [], [], 0)[0]
+        except (select.error, socket.error, ValueError):
+            return False
+        # nothing can be read from an idle connection, unless the parent
+        # closed it
+        return not readable
+
+
+PARENT_CONNECTIONS = ParentConnectionPool()
+
+
+def _connection_dropped(e):
+    """ True if e tells the parent closed the connection before answering,
+        so that the request can be sent again
+    """
+    if isinstance(e, httplib.BadStatusLine):
+        return True
+    if isinstance(e, socket.timeout):
+        return False
+    return getattr(e, 'errno', None) in (errno.ECONNRESET, errno.ECONNABORTED,
+                                         errno.EPIPE)
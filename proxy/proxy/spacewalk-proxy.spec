@@ -295,6 +295,7 @@ fi
 %{destdir}/broker/__init__.py*
 %{destdir}/broker/rhnBroker.py*
 %{destdir}/broker/rhnRepository.py*
+%{destdir}/broker/rhnPackageCache.py*
 %attr(750,%{apache_user},%{apache_group}) %dir %{_var}/spool/rhn-proxy
 %attr(750,%{apache_user},%{apache_group}) %dir %{_var}/spool/rhn-proxy/list
 %attr(770,root,%{apache_group}) %dir %{_var}/log/rhn
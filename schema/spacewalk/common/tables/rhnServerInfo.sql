@@ -22,7 +22,8 @@ CREATE TABLE rhnServerInfo
     checkin          timestamp with local time zone
                          DEFAULT (current_timestamp),
     checkin_counter  NUMBER
-                         DEFAULT (0)
+                         DEFAULT (0),
+    package_digest   VARCHAR2(64)
 )
 ENABLE ROW MOVEMENT
 LOGGING
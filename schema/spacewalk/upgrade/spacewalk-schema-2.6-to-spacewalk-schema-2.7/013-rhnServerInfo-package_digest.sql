@@ -0,0 +1 @@
+ALTER TABLE rhnServerInfo ADD package_digest VARCHAR2(64);
@@ -564,11 +564,13 @@ def generate_package_cache(self, force=False):
     channels = self.client.channel.listSoftwareChannels(self.session)
     channels = [c.get('label') for c in channels]
 
-    for c in channels:
-        try:
-            packages = \
-                self.client.channel.software.listAllPackages(self.session, c)
-        except xmlrpclib.Fault:
+    # fetch the packages of all the channels in one request
+    all_packages = self.multicall(
+        [('channel.software.listAllPackages', (self.session, c))
+         for c in channels])
+
+    for (c, packages) in zip(channels, all_packages):
+        if isinstance(packages, xmlrpclib.Fault):
             logging.debug('No access to %s', c)
             continue
 
@@ -947,6 +949,34 @@ def check_api_version(self, want):
         return float(self.api_version) >= float(want)
 
 
+def multicall(self, calls):
+    """ Sends the (method, args) pairs of calls in a single system.multicall
+        request and returns their results in order. The result of a call
+        that failed is its xmlrpclib.Fault. Servers without system.multicall
+        get the calls one by one.
+    """
+    if calls and self.multicall_supported:
+        batch = xmlrpclib.MultiCall(self.client)
+        for (method, args) in calls:
+            getattr(batch, method)(*args)
+        try:
+            results = batch().results
+        except xmlrpclib.Fault:
+            logging.debug('system.multicall is not supported by the server')
+            self.multicall_supported = False
+        else:
+            return [xmlrpclib.Fault(r['faultCode'], r['faultString'])
+                    if isinstance(r, dict) else r[0] for r in results]
+
+    results = []
+    for (method, args) in calls:
+        try:
+            results.append(getattr(self.client, method)(*args))
+        except xmlrpclib.Fault, e:
+            results.append(e)
+    return results
+
+
 # replace the current line buffer
 def replace_line_buffer(self, msg=None):
     # restore the old buffer if we weren't given a new line
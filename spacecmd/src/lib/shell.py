@@ -81,6 +81,9 @@ class SpacewalkShell(Cmd):
         self.ssm = {}
         self.config = {}
 
+        # cleared when the server turns system.multicall down
+        self.multicall_supported = True
+
         self.postcmd(False, '')
 
         # make the options available everywhere
@@ -1072,14 +1072,18 @@ def do_system_listupgrades(self, args):
     else:
         systems = self.expand_systems(args)
 
-    for system in sorted(systems):
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
+    system_ids = [(system, self.get_system_id(system))
+                  for system in sorted(systems)]
+    system_ids = [(system, system_id) for (system, system_id) in system_ids
+                  if system_id]
 
-        packages = \
-            self.client.system.listLatestUpgradablePackages(self.session,
-                                                            system_id)
+    all_packages = self.multicall(
+        [('system.listLatestUpgradablePackages', (self.session, system_id))
+         for (_system, system_id) in system_ids])
+
+    for ((system, _system_id), packages) in zip(system_ids, all_packages):
+        if isinstance(packages, xmlrpclib.Fault):
+            raise packages
 
         if not len(packages):
             logging.warning('No upgrades available for %s' % system)
@@ -2285,10 +2289,18 @@ def do_system_listbasechannel(self, args):
     else:
         systems = self.expand_systems(args)
 
-    for system in sorted(systems):
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
+    system_ids = [(system, self.get_system_id(system))
+                  for system in sorted(systems)]
+    system_ids = [(system, system_id) for (system, system_id) in system_ids
+                  if system_id]
+
+    channels = self.multicall(
+        [('system.getSubscribedBaseChannel', (self.session, system_id))
+         for (_system, system_id) in system_ids])
+
+    for ((system, _system_id), channel) in zip(system_ids, channels):
+        if isinstance(channel, xmlrpclib.Fault):
+            raise channel
 
         if add_separator:
             print self.SEPARATOR
@@ -2297,10 +2309,6 @@ def do_system_listbasechannel(self, args):
         if len(systems) > 1:
             print 'System: %s' % system
 
-        channel = \
-            self.client.system.getSubscribedBaseChannel(self.session,
-                                                        system_id)
-
         print channel.get('label')
 
 ####################
@@ -2855,10 +2863,19 @@ def do_system_listentitlements(self, args):
     else:
         systems = self.expand_systems(args)
 
-    for system in sorted(systems):
-        system_id = self.get_system_id(system)
-        if not system_id:
-            continue
+    system_ids = [(system, self.get_system_id(system))
+                  for system in sorted(systems)]
+    system_ids = [(system, system_id) for (system, system_id) in system_ids
+                  if system_id]
+
+    all_entitlements = self.multicall(
+        [('system.getEntitlements', (self.session, system_id))
+         for (_system, system_id) in system_ids])
+
+    for ((system, _system_id), entitlements) in zip(system_ids,
+                                                     all_entitlements):
+        if isinstance(entitlements, xmlrpclib.Fault):
+            raise entitlements
 
         if add_separator:
             print self.SEPARATOR
@@ -2867,9 +2884,6 @@ def do_system_listentitlements(self, args):
         if len(systems) > 1:
             print 'System: %s' % system
 
-        entitlements = self.client.system.getEntitlements(self.session,
-                                                          system_id)
-
         print '\n'.join(sorted(entitlements))
 
 ####################